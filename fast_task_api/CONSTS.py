@@ -8,6 +8,11 @@ class FTAPI_DEPLOYMENTS(Enum):
     HOSTED = "hosted"
     SERVERLESS = "serverless"
 
+class FTAPI_EXECUTORS(Enum):
+    THREAD = "thread"
+    PROCESS = "process"
+    ASYNC = "async"  # used automatically for async def task functions
+
 class SERVER_STATUS(Enum):
     INITIALIZING = "initializing"
     BOOTING = "booting"
@@ -1,3 +1,12 @@
 from fast_task_api.fast_task_api import FastTaskAPI
 from fast_task_api.core.job import JobProgress
-from media_toolkit import MediaFile, ImageFile, AudioFile, VideoFile
+
+# media-toolkit is imported on first use of its classes. Services without files start faster.
+_MEDIA_FILE_CLASSES = ("MediaFile", "ImageFile", "AudioFile", "VideoFile")
+
+
+def __getattr__(name: str):
+    if name in _MEDIA_FILE_CLASSES:
+        import media_toolkit
+        return getattr(media_toolkit, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
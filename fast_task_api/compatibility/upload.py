@@ -4,15 +4,70 @@ UploadDataTypes are used to ensure compatibility between different providers. Fo
 - In runpod the job data always is json. Therefore, any upload data must be base64 encoded.
 We will parse the data and always provide it as a binary object to your function.
 """
+import base64
+import binascii
+import os
+import re
+import shutil
+import sys
 from inspect import Parameter
-from media_toolkit import MediaFile, AudioFile, ImageFile, VideoFile
-from starlette.datastructures import UploadFile as StarletteUploadFile
+from typing import Iterator, Union, TYPE_CHECKING
+
+from fast_task_api.settings import FTAPI_UPLOAD_SPOOL_THRESHOLD
+
+if TYPE_CHECKING:
+    from media_toolkit import MediaFile
+    from starlette.datastructures import UploadFile as StarletteUploadFile
+
+# bytes copied at once when spooling uploads. The base64 chunk size is a multiple of 4 to decode chunk by chunk.
+_CHUNK_SIZE = 4 * 1024 * 1024
+_BASE64_CHUNK_SIZE = 4 * 1024 * 1024
+# media_toolkit, starlette and fastapi are not imported by this module. The upload classes are looked up in the
+# modules imported so far: a value or annotation can't be an instance of a class which was never imported.
+_UPLOAD_CLASSES = (
+    ("media_toolkit", ("MediaFile", "ImageFile", "AudioFile", "VideoFile")),
+    ("starlette.datastructures", ("UploadFile",)),
+    ("fastapi.datastructures", ("UploadFile",)),
+)
+_upload_types = None  # cached for good as soon as all modules of _UPLOAD_CLASSES are imported
+_partial_upload_types = (-1, ())  # (len(sys.modules), upload types) until then
+_file_backed_supported = None  # see _file_backed_media_files_supported
+# media-toolkit versions [from, to) whose file-backed media files are tested with the spooling of uploads.
+# Spooling writes into the temporary file of their content buffer, which is not part of the public API.
+_FILE_BACKED_MEDIA_TOOLKIT_VERSIONS = ((0, 2, 23), (0, 3, 0))
 
 
 def _print_import_warning(class_name: str, lib_names: list):
     print(f"Necessary libraries: {', '.join(lib_names)} are not installed. "
           f"Please install them before using the {class_name} class.")
 
+def _imported_upload_types() -> tuple:
+    global _upload_types, _partial_upload_types
+    if _upload_types is not None:
+        return _upload_types
+    # only looked up again after further modules were imported
+    if _partial_upload_types[0] == len(sys.modules):
+        return _partial_upload_types[1]
+    upload_types = []
+    complete = True
+    for module_name, class_names in _UPLOAD_CLASSES:
+        module = sys.modules.get(module_name, None)
+        classes = [getattr(module, class_name, None) for class_name in class_names]
+        # modules which are still being imported may miss their classes
+        complete = complete and None not in classes
+        upload_types += [cls for cls in classes if cls is not None and cls not in upload_types]
+    if complete:
+        _upload_types = tuple(upload_types)
+        return _upload_types
+    _partial_upload_types = (len(sys.modules), tuple(upload_types))
+    return _partial_upload_types[1]
+
+
+def _is_starlette_upload_file(value) -> bool:
+    upload_file_type = getattr(sys.modules.get("starlette.datastructures", None), "UploadFile", None)
+    return upload_file_type is not None and isinstance(value, upload_file_type)
+
+
 def is_param_media_toolkit_file(param: Parameter):
     """
     Check if a parameter is a file upload.
@@ -20,18 +75,11 @@ def is_param_media_toolkit_file(param: Parameter):
     if param is None:
         return False
 
-    from fastapi import UploadFile as fastapiUploadFile
-    type_check_list = [
-        MediaFile, ImageFile, AudioFile, VideoFile,
-        StarletteUploadFile, fastapiUploadFile
-    ]
+    # values (results, arguments) are checked for every job. The fastapi UploadFile is a starlette UploadFile.
+    upload_types = _imported_upload_types()
     if not hasattr(param, 'annotation'):
-        if not any(isinstance(param, t) for t in type_check_list):
-            return False
-        else:
-            return True
-
-    return type(param.annotation) in type_check_list or param.annotation in type_check_list
+        return isinstance(param, upload_types)
+    return type(param.annotation) in upload_types or param.annotation in upload_types
 
 
 def convert_param_type_to_fast_api_upload_file(param: Parameter):
@@ -40,3 +88,187 @@ def convert_param_type_to_fast_api_upload_file(param: Parameter):
     """
     from fastapi import UploadFile as fastapiUploadFile
     return param.replace(annotation=fastapiUploadFile)
+
+
+def _media_toolkit_version() -> tuple:
+    # imported on first use. importlib.metadata noticeably slows down the import of fast_task_api.
+    import importlib.metadata
+    try:
+        version = importlib.metadata.version("media-toolkit")
+    except importlib.metadata.PackageNotFoundError:
+        return ()
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+
+def _file_backed_media_files_supported() -> bool:
+    """
+    Spooling uploads into temporary files relies on internals of media-toolkit: media files with a temporary file
+    content buffer and the content detection from a buffer. It is only used with the tested versions in
+    _FILE_BACKED_MEDIA_TOOLKIT_VERSIONS. Other versions read uploads into memory.
+    """
+    global _file_backed_supported
+    if _file_backed_supported is None:
+        tested_from, tested_to = _FILE_BACKED_MEDIA_TOOLKIT_VERSIONS
+        try:
+            from media_toolkit import MediaFile
+            from media_toolkit.core.content_detectors import ContentDetector
+            _file_backed_supported = (
+                tested_from <= _media_toolkit_version() < tested_to
+                and hasattr(ContentDetector, "detect_from_buffer")
+                and _content_temp_file(MediaFile(use_temp_file=True)) is not None
+            )
+        except (ImportError, TypeError, AttributeError):
+            _file_backed_supported = False
+    return _file_backed_supported
+
+
+def _content_temp_file(media_file):
+    """
+    The temporary file of a file-backed media file or None. The only access to the internals of media-toolkit.
+    """
+    return getattr(getattr(media_file, "_content_buffer", None), "_temp_file", None)
+
+
+def _file_backed_media_file(
+        media_file_type,
+        content_type: Union[str, None],
+        file_name: Union[str, None],
+        head: bytes
+) -> "MediaFile":
+    """
+    Create an empty media file which stores its content in a temporary file.
+    Like media_from_any, the class is the annotated one or, without annotation, the detected one.
+    Only the head of the content is inspected to detect the type. Type specific metadata (image size, video info)
+    is left to the media file, which reads it from the file when needed.
+    """
+    from media_toolkit import MediaFile, AudioFile, ImageFile, VideoFile
+    from media_toolkit.core.content_detectors import ContentDetector
+
+    is_media_file_type = isinstance(media_file_type, type) and issubclass(media_file_type, MediaFile)
+    media_class = None
+    if content_type is None or not is_media_file_type:
+        detection = ContentDetector.detect_from_buffer(head, file_name=file_name)
+        content_type = content_type or detection.content_type
+        media_class = detection.media_class
+
+    if is_media_file_type:
+        media_file_class = media_file_type
+    else:
+        media_file_class = {"ImageFile": ImageFile, "AudioFile": AudioFile, "VideoFile": VideoFile}.get(
+            media_class, MediaFile
+        )
+
+    media_file = media_file_class(use_temp_file=True)
+    media_file.content_type = content_type or "application/octet-stream"
+    media_file.file_name = file_name or "file"
+    _content_temp_file(media_file).write(head)
+    return media_file
+
+
+def _spool_upload_file(upload_file: "StarletteUploadFile", media_file_type) -> "MediaFile":
+    """
+    Copy the upload chunk by chunk into the temporary file of a media file. The content is never fully in memory.
+    """
+    upload_file.file.seek(0)
+    head = upload_file.file.read(_CHUNK_SIZE)
+    media_file = _file_backed_media_file(media_file_type, upload_file.content_type, upload_file.filename, head)
+    temp_file = _content_temp_file(media_file)
+    shutil.copyfileobj(upload_file.file, temp_file, _CHUNK_SIZE)
+    temp_file.seek(0)
+    return media_file
+
+
+def _decode_base64_to_file(data: str, media_file_type) -> Union["MediaFile", None]:
+    """
+    Decode a (data URI) base64 string chunk by chunk into the temporary file of a media file.
+    :return: None if the string is not strict base64. For example a URL or base64 with line breaks.
+    """
+    start, content_type = 0, None
+    if data.startswith("data:"):
+        comma = data.find(",", 0, 256)
+        if comma == -1 or ";base64" not in data[:comma]:
+            return None
+        content_type = data[5:comma].split(";")[0] or None
+        start = comma + 1
+
+    try:
+        head = base64.b64decode(data[start:start + _BASE64_CHUNK_SIZE], validate=True)
+        media_file = _file_backed_media_file(media_file_type, content_type, None, head)
+        temp_file = _content_temp_file(media_file)
+        for offset in range(start + _BASE64_CHUNK_SIZE, len(data), _BASE64_CHUNK_SIZE):
+            temp_file.write(base64.b64decode(data[offset:offset + _BASE64_CHUNK_SIZE], validate=True))
+    except (binascii.Error, ValueError):
+        return None
+    temp_file.seek(0)
+    return media_file
+
+
+def _upload_size(upload_file: "StarletteUploadFile") -> int:
+    if upload_file.size is not None:
+        return upload_file.size
+    position = upload_file.file.tell()
+    size = upload_file.file.seek(0, os.SEEK_END)
+    upload_file.file.seek(position)
+    return size
+
+
+def media_from_upload(data, media_file_type=None, spool_threshold: int = FTAPI_UPLOAD_SPOOL_THRESHOLD):
+    """
+    Convert an uploaded parameter (upload file, base64 string, URL, bytes) to a media-toolkit file.
+    Uploads and base64 strings of at least spool_threshold bytes are streamed into a temporary file instead of
+    being copied in memory. The task function receives a file-backed media file which reads its content on demand.
+    With media-toolkit versions without file-backed media files, all uploads are read into memory.
+    """
+    if (_is_starlette_upload_file(data) and _upload_size(data) >= spool_threshold
+            and _file_backed_media_files_supported()):
+        return _spool_upload_file(data, media_file_type)
+    if isinstance(data, str) and len(data) >= spool_threshold and _file_backed_media_files_supported():
+        media_file = _decode_base64_to_file(data, media_file_type)
+        if media_file is not None:
+            return media_file
+    from media_toolkit import media_from_any
+    return media_from_any(data, media_file_type)
+
+
+def _temp_file_path(media_file) -> Union[str, None]:
+    temp_file = _content_temp_file(media_file)
+    if temp_file is None:
+        return None
+    temp_file.flush()
+    return temp_file.name
+
+
+def media_file_size(media_file) -> int:
+    """
+    Size of the content in bytes. Unlike MediaFile.file_size, file-backed content isn't read into memory.
+    """
+    path = _temp_file_path(media_file)
+    if path is not None:
+        return os.path.getsize(path)
+    return int(media_file.file_size())
+
+
+def iter_media_file_chunks(
+        media_file, chunk_size: int = _CHUNK_SIZE, start: int = 0, end: int = None
+) -> Iterator[bytes]:
+    """
+    Iterate the content of the media file. File-backed content is read chunk by chunk.
+    :param start: offset of the first byte.
+    :param end: offset after the last byte. None reads to the end of the content.
+    """
+    path = _temp_file_path(media_file)
+    if path is None:
+        content = memoryview(media_file.to_bytes())[start:end]
+        for offset in range(0, len(content), chunk_size):
+            yield bytes(content[offset:offset + chunk_size])
+        return
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = None if end is None else max(end - start, 0)
+        while remaining is None or remaining > 0:
+            chunk = file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
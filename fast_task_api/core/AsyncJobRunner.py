@@ -0,0 +1,33 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Coroutine
+
+
+class AsyncJobRunner:
+    """
+    Runs the jobs of async task functions on a dedicated asyncio event loop in a background thread.
+    Thousands of I/O bound jobs can run concurrently without occupying a worker thread each.
+    """
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="fast_task_api_async_worker", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """
+        Schedule the coroutine on the event loop.
+        :return: a concurrent.futures.Future which is resolved with the result of the coroutine.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
@@ -0,0 +1,67 @@
+import inspect
+import weakref
+from typing import Dict, Tuple
+
+from fast_task_api.compatibility.upload import is_param_media_toolkit_file
+
+
+class CallPlan:
+    """
+    What is needed to call a task function, derived once from its signature when the endpoint is registered.
+    Reused for every job instead of inspecting the function again.
+    - param_names: the names of all parameters in order.
+    - progress_param_names: parameters which receive the JobProgress object of the job.
+    - upload_params: {param_name: media file type} of the parameters which receive uploaded files.
+    - required: parameters without default value, which the request has to provide.
+    - defaults: {param_name: default value}.
+    """
+    def __init__(self, func: callable):
+        self.function_name = func.__name__
+        parameters = inspect.signature(func).parameters.values()
+        self.param_names: Tuple[str, ...] = tuple(p.name for p in parameters)
+        self.progress_param_names: Tuple[str, ...] = tuple(p.name for p in parameters if self._is_progress_param(p))
+        self.upload_params: Dict[str, type] = {
+            p.name: p.annotation for p in parameters if is_param_media_toolkit_file(p)
+        }
+        self.defaults: Dict[str, object] = {
+            p.name: p.default for p in parameters if p.default is not inspect.Parameter.empty
+        }
+        self.required: Tuple[str, ...] = tuple(
+            p.name for p in parameters
+            if p.default is inspect.Parameter.empty and p.name not in self.progress_param_names
+            and p.kind not in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD)
+        )
+
+        self.is_coroutine = inspect.iscoroutinefunction(func)
+        self.is_generator = inspect.isgeneratorfunction(func)
+        self.is_async_generator = inspect.isasyncgenfunction(func)
+
+    @staticmethod
+    def _is_progress_param(param: inspect.Parameter) -> bool:
+        # either the param type is JobProgress (or a subclass) or the name is job_progress
+        annotation_name = getattr(param.annotation, "__name__", str(param.annotation))
+        return param.name == "job_progress" or "JobProgress" in annotation_name
+
+    @property
+    def is_async(self) -> bool:
+        return self.is_coroutine or self.is_async_generator
+
+    def missing_params(self, params: dict) -> list:
+        return [name for name in self.required if name not in params]
+
+
+_call_plans = weakref.WeakKeyDictionary()  # {function: CallPlan}
+
+
+def get_call_plan(func: callable) -> CallPlan:
+    """
+    The call plan of the function. Built on the first call and cached as long as the function exists.
+    """
+    try:
+        call_plan = _call_plans.get(func, None)
+        if call_plan is None:
+            call_plan = _call_plans[func] = CallPlan(func)
+        return call_plan
+    except TypeError:
+        # callables which can't be weakly referenced, like instances of classes with __slots__
+        return CallPlan(func)
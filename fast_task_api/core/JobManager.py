@@ -1,133 +1,1294 @@
+import asyncio
+import functools
 import inspect
+import math
+import os
+import random
+import socket
+import tempfile
 import traceback
-from datetime import datetime
-import time
+import uuid
+from collections import deque, Counter, OrderedDict
+from datetime import datetime, timedelta
 import threading
-from typing import Union
+from itertools import islice
+from typing import Union, Dict, List
 
 from singleton_decorator import singleton
 
-from fast_task_api.core.job.InternalJob import InternalJob, JOB_STATUS
-from fast_task_api.core.job.JobProgress import JobProgress
+from fast_task_api.CONSTS import FTAPI_EXECUTORS
+from fast_task_api.core.AsyncJobRunner import AsyncJobRunner
+from fast_task_api.core.CallPlan import get_call_plan
+from fast_task_api.core.JobProfiler import JobProfiler, parse_profile_modes
+from fast_task_api.core.Metrics import JobMetrics
+from fast_task_api.core.ProcessWorkerPool import ProcessWorkerPool, register_process_function
+from fast_task_api.core.ResultCache import ResultCache, hash_params
+from fast_task_api.core.ResultRetention import ResultRetention
+from fast_task_api.core.WorkerThreadPool import WorkerThreadPool
+from fast_task_api.core.job.ChunkBuffer import ChunkBuffer
+from fast_task_api.core.job.InternalJob import InternalJob, JOB_STATUS, JOB_PRIORITY
+from fast_task_api.core.job_store import JobStore, InMemoryJobStore, SQLiteJobStore
+from fast_task_api.settings import (
+    FTAPI_MAX_WORKERS, FTAPI_MAX_PROCESS_WORKERS, FTAPI_SHARED_MEMORY_THRESHOLD, FTAPI_MAX_ASYNC_JOBS,
+    FTAPI_MAX_STREAM_CHUNKS, FTAPI_PROFILE_SAMPLE_RATE, FTAPI_PROFILE_MODES, FTAPI_MAX_PROFILES,
+    FTAPI_RESULT_TTL, FTAPI_MAX_RESULTS, FTAPI_RESULT_MEMORY_BUDGET, FTAPI_JOB_STORE,
+    FTAPI_WORKERS
+)
+
+
+def _job_store_from_settings(shared: bool = False) -> Union[JobStore, None]:
+    """
+    Create the job store configured with FTAPI_JOB_STORE and FTAPI_WORKERS. None for the default in-memory store.
+    :param shared: create a shared job store even if the settings don't ask for one.
+    """
+    shared = shared or FTAPI_WORKERS > 1 or FTAPI_JOB_STORE.startswith("sqlite-shared:")
+    if FTAPI_JOB_STORE.startswith("sqlite:") or FTAPI_JOB_STORE.startswith("sqlite-shared:"):
+        path = FTAPI_JOB_STORE.split(":", 1)[1]
+        return SQLiteJobStore(path=path, ttl=FTAPI_RESULT_TTL, shared=shared)
+    if not shared:
+        return None
+    # The worker processes are forked from this process and use the same database. It only lives as long as the
+    # jobs in memory would and is deleted when this process exits.
+    path = os.path.join(tempfile.gettempdir(), f"fast_task_api_jobs_{os.getpid()}.db")
+    return SQLiteJobStore(path=path, ttl=FTAPI_RESULT_TTL, shared=shared, delete_on_close=True)
 
 
 @singleton
 class JobQueue:
     def __init__(self):
-        self.queue = []
-        self.in_progress = []  # a list of {"job_id": job.id, "thread": t_job, "job": job}
-        self.results = []
+        # job store: every known job (queued, in progress, finished) indexed by its id for O(1) lookups
+        self.jobs: Dict[str, InternalJob] = {}
+        # jobs waiting for execution. One FIFO deque per priority class and function: {priority: {function_name: deque}}
+        self.queues: Dict[JOB_PRIORITY, Dict[str, deque]] = {priority: OrderedDict() for priority in JOB_PRIORITY}
+        # a dict of {job_id: {"future": future, "job": job, "executor": executor, "finished": bool}}
+        self.in_progress = {}
+        # guards all state transitions of the job store, the queues and the in_progress dict
+        self._lock = threading.RLock()
+        # notified whenever the scheduling state changes (job submitted, job finished).
+        self._state_changed = threading.Condition(self._lock)
+        self._dispatching = False
+        self._dispatch_again = False
+        # while paused, jobs are accepted but stay queued. For example while the server warms up.
+        self.paused = False
         self.worker_thread = threading.Thread(target=self.process_jobs_in_background, daemon=True)
 
+        # bounded pool of worker threads executing the jobs. Jobs stay queued until a worker is free.
+        self.max_workers = FTAPI_MAX_WORKERS
+        self._executor = WorkerThreadPool(max_workers=self.max_workers)
+        # Limits the number of jobs of a specific function that are executed at the same time
+        self.max_concurrency = {}  # a dictionary of {function_name: max_concurrency}
+        self._running_per_function = Counter()
+        self._running_per_executor = Counter()
+        # functions which are executed in worker processes instead of threads
+        self.executors = {}  # a dictionary of {function_name: FTAPI_EXECUTORS}
+        self._process_pool = None
+        # jobs of async task functions run on a dedicated event loop instead of the worker threads
+        self.max_async_jobs = FTAPI_MAX_ASYNC_JOBS
+        self._async_runner = AsyncJobRunner()
+        # seconds after which the jobs of a function time out
+        self.timeouts = {}  # a dictionary of {function_name: timeout}
+        # batch-aware functions are called once for a batch of queued jobs
+        self.batch_sizes = {}  # a dictionary of {function_name: batch_size}
+        self.max_batch_wait = {}  # a dictionary of {function_name: milliseconds a job waits for a full batch}
+        self._next_batch_due = None  # when the oldest job of a not yet full batch waited long enough
+
         # used to store the queue size for each function.
         # Limits the number of jobs that can be created for a specific path / function
         self.queue_sizes = {}  # a dictionary of {path: queue_size}
+        # number of queued jobs per function. Kept in sync with self.queues to avoid scanning the queues on submit.
+        self._queued_per_function = Counter()
+
+        # Priority classes are served strictly in order. Within a class the functions share the workers by their
+        # weight (weighted fair queuing): the function with the lowest virtual time is served next.
+        self.priorities = {}  # a dictionary of {function_name: JOB_PRIORITY}
+        self.weights = {}  # a dictionary of {function_name: weight}
+        self._virtual_time = Counter()  # {function_name: service received / weight}
+        self._virtual_clock = 0.0  # virtual time of the last started job
+        # queue wait times in seconds of the last started jobs per priority class
+        self._queue_wait_times = {priority: deque(maxlen=10000) for priority in JOB_PRIORITY}
+        # job counters and latency histograms per function for the /metrics endpoint. Updated with the lock held.
+        self.metrics = JobMetrics()
+        # fraction of the jobs which are profiled and the profiles of the last profiled jobs
+        self.profile_sample_rate = FTAPI_PROFILE_SAMPLE_RATE
+        self.profile_modes = parse_profile_modes(FTAPI_PROFILE_MODES)
+        self.profiles = OrderedDict()  # {job_id: JobProfiler}
+
+        # removes finished jobs from memory which results were not retrieved
+        self.result_retention = ResultRetention(
+            ttl=FTAPI_RESULT_TTL,
+            max_results=FTAPI_MAX_RESULTS,
+            memory_budget=FTAPI_RESULT_MEMORY_BUDGET
+        )
+
+        # results of functions with a cache are served for equal parameters without executing the function again
+        self.caches = {}  # a dictionary of {function_name: ResultCache}
+        # running jobs of cached functions. Equal requests follow them instead of executing the function again.
+        self._in_flight = {}  # a dictionary of {cache_key: job}
+
+        # persists the jobs to survive restarts. Unfinished jobs of a previous run are resumed as soon as their
+        # function is registered again.
+        self.functions = {}  # a dictionary of {function_name: function}
+        self._resumable = {}  # a dictionary of {function_name: [jobs]}
+        # With a shared job store, jobs are not executed by the process which created them but by the process which
+        # claims them from the store first. The claim thread claims jobs as long as this process has free workers.
+        self.worker_id = None  # identifies this process in the shared job store
+        self.claim_interval = 0.05  # seconds between two polls of the shared job store
+        self._claim_thread = None
+        self._claim_wakeup = threading.Event()
+        self.job_store: JobStore = InMemoryJobStore()
+        job_store = _job_store_from_settings()
+        if job_store is not None:
+            self.set_job_store(job_store)
+
+    def set_job_store(self, job_store: JobStore):
+        """
+        Persist the jobs with the job_store. The unfinished jobs in the store are resumed when their function is
+        registered with register_function.
+        Jobs which were processing when the server stopped are executed again.
+        If the job_store is shared, its queued jobs are claimed instead. Jobs are executed by the first process with
+        a free worker.
+        """
+        with self._lock:
+            self.job_store = job_store
+            if job_store.shared:
+                self._start_claiming()
+                return
+            for job in job_store.load_unfinished():
+                self._resumable.setdefault(job.job_function_name, []).append(job)
+            for job_function in list(self.functions.values()):
+                self._resume_jobs(job_function)
+
+    def share_job_store(self):
+        """
+        Switch to a shared job store, so that multiple processes forked from this one serve the same jobs.
+        Uses the database of FTAPI_JOB_STORE or a temporary database if jobs are only kept in memory.
+        """
+        with self._lock:
+            if self.job_store.shared:
+                return
+            self.job_store.close()
+            self.set_job_store(_job_store_from_settings(shared=True))
+
+    def _start_claiming(self):
+        if self._claim_thread is not None and self._claim_thread.is_alive():
+            return
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._claim_thread = threading.Thread(
+            target=self.claim_jobs_in_background, name="fast_task_api_claim", daemon=True
+        )
+        self._claim_thread.start()
+
+    def reset_after_fork(self):
+        """
+        Recreate the locks, threads and pools in a forked server worker process. Jobs of the parent stay with the
+        parent. The child claims jobs from the shared job store.
+        Called explicitly by the code which forks the server workers, not by an at-fork hook: the processes of the
+        ProcessWorkerPool are forked as well and must not claim jobs.
+        """
+        self.job_store.reset_after_fork()
+        self._lock = threading.RLock()
+        self._state_changed = threading.Condition(self._lock)
+        self._dispatching = False
+        self._dispatch_again = False
+        self.worker_thread = threading.Thread(target=self.process_jobs_in_background, daemon=True)
+        self._executor = WorkerThreadPool(max_workers=self.max_workers)
+        self._process_pool = None
+        self._async_runner = AsyncJobRunner()
+        self.queues = {priority: OrderedDict() for priority in JOB_PRIORITY}
+        self._queued_per_function = Counter()
+        self.in_progress = {}
+        self._running_per_function = Counter()
+        self._running_per_executor = Counter()
+        self._claim_thread = None
+        self._claim_wakeup = threading.Event()
+        if self.job_store.shared:
+            self._start_claiming()
+
+    def claim_jobs_in_background(self):
+        """
+        Claim queued jobs of the registered functions from the shared job store while workers are free.
+        Wakes up every claim_interval seconds and when a local job finished or was submitted.
+        """
+        while self.job_store.shared:
+            self._claim_wakeup.wait(timeout=self.claim_interval)
+            self._claim_wakeup.clear()
+            try:
+                self._claim_jobs()
+            except Exception:
+                print(traceback.format_exc())
+
+    def _claim_jobs(self):
+        with self._lock:
+            job_store = self.job_store
+            # the job store might have been replaced by a not shared one
+            if self.paused or not job_store.shared:
+                return
+            running = sum(self._running_per_executor.values())
+            queued = sum(self._queued_per_function.values())
+            # a batch occupies a single worker
+            limit = max(0, self.max_workers - running - queued) * max(self.batch_sizes.values(), default=1)
+            function_names = list(self.functions)
+
+        jobs = job_store.claim(function_names, limit, self.worker_id)
+        with self._lock:
+            for job in jobs:
+                # the other processes see the progress of the job in the store
+                job.add_listener(functools.partial(job_store.save, job))
+                self._accept_stored_job(job)
+
+    def register_function(self, job_function: callable):
+        """
+        Make the job_function known to the job queue, so that its jobs can be resumed from the job store.
+        """
+        # the call plan is built once and reused for every job of the function
+        get_call_plan(job_function)
+        with self._lock:
+            self.functions[job_function.__name__] = job_function
+            self._resume_jobs(job_function)
+
+    def _resume_jobs(self, job_function: callable):
+        # resumed jobs are queued even if the queue size is exceeded. They were accepted before.
+        for job in self._resumable.pop(job_function.__name__, []):
+            self._accept_stored_job(job)
+
+    def _accept_stored_job(self, job: InternalJob):
+        """
+        Queue a job loaded from the job store for execution in this process. Needs to be called with the lock held.
+        """
+        job.job_function = self.functions[job.job_function_name]
+        self.jobs[job.id] = job
+        if job.job_params is None:
+            # the parameters of the job couldn't be persisted
+            job.status = JOB_STATUS.FAILED
+            job.job_progress.set_status(1.0, "Job can't be resumed. Its parameters were not persisted.")
+            job.execution_finished_at = datetime.utcnow()
+            self._retain_result(job)
+            return
+        if job.job_function_name in self.caches:
+            job.cache_key = hash_params(job.job_function_name, job.job_params)
+        # the timeout of the function is stored as None if its jobs have no deadline
+        job.set_timeout(self.timeouts.get(job.job_function_name, 3600))
+        self._enqueue(job)
 
     def set_queue_size(self, job_function: callable, queue_size: int):
         self.queue_sizes[job_function.__name__] = queue_size
 
+    def set_max_concurrency(self, job_function: callable, max_concurrency: Union[int, None]):
+        """
+        Limit the number of jobs of the job_function that are executed at the same time.
+        :param max_concurrency: if None, the function is only limited by the global number of workers.
+        """
+        if max_concurrency is None:
+            self.max_concurrency.pop(job_function.__name__, None)
+        else:
+            self.max_concurrency[job_function.__name__] = max(1, max_concurrency)
+
+    def set_timeout(self, job_function: callable, timeout: Union[int, None]):
+        """
+        Jobs of the job_function which run longer than timeout seconds are set to TIMEOUT.
+        :param timeout: seconds. If None the jobs never time out.
+        """
+        self.timeouts[job_function.__name__] = timeout
+
+    def set_executor(self, job_function: callable, executor: Union[FTAPI_EXECUTORS, str] = FTAPI_EXECUTORS.THREAD):
+        """
+        Set how the jobs of the job_function are executed.
+        :param executor:
+            thread: in a worker thread of the server process.
+            process: in a worker process. The job is killed when it exceeds its timeout.
+            Async functions and async generators always run on the event loop of the job queue.
+        """
+        executor = FTAPI_EXECUTORS(executor) if type(executor) is str else executor
+        if self._is_async(job_function):
+            if executor == FTAPI_EXECUTORS.PROCESS:
+                raise ValueError(f"{job_function.__name__} is an async function. "
+                                 f"Async functions run on the event loop of the job queue and not in processes.")
+            executor = FTAPI_EXECUTORS.ASYNC
+        self.executors[job_function.__name__] = executor
+        if executor == FTAPI_EXECUTORS.PROCESS:
+            register_process_function(job_function)
+
+    def set_priority(
+            self,
+            job_function: callable,
+            priority: Union[JOB_PRIORITY, str] = JOB_PRIORITY.NORMAL,
+            weight: float = 1
+    ):
+        """
+        Set how the jobs of the job_function are scheduled.
+        :param priority: queued jobs of a higher priority class are started before jobs of a lower class.
+        :param weight: share of the workers relative to other functions of the same priority class.
+            A function with weight 2 gets twice as many jobs started as a function with weight 1 while both have
+            queued jobs.
+        """
+        if weight <= 0:
+            raise ValueError(f"weight of {job_function.__name__} must be positive.")
+        self.priorities[job_function.__name__] = JOB_PRIORITY(priority) if type(priority) is str else priority
+        self.weights[job_function.__name__] = weight
+
+    def set_batching(self, job_function: callable, batch_size: Union[int, None], max_batch_wait_ms: float = 20):
+        """
+        Execute the jobs of the job_function in batches. The function is called once per batch with a list of values
+        for each parameter (one value per job) and has to return a list with one result per job.
+        A returned Exception instance marks only the corresponding job as failed.
+        :param batch_size: maximum number of jobs per call. If None, each job is executed on its own.
+        :param max_batch_wait_ms: how long a queued job waits for further jobs to fill its batch.
+        """
+        call_plan = get_call_plan(job_function)
+        if batch_size is not None and (call_plan.is_generator or call_plan.is_async_generator):
+            raise ValueError(f"{job_function.__name__} is a generator. Generators can't be executed in batches.")
+        if batch_size is None:
+            self.batch_sizes.pop(job_function.__name__, None)
+            self.max_batch_wait.pop(job_function.__name__, None)
+        else:
+            self.batch_sizes[job_function.__name__] = max(1, batch_size)
+            self.max_batch_wait[job_function.__name__] = max(0, max_batch_wait_ms)
+
+    def set_cache(
+            self,
+            job_function: callable,
+            cache: bool,
+            ttl: Union[float, None] = 3600,
+            max_bytes: Union[int, None] = 256 * 1024 ** 2
+    ):
+        """
+        Cache the results of the job_function by its parameters. Uploaded files are compared by their content.
+        A request with cached parameters is finished right away. A request equal to a running job follows that job
+        instead of executing the function again.
+        :param ttl: seconds a result is served from the cache.
+        :param max_bytes: maximum estimated size of the cached results. Least recently used results are evicted first.
+        """
+        call_plan = get_call_plan(job_function)
+        if cache and (call_plan.is_generator or call_plan.is_async_generator):
+            raise ValueError(f"{job_function.__name__} is a generator. The chunks of generators are not cached.")
+        with self._lock:
+            if cache:
+                self.caches[job_function.__name__] = ResultCache(ttl=ttl, max_bytes=max_bytes)
+            else:
+                self.caches.pop(job_function.__name__, None)
+
+    @property
+    def process_pool(self) -> ProcessWorkerPool:
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessWorkerPool(
+                    max_workers=FTAPI_MAX_PROCESS_WORKERS,
+                    shared_memory_threshold=FTAPI_SHARED_MEMORY_THRESHOLD
+                )
+            return self._process_pool
+
     def add_job(
         self,
         job_function: callable,
-        job_params: dict = None
+        job_params: dict = None,
+        priority: Union[JOB_PRIORITY, str] = None,
+        profile: tuple = None
     ):
+        """
+        Create a job and queue it for execution.
+        :param priority: priority class of this job. If None, the priority of the job_function is used.
+        :param profile: profile modes ("cpu", "memory") to profile the execution of this job.
+            If None, the job is profiled with the rate FTAPI_PROFILE_SAMPLE_RATE.
+        """
+        job = self._create_job(job_function, job_params, priority, profile)
+        if self.job_store.shared:
+            return self._submit_to_shared_store([job])[0]
+
+        function_name = job.job_function_name
+        with self._lock:
+            self.metrics.count("submitted", function_name)
+            if job.cache_key is not None and self._serve_from_cache(job):
+                return job
+            self.jobs[job.id] = job
+            # check if queue size is reached
+            if self.queue_sizes.get(function_name, 1) <= self._queued_per_function[function_name]:
+                self._reject(job)
+                return job
+            self._accept(job)
+
+        return job
+
+    def add_jobs(
+        self,
+        job_function: callable,
+        job_params: List[dict],
+        priority: Union[JOB_PRIORITY, str] = None,
+        profile: tuple = None
+    ) -> List[InternalJob]:
+        """
+        Create and queue one job per parameter dict. The queue size is checked for all jobs at once: either all
+        jobs are queued or, if they don't fit into the queue, none of them is created.
+        Jobs answered from the result cache count against the queue size as well.
+        :param priority: priority class of the jobs. If None, the priority of the job_function is used.
+        :param profile: profile modes of the jobs. See add_job.
+        :return: the jobs or an empty list if they don't fit into the queue.
+        """
+        jobs = [self._create_job(job_function, params, priority, profile) for params in job_params]
+        if len(jobs) == 0:
+            return jobs
+        if self.job_store.shared:
+            return self._submit_to_shared_store(jobs, all_or_nothing=True)
+
+        function_name = job_function.__name__
+        with self._lock:
+            self.metrics.count("submitted", function_name, len(jobs))
+            if self._queued_per_function[function_name] + len(jobs) > self.queue_sizes.get(function_name, 1):
+                self.metrics.count("rejected", function_name, len(jobs))
+                return []
+            for job in jobs:
+                if job.cache_key is not None and self._serve_from_cache(job):
+                    continue
+                self.jobs[job.id] = job
+                self._accept(job)
+        return jobs
+
+    def _create_job(
+        self,
+        job_function: callable,
+        job_params: dict,
+        priority: Union[JOB_PRIORITY, str, None],
+        profile: tuple = None
+    ):
+        function_name = job_function.__name__
+        if priority is None:
+            priority = self.priorities.get(function_name, JOB_PRIORITY.NORMAL)
         job = InternalJob(
             job_function=job_function,
-            job_params=job_params
+            job_params=job_params,
+            timeout=self.timeouts.get(function_name, 3600),
+            priority=JOB_PRIORITY(priority) if type(priority) is str else priority
         )
-        # check if queue size is reached
-        if self.queue_sizes.get(job_function.__name__, 1) <= len([j for j in self.queue if j.job_function == job_function]):
+        if function_name in self.caches:
+            job.cache_key = hash_params(function_name, job_params)
+        if profile is not None and not self.can_profile(job_function):
+            raise ValueError(f"Jobs of {function_name} can't be profiled. Only sync task functions executed in "
+                             f"worker threads without batching are profiled.")
+        if (profile is None and self.profile_sample_rate > 0 and random.random() < self.profile_sample_rate
+                and self.can_profile(job_function)):
+            profile = self.profile_modes
+        job.profile = profile
+        return job
+
+    def can_profile(self, job_function: callable) -> bool:
+        """
+        Only sync task functions executed in worker threads without batching are profiled. Async functions share
+        the event loop with other jobs and process and batch jobs are not executed by process_job.
+        """
+        return (self.get_executor(job_function) == FTAPI_EXECUTORS.THREAD
+                and job_function.__name__ not in self.batch_sizes)
+
+    def _accept(self, job: InternalJob):
+        """
+        Queue a new job for execution. Needs to be called with the lock held.
+        """
+        job.queued_at = datetime.utcnow()
+        self._enqueue(job)
+        self.job_store.save(job)
+        if job.cache_key is not None:
+            self._in_flight[job.cache_key] = job
+
+    def _reject(self, job: InternalJob):
+        """
+        Fail a new job because the queue of its function is full. Needs to be called with the lock held.
+        """
+        job.status = JOB_STATUS.FAILED
+        job.result = f"Queue size for function {job.job_function_name} reached."
+        self.metrics.count("rejected", job.job_function_name)
+        self._retain_result(job)
+
+    def _serve_from_cache(self, job: InternalJob) -> bool:
+        """
+        Finish the job with a cached result or let it follow an equal running job. Needs to be called with the lock held.
+        :return: False if the job needs to be executed.
+        """
+        cache = self.caches.get(job.job_function_name, None)
+        if cache is None:
+            return False
+        found, result = cache.get(job.cache_key)
+        leader = self._in_flight.get(job.cache_key, None)
+        if not found and leader is None:
+            cache.misses += 1
+            return False
+
+        # only the job which executes the function puts its result into the cache
+        job.cache_key = None
+        self.jobs[job.id] = job
+        if found:
+            cache.hits += 1
+            job.queued_at = job.execution_started_at = job.execution_finished_at = datetime.utcnow()
+            job.result = result
+            job.status = JOB_STATUS.FINISHED
+            job.job_progress.set_status(1.0, None)
+            self._retain_result(job)
+        else:
+            cache.deduplicated += 1
+            self._follow(job, leader)
+        return True
+
+    def _follow(self, job: InternalJob, leader: InternalJob):
+        """
+        Mirror the status, progress and result of the leader job to the job. Needs to be called with the lock held.
+        """
+        job.queued_at = leader.queued_at
+
+        def mirror():
+            job.execution_started_at = leader.execution_started_at
+            if leader.status in (JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING):
+                job.status = leader.status
+                job.job_progress.set_status(leader.job_progress._progress, leader.job_progress._message)
+                return
+
+            with self._lock:
+                # the leader notifies when it finished and again when its result was retained
+                if job.id in self.result_retention or job.id not in self.jobs:
+                    return
+                leader.remove_listener(mirror)
+                job.result = leader.result
+                job.status = leader.status
+                job.execution_finished_at = leader.execution_finished_at
+                job.job_progress.set_status(1.0, leader.job_progress._message)
+                self._retain_result(job)
+
+        leader.add_listener(mirror)
+        mirror()
+
+    def _submit_to_shared_store(self, jobs: List[InternalJob], all_or_nothing: bool = False) -> List[InternalJob]:
+        """
+        Queue the jobs of one function in the shared job store. The queue size is checked and the jobs are inserted
+        in one transaction, so that concurrent submissions of all processes can't exceed it. The jobs are committed
+        right away, so that every process can claim them and answer requests for them.
+        Jobs which don't fit into the queue are stored as failed jobs.
+        :param all_or_nothing: if the jobs don't fit into the queue, none is stored and an empty list is returned.
+            Jobs answered from the result cache count against the queue size as well.
+        """
+        function_name = jobs[0].job_function_name
+        with self._lock:
+            self.metrics.count("submitted", function_name, len(jobs))
+            # answering from the cache needs no room in the queue of a single job, like in add_job
+            served = {job.id for job in jobs if job.cache_key is not None and self._serve_from_cache(job)}
+        to_queue = [job for job in jobs if job.id not in served]
+        if len(to_queue) == 0:
+            return jobs
+
+        queued_at = datetime.utcnow()
+        for job in to_queue:
+            job.status = JOB_STATUS.QUEUED
+            job.queued_at = queued_at
+        reserved = len(served) if all_or_nothing else 0
+        try:
+            enqueued = self.job_store.enqueue(to_queue, self.queue_sizes.get(function_name, 1), reserved=reserved)
+        except ValueError as e:
+            # the jobs would only be executed by the process which claims them from the store
+            self._fail_unstored_jobs(to_queue, f"Job can't be queued. {e}")
+            return jobs
+        if not enqueued:
+            with self._lock:
+                self.metrics.count("rejected", function_name, len(jobs) if all_or_nothing else len(to_queue))
+            if all_or_nothing:
+                return []
+            self._fail_unstored_jobs(to_queue, f"Queue size for function {function_name} reached.")
+            return jobs
+        self._claim_wakeup.set()
+        return jobs
+
+    def _fail_unstored_jobs(self, jobs: List[InternalJob], message: str):
+        for job in jobs:
             job.status = JOB_STATUS.FAILED
-            job.result = f"Queue size for function {job_function.__name__} reached."
-            self.results.append(job)
-            return job
+            job.result = message
+            job.execution_finished_at = datetime.utcnow()
+            self.job_store.save(job)
+        self.job_store.flush()
 
-        # add job to queue
+    def _enqueue(self, job: InternalJob):
+        """
+        Add the job to the queue of its function and start it right away if a worker is free.
+        Needs to be called with the lock held.
+        """
+        function_name = job.job_function.__name__
         job.status = JOB_STATUS.QUEUED
-        job.queued_at = datetime.utcnow()
-        self.queue.append(job)
+        if job.queued_at is None:
+            job.queued_at = datetime.utcnow()
+        function_queue = self.queues[job.priority].get(function_name, None)
+        if function_queue is None:
+            function_queue = self.queues[job.priority][function_name] = deque()
+        if self._queued_per_function[function_name] == 0:
+            # a function which was idle doesn't get credit for the time it had nothing to do
+            self._virtual_time[function_name] = max(self._virtual_time[function_name], self._virtual_clock)
+        function_queue.append(job)
+        self._queued_per_function[function_name] += 1
 
         # start worker thread if not already done so
         if not self.worker_thread.is_alive():
             self.worker_thread.start()
 
-        return job
+        # start the job right away if a worker is free
+        self._dispatch_queued_jobs()
+        self._state_changed.notify_all()
 
-    def process_job(self, job: InternalJob):
+    def get_executor(self, job_function: callable) -> FTAPI_EXECUTORS:
+        executor = self.executors.get(job_function.__name__, None)
+        if executor is None:
+            executor = FTAPI_EXECUTORS.ASYNC if self._is_async(job_function) else FTAPI_EXECUTORS.THREAD
+        return executor
+
+    @staticmethod
+    def _is_async(job_function: callable) -> bool:
+        return get_call_plan(job_function).is_async
+
+    @staticmethod
+    def _start_job(job: InternalJob) -> list:
+        """
+        Mark the job as started.
+        :return: the names of the parameters of the job function which expect the JobProgress object.
+        """
         job.execution_started_at = datetime.utcnow()
         job.status = JOB_STATUS.PROCESSING
+        job.notify_listeners()
 
         # if function has a param with the type JobProgress in the function signature, pass the job_progress object
-        for p in inspect.signature(job.job_function).parameters.values():
-            if p.name == "job_progress" or "JobProgress" in p.annotation.__name__:
-                job.job_params[p.name] = job.job_progress
+        return get_call_plan(job.job_function).progress_param_names
 
+    def _finish_job(self, job: InternalJob, result=None, error: Exception = None):
+        # the job might have timed out in the meantime. In that case the result is discarded.
+        # The lock makes the check and the update atomic with respect to _check_timeouts.
+        # The status is set before the progress, so that waiting clients never see a processing job with progress 1.0
+        with self._lock:
+            if job.status != JOB_STATUS.PROCESSING:
+                return
+            if error is None:
+                job.result = result
+                # if execution was successful set _progress to 1.0 and status to finished
+                job.status = JOB_STATUS.FINISHED
+                job.job_progress.set_status(1.0, None)
+            else:
+                job.result = None
+                job.status = JOB_STATUS.FAILED
+                job.job_progress.set_status(1.0, str(error))
+            job.execution_finished_at = datetime.utcnow()
+
+    def _time_out_job(self, job: InternalJob, message: str):
+        # a job which finished or timed out in the meantime keeps its result and message
+        with self._lock:
+            if job.status not in (JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING):
+                return
+            job.result = None
+            job.status = JOB_STATUS.TIMEOUT
+            job.job_progress.set_status(1.0, message)
+            job.execution_finished_at = datetime.utcnow()
+
+    def process_job(self, job: InternalJob):
+        """
+        Execute a job of a sync task function in the current (worker) thread or in a worker process.
+        """
+        progress_param_names = self._start_job(job)
         try:
-            job.result = job.job_function(**job.job_params)
-            # if execution was successful set _progress to 1.0 and status to finished
-            job.job_progress.set_status(1.0, None)
-            job.status = JOB_STATUS.FINISHED
+            if self.get_executor(job.job_function) == FTAPI_EXECUTORS.PROCESS:
+                if get_call_plan(job.job_function).is_generator:
+                    job.chunks = ChunkBuffer(max_chunks=FTAPI_MAX_STREAM_CHUNKS)
+                result = self.process_pool.run(
+                    job.job_function,
+                    params=job.job_params,
+                    progress_param_names=progress_param_names,
+                    job_progress=job.job_progress,
+                    timeout=(job.time_out_at - datetime.utcnow()).total_seconds(),
+                    on_chunk=lambda chunk: self._add_chunk(job, chunk)
+                )
+            else:
+                for name in progress_param_names:
+                    job.job_params[name] = job.job_progress
+                profiler = JobProfiler(job.profile).start() if job.profile is not None else None
+                try:
+                    result = job.job_function(**job.job_params)
+                    if inspect.isgenerator(result):
+                        result = self._collect_chunks(job, result)
+                finally:
+                    if profiler is not None:
+                        self._store_profile(job, profiler.stop())
+            self._finish_job(job, result=result)
+        except TimeoutError as e:
+            self._time_out_job(job, str(e))
         except Exception as e:
-            job.result = None
-            job.job_progress.set_status(1.0, str(e))
-            job.status = JOB_STATUS.FAILED
+            self._finish_job(job, error=e)
             print(traceback.format_exc())
 
-        job.execution_finished_at = datetime.utcnow()
-        # store result in results. Necessary in threading because thread itself cannot easily return values
-        self.results.append(job)
+    def _store_profile(self, job: InternalJob, profiler: JobProfiler):
+        with self._lock:
+            self.profiles[job.id] = profiler
+            while len(self.profiles) > FTAPI_MAX_PROFILES:
+                self.profiles.popitem(last=False)
 
-    def process_jobs_in_background(self):
-        while True:
-            if len(self.queue) == 0 and len(self.in_progress) == 0:
-                time.sleep(1)  # server is idle
-                continue
+    def get_profile(self, job_id: str) -> Union[JobProfiler, None]:
+        """
+        The profile of a profiled job. Kept after the job was removed, until FTAPI_MAX_PROFILES newer profiles exist.
+        """
+        with self._lock:
+            return self.profiles.get(job_id, None)
+
+    def process_batch(self, jobs: list):
+        """
+        Execute a batch of jobs of a batch-aware task function with a single call in the current (worker) thread
+        or in a worker process.
+        """
+        progress_param_names = [self._start_job(job) for job in jobs][0]
+        job_function = jobs[0].job_function
+        params = self._gather_batch_params(jobs)
+        try:
+            if self.get_executor(job_function) == FTAPI_EXECUTORS.PROCESS:
+                results = self.process_pool.run(
+                    job_function,
+                    params=params,
+                    progress_param_names=progress_param_names,
+                    job_progress=[job.job_progress for job in jobs],
+                    timeout=self._batch_timeout(jobs)
+                )
+            else:
+                for name in progress_param_names:
+                    params[name] = [job.job_progress for job in jobs]
+                results = job_function(**params)
+            self._scatter_batch_results(jobs, results)
+        except TimeoutError as e:
+            for job in jobs:
+                self._time_out_job(job, str(e))
+        except Exception as e:
+            for job in jobs:
+                self._finish_job(job, error=e)
+            print(traceback.format_exc())
+
+    async def process_batch_async(self, jobs: list):
+        """
+        Execute a batch of jobs of a batch-aware async task function on the event loop of the job queue.
+        """
+        progress_param_names = [self._start_job(job) for job in jobs][0]
+        params = self._gather_batch_params(jobs)
+        for name in progress_param_names:
+            params[name] = [job.job_progress for job in jobs]
+        timeout = self._batch_timeout(jobs)
+        try:
+            results = await asyncio.wait_for(jobs[0].job_function(**params), timeout=timeout)
+            self._scatter_batch_results(jobs, results)
+        except (asyncio.TimeoutError, TimeoutError):
+            for job in jobs:
+                self._time_out_job(job, f"Job exceeded its timeout of {timeout} seconds and was cancelled.")
+        except Exception as e:
+            for job in jobs:
+                self._finish_job(job, error=e)
+            print(traceback.format_exc())
+
+    @staticmethod
+    def _gather_batch_params(jobs: list) -> dict:
+        """
+        Turn the parameters of the jobs into one list per parameter: {param_name: [value of job 1, value of job 2]}
+        Jobs which omit a parameter another job of the batch passes get its default value.
+        """
+        defaults = get_call_plan(jobs[0].job_function).defaults
+        names = dict.fromkeys(name for job in jobs for name in job.job_params)
+        return {name: [job.job_params.get(name, defaults.get(name, None)) for job in jobs] for name in names}
+
+    @staticmethod
+    def _batch_timeout(jobs: list) -> float:
+        # the batch has to finish before the first of its jobs times out
+        return (min(job.time_out_at for job in jobs) - datetime.utcnow()).total_seconds()
+
+    def _scatter_batch_results(self, jobs: list, results):
+        if results is None or not hasattr(results, "__len__") or len(results) != len(jobs):
+            raise Exception(
+                f"Batch function {jobs[0].job_function.__name__} must return a list with one result per job. "
+                f"Expected {len(jobs)} results, got {len(results) if hasattr(results, '__len__') else results}."
+            )
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                self._finish_job(job, error=result)
+            else:
+                self._finish_job(job, result=result)
+
+    async def process_job_async(self, job: InternalJob):
+        """
+        Execute a job of an async task function on the event loop of the job queue.
+        In contrast to threads, the job is cancelled when it exceeds its timeout.
+        """
+        progress_param_names = self._start_job(job)
+        for name in progress_param_names:
+            job.job_params[name] = job.job_progress
+        timeout = (job.time_out_at - datetime.utcnow()).total_seconds()
+        try:
+            result = job.job_function(**job.job_params)
+            if inspect.isasyncgen(result):
+                result = self._collect_chunks_async(job, result)
+            result = await asyncio.wait_for(result, timeout=timeout)
+            self._finish_job(job, result=result)
+        except (asyncio.TimeoutError, TimeoutError):
+            self._time_out_job(job, f"Job exceeded its timeout of {timeout} seconds and was cancelled.")
+        except Exception as e:
+            self._finish_job(job, error=e)
+            print(traceback.format_exc())
+
+    @staticmethod
+    def _add_chunk(job: InternalJob, chunk):
+        if job.chunks is None:
+            job.chunks = ChunkBuffer(max_chunks=FTAPI_MAX_STREAM_CHUNKS)
+        job.chunks.append(chunk)
+        job.notify_listeners()
+
+    def _collect_chunks(self, job: InternalJob, generator):
+        """
+        Run a generator task function and buffer the chunks it yields. A generator job has no result.
+        Unlike other thread jobs, it is stopped at the next chunk when it exceeds its timeout.
+        """
+        job.chunks = ChunkBuffer(max_chunks=FTAPI_MAX_STREAM_CHUNKS)
+        try:
+            for chunk in generator:
+                if job.status != JOB_STATUS.PROCESSING:
+                    break
+                self._add_chunk(job, chunk)
+        finally:
+            generator.close()
+        return None
+
+    async def _collect_chunks_async(self, job: InternalJob, generator):
+        job.chunks = ChunkBuffer(max_chunks=FTAPI_MAX_STREAM_CHUNKS)
+        try:
+            async for chunk in generator:
+                self._add_chunk(job, chunk)
+        finally:
+            await generator.aclose()
+        return None
+
+    def _dispatch_queued_jobs(self):
+        """
+        Submit queued jobs to the worker pool as long as workers are free.
+        Priority classes are served in order. Within a class, functions are served by weighted fair queuing and
+        the jobs of a function in FIFO order.
+        Jobs of functions that reached their max_concurrency are skipped and stay queued.
+        Needs to be called with the lock held.
+        """
+        if self.paused:
+            return
+        # Completion callbacks of very short jobs can fire while dispatching. The running dispatch handles them.
+        if self._dispatching:
+            self._dispatch_again = True
+            return
+
+        self._dispatching = True
+        try:
+            self._dispatch_again = True
+            while self._dispatch_again:
+                self._dispatch_again = False
+                self._dispatch_queued_jobs_once()
+        finally:
+            self._dispatching = False
+
+    def pause(self):
+        """
+        Stop starting jobs. New jobs are still accepted and stay queued until resume is called.
+        """
+        with self._lock:
+            self.paused = True
+
+    def resume(self):
+        """
+        Start the jobs which were queued while the job queue was paused.
+        """
+        with self._lock:
+            self.paused = False
+            self._dispatch_queued_jobs()
+            self._state_changed.notify_all()
+        if self.job_store.shared:
+            self._claim_wakeup.set()
+
+    def _has_free_slot(self, function_name: str, executor: FTAPI_EXECUTORS) -> bool:
+        if self._running_per_function[function_name] >= self.max_concurrency.get(function_name, math.inf):
+            return False
+        if executor == FTAPI_EXECUTORS.ASYNC:
+            return self._running_per_executor[FTAPI_EXECUTORS.ASYNC] < self.max_async_jobs
+
+        # thread and process jobs occupy a worker thread. Process jobs additionally need a free worker process.
+        running_in_threads = (self._running_per_executor[FTAPI_EXECUTORS.THREAD]
+                              + self._running_per_executor[FTAPI_EXECUTORS.PROCESS])
+        if running_in_threads >= self.max_workers:
+            return False
+        if executor == FTAPI_EXECUTORS.PROCESS:
+            return self._running_per_executor[FTAPI_EXECUTORS.PROCESS] < FTAPI_MAX_PROCESS_WORKERS
+        return True
+
+    def _dispatch_queued_jobs_once(self):
+        now = datetime.utcnow()
+        self._next_batch_due = None
+        for priority, function_queues in self.queues.items():
+            candidates = [function_name for function_name, jobs in function_queues.items() if jobs]
+            while candidates:
+                function_name = min(candidates, key=lambda name: self._virtual_time[name])
+                jobs = function_queues[function_name]
+                ready = self._next_ready_jobs(function_name, jobs, now)
+                if ready is None or not self._start_jobs(ready):
+                    # no free slot for this function or its batch is not ready. Others might still be startable.
+                    candidates.remove(function_name)
+                    continue
+
+                for _ in range(len(ready)):
+                    jobs.popleft()
+                self._virtual_clock = self._virtual_time[function_name]
+                self._virtual_time[function_name] += 1 / self.weights.get(function_name, 1)
+                if not jobs:
+                    candidates.remove(function_name)
+
+    def _next_ready_jobs(self, function_name: str, jobs: deque, now: datetime) -> Union[list, None]:
+        """
+        :return: the next job of the queue or, for batch functions, the next batch if it is full or waited long enough.
+            None if the batch is not ready yet.
+        """
+        batch_size = self.batch_sizes.get(function_name, None)
+        if batch_size is None:
+            return [jobs[0]]
+        if len(jobs) >= batch_size:
+            return list(islice(jobs, batch_size))
+
+        due_at = jobs[0].queued_at + timedelta(milliseconds=self.max_batch_wait[function_name])
+        if due_at <= now:
+            return list(jobs)
+        if self._next_batch_due is None or due_at < self._next_batch_due:
+            self._next_batch_due = due_at
+        return None
+
+    def _start_jobs(self, jobs: list) -> bool:
+        """
+        Submit the jobs to their executor if a slot is free. Jobs of batch functions are executed with a single call.
+        Needs to be called with the lock held.
+        :return: False if no slot is free and the jobs stay queued.
+        """
+        job_function = jobs[0].job_function
+        function_name = job_function.__name__
+        executor = self.get_executor(job_function)
+        if not self._has_free_slot(function_name, executor):
+            return False
+
+        now = datetime.utcnow()
+        for job in jobs:
+            # the timeout counts from the start of the execution on. Set before the job can start.
+            job.set_timeout(job.timeout)
+        try:
+            if function_name in self.batch_sizes:
+                if executor == FTAPI_EXECUTORS.ASYNC:
+                    future = self._async_runner.submit(self.process_batch_async(jobs))
+                else:
+                    future = self._executor.submit(self.process_batch, jobs)
+            elif executor == FTAPI_EXECUTORS.ASYNC:
+                future = self._async_runner.submit(self.process_job_async(jobs[0]))
+            else:
+                future = self._executor.submit(self.process_job, jobs[0])
+        except RuntimeError:
+            # no new threads at interpreter shutdown or the event loop is closed. The jobs stay queued.
+            print(traceback.format_exc())
+            return False
+
+        # the scheduling state is only changed once the jobs were submitted. A batch occupies a single slot.
+        self._queued_per_function[function_name] -= len(jobs)
+        for job in jobs:
+            wait_time = (now - job.queued_at).total_seconds()
+            self._queue_wait_times[job.priority].append(wait_time)
+            self.metrics.observe("queue_wait_seconds", function_name, wait_time)
+        self._running_per_function[function_name] += 1
+        self._running_per_executor[executor] += 1
+        for job in jobs:
+            self.in_progress[job.id] = {"future": future, "job": job, "executor": executor}
+        job_ids = [job.id for job in jobs]
+        future.add_done_callback(lambda f: self._on_job_done(*job_ids))
+        return True
+
+    def _on_job_done(self, *job_ids: str):
+        """
+        Completion callback of the worker futures. Frees the worker slot and starts the next queued jobs.
+        :param job_ids: the id of the job or the ids of all jobs of a batch.
+        """
+        with self._lock:
+            job_futures = [self.in_progress.pop(job_id, None) for job_id in job_ids]
+            job_futures = [job_future for job_future in job_futures if job_future is not None]
+            if len(job_futures) == 0:
+                return
+            self._running_per_function[job_futures[0]["job"].job_function.__name__] -= 1
+            self._running_per_executor[job_futures[0]["executor"]] -= 1
+            for job_future in job_futures:
+                # thread jobs which timed out were already finished by _check_timeouts
+                if not job_future.get("finished", False):
+                    self._observe_execution(job_future["job"])
+                    self._retain_result(job_future["job"])
+            self._dispatch_queued_jobs()
+            self._state_changed.notify_all()
+            if self.job_store.shared:
+                self._claim_wakeup.set()
+
+    def _observe_execution(self, job: InternalJob):
+        """
+        Count the executed job by its status and record its execution time. Call with the lock held.
+        """
+        function_name = job.job_function_name
+        if job.status == JOB_STATUS.FINISHED:
+            self.metrics.count("finished", function_name)
+        elif job.status == JOB_STATUS.TIMEOUT:
+            self.metrics.count("timeout", function_name)
+        else:
+            self.metrics.count("failed", function_name)
+        if job.execution_started_at is not None and job.execution_finished_at is not None:
+            self.metrics.observe(
+                "execution_seconds", function_name,
+                (job.execution_finished_at - job.execution_started_at).total_seconds()
+            )
+
+    def _retain_result(self, job: InternalJob):
+        """
+        Hand a finished job over to the result retention and remove the jobs it evicts. Call with the lock held.
+        """
+        self.result_retention.add(job.id, job.result if job.chunks is None else job.chunks.to_list())
+        self.job_store.save(job)
+        if job.cache_key is not None:
+            if self._in_flight.get(job.cache_key, None) is job:
+                del self._in_flight[job.cache_key]
+            cache = self.caches.get(job.job_function_name, None)
+            if cache is not None and job.status == JOB_STATUS.FINISHED:
+                cache.put(job.cache_key, job.result)
+        self._evict_results()
+        # the job is finished and its result can be retrieved now
+        job.notify_listeners()
 
-            # create new jobs from queue
-            for job in self.queue:
-                t_job = threading.Thread(target=self.process_job, args=(job,), daemon=True)
-                t_job.start()
+    def _evict_results(self):
+        for job_id in self.result_retention.evict():
+            self.jobs.pop(job_id, None)
+            # results evicted to save memory stay in the job store and are loaded again on request
+            if self.result_retention.eviction_reason(job_id) == "ttl":
+                self.job_store.delete(job_id)
 
-                self.in_progress.append({"job_id": job.id, "thread": t_job, "job": job})
-                self.queue.remove(job)
+    def _check_timeouts(self) -> Union[float, None]:
+        """
+        Mark in progress jobs which exceeded their time_out_at as timed out. Needs to be called with the lock held.
+        :return: seconds until the next job times out. None if there are no running jobs.
+        """
+        now = datetime.utcnow()
+        next_timeout = None
+        for job_future in self.in_progress.values():
+            job = job_future["job"]
+            # results are applied with the lock held. A job which finished already can't time out anymore.
+            if job.status not in (JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING):
+                continue
+            if job.time_out_at <= now:
+                executor = job_future["executor"]
+                if executor == FTAPI_EXECUTORS.THREAD:
+                    # Threads can't be killed. A thread job keeps its worker slot until the function returns, but
+                    # the job is finished right away and waiting clients get the timeout. Its result is discarded.
+                    self._time_out_job(job, f"Job exceeded its timeout of {job.timeout} seconds.")
+                    job_future["finished"] = True
+                    self._observe_execution(job)
+                    self._retain_result(job)
+                else:
+                    # Jobs with executor="process" are killed by the process pool and async jobs are cancelled.
+                    # A result which arrives at the deadline is discarded. Their executor frees the slot.
+                    stopped = "killed" if executor == FTAPI_EXECUTORS.PROCESS else "cancelled"
+                    self._time_out_job(job, f"Job exceeded its timeout of {job.timeout} seconds and was {stopped}.")
+                continue
+            if next_timeout is None or job.time_out_at < next_timeout:
+                next_timeout = job.time_out_at
 
-            # check if jobs are finished
-            for job_thread in self.in_progress:
-                # remove finished jobs
-                if not job_thread["thread"].is_alive():
-                    self.in_progress.remove(job_thread)
+        return None if next_timeout is None else (next_timeout - now).total_seconds()
 
-                # remove timeout jobs
-                if job_thread["job"].time_out_at < datetime.utcnow():
-                    # set status to failed
-                    j = job_thread["job"]
-                    j.status = JOB_STATUS.TIMEOUT
-                    # todo: implement method e.g with multiprocessing to kill thread
-                    self.in_progress.remove(job_thread)
+    def process_jobs_in_background(self):
+        """
+        Jobs are dispatched on submit and on completion of other jobs.
+        This thread only sleeps until the next job times out, the next result expires, a not yet full batch waited
+        long enough or the scheduling state changes. Idle it uses no CPU.
+        """
+        with self._state_changed:
+            while True:
+                self._evict_results()
+                if self._next_batch_due is not None and self._next_batch_due <= datetime.utcnow():
+                    self._dispatch_queued_jobs()
+                wakeups = [
+                    self._check_timeouts(),
+                    self.result_retention.seconds_until_next_expiry(),
+                    self._seconds_until_next_batch_due()
+                ]
+                wakeups = [w for w in wakeups if w is not None]
+                self._state_changed.wait(timeout=min(wakeups) if wakeups else None)
 
-                    self.results.append(j)
-            # give threads time to breath
-            time.sleep(0.01)
-            # ToDo: remove jobs from memory which are long finished and results not retrieved
+    def _seconds_until_next_batch_due(self) -> Union[float, None]:
+        if self._next_batch_due is None:
+            return None
+        return max(0.0, (self._next_batch_due - datetime.utcnow()).total_seconds())
 
-    def get_job(self, job_id: str, keep_in_memory: bool =False) -> Union[InternalJob, None]:
+    def get_job(self, job_id: str, keep_in_memory: bool = False) -> Union[InternalJob, None]:
         """
         Get a job by its id. Returns None if the job does not exist.
         :param job_id: the id of the job
         :param keep_in_memory: if True, the job will be kept in memory even when finished and retrieved.
             - By default jobs are removed from result memory when finished and get_job is called.
         """
-        # check if in results
-        job = next((job for job in self.results if job.id == job_id), None)
-        if job:
-            return job
+        with self._lock:
+            job = self.jobs.get(job_id, None)
+            if job is None:
+                job = self._load_job(job_id)
+            # only finished jobs are handed over to the result retention
+            if job is None or job_id not in self.result_retention:
+                return job
 
-        # check if in _progress
-        job = next((th['job'] for th in self.in_progress if th["job_id"] == job_id), None)
-        if job:
+            if keep_in_memory:
+                self.result_retention.touch(job_id)
+            else:
+                self.result_retention.remove(job_id, reason="retrieved")
+                del self.jobs[job_id]
+                self.job_store.delete(job_id)
             return job
 
-        # return if in queue
-        job = next((job for job in self.results if job.id == job_id), None)
-        if not keep_in_memory:
-            self.queue.remove(job)
+    def _load_job(self, job_id: str) -> Union[InternalJob, None]:
+        """
+        Load a job from the job store which is not in memory. For example, because the server restarted.
+        Finished jobs are handed over to the result retention again. Needs to be called with the lock held.
+        """
+        job = self.job_store.load(job_id)
+        if job is not None and job.status not in (JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING):
+            self.jobs[job_id] = job
+            self.result_retention.add(job_id, job.result if job.chunks is None else job.chunks.to_list())
+            self._evict_results()
+        return job
+
+    async def wait_for_update(
+            self,
+            job_id: str,
+            timeout: float,
+            progress_threshold: float = None,
+            cursor: int = None
+    ):
+        """
+        Wait without blocking a thread until the job changes its status, its progress reaches progress_threshold,
+        it yields chunks beyond cursor or timeout seconds passed.
+        Returns right away if the job is unknown or already finished.
+        :param progress_threshold: value between 0 and 1.0. If None, progress updates don't end the wait.
+        :param cursor: for generator jobs. If None, new chunks don't end the wait.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id, None)
+        if job is None:
+            if self.job_store.shared:
+                await self._wait_for_stored_update(job_id, timeout, progress_threshold, cursor)
+            return
+
+        initial_status = job.status
+
+        def is_updated() -> bool:
+            # finished jobs count once their result is retained, so that get_job hands them out only once
+            if job.id in self.result_retention:
+                return True
+            if job.status != initial_status and job.status in (JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING):
+                return True
+            if cursor is not None and job.chunks is not None and job.chunks.total > cursor:
+                return True
+            return (progress_threshold is not None and job.status == JOB_STATUS.PROCESSING
+                    and job.job_progress._progress >= progress_threshold)
+
+        if is_updated():
+            return
+
+        loop = asyncio.get_running_loop()
+        updated = asyncio.Event()
+
+        def on_update():
+            if is_updated():
+                try:
+                    loop.call_soon_threadsafe(updated.set)
+                except RuntimeError:
+                    pass  # the event loop of the waiting client was closed
+
+        job.add_listener(on_update)
+        try:
+            # the job might have been updated before the listener was added
+            if not is_updated():
+                await asyncio.wait_for(updated.wait(), timeout=timeout)
+        except (asyncio.TimeoutError, TimeoutError):
+            pass
+        finally:
+            job.remove_listener(on_update)
+
+    async def _wait_for_stored_update(
+            self,
+            job_id: str,
+            timeout: float,
+            progress_threshold: float = None,
+            cursor: int = None
+    ):
+        """
+        Jobs executed by other processes don't notify this process. Their state is polled from the shared job store.
+        Loading a job blocks (database lock, unpickling). It runs in the default executor of the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        job = await loop.run_in_executor(None, self.job_store.load, job_id)
+        if job is None:
+            return
+        initial_status = job.status
+        deadline = loop.time() + timeout
+        while job is not None and job.status == initial_status and job.status in (
+                JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING):
+            if cursor is not None and job.chunks is not None and job.chunks.total > cursor:
+                return
+            if (progress_threshold is not None and job.status == JOB_STATUS.PROCESSING
+                    and job.job_progress._progress >= progress_threshold):
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, self.claim_interval * 2))
+            job = await loop.run_in_executor(None, self.job_store.load, job_id)
+
+    def is_result_available(self, job_id: str) -> bool:
+        """
+        True if the job is finished and its result can be retrieved with get_job.
+        """
+        return job_id in self.result_retention
+
+    def get_eviction_reason(self, job_id: str) -> Union[str, None]:
+        """
+        Get why a job was removed from memory: ttl, max_results, memory_budget or retrieved.
+        Returns None if the job was not removed (recently).
+        """
+        with self._lock:
+            return self.result_retention.eviction_reason(job_id)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "queued_jobs": sum(self._queued_per_function.values()),
+                "queued_jobs_per_priority": {
+                    priority.value: sum(len(jobs) for jobs in function_queues.values())
+                    for priority, function_queues in self.queues.items()
+                },
+                "in_progress_jobs": len(self.in_progress),
+                "stored_jobs": len(self.jobs),
+                "worker_id": self.worker_id,
+                **self.result_retention.get_stats()
+            }
+            if self.caches:
+                stats["caches"] = {name: cache.get_stats() for name, cache in self.caches.items()}
+            wait_times = {priority: list(times) for priority, times in self._queue_wait_times.items()}
+
+        stats["queue_wait_seconds"] = {
+            priority.value: self._percentiles(times) for priority, times in wait_times.items() if len(times) > 0
+        }
+        return stats
+
+    def get_metrics(self) -> str:
+        """
+        The job counters, queue and in progress gauges and latency histograms per function in the Prometheus text
+        format. Only the jobs of this process are counted.
+        """
+        with self._lock:
+            metrics = self.metrics.copy()
+            queued = {name: self._queued_per_function[name] for name in self.functions}
+            in_progress = Counter({name: 0 for name in self.functions})
+            in_progress.update(job_future["job"].job_function_name for job_future in self.in_progress.values())
+        return metrics.to_prometheus(queued, in_progress)
+
+    @staticmethod
+    def _percentiles(values: list) -> dict:
+        values = sorted(values)
+        return {
+            "samples": len(values),
+            "p50": values[int(len(values) * 0.5)],
+            "p90": values[int(len(values) * 0.9)],
+            "p99": values[int(len(values) * 0.99)],
+            "max": values[-1]
+        }
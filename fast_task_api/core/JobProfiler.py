@@ -0,0 +1,109 @@
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from typing import Tuple, Union
+
+# "cpu" profiles the function calls with cProfile, "memory" traces the allocations with tracemalloc
+PROFILE_MODES = ("cpu", "memory")
+# profile modes requested by the current request with the X-FTAPI-Profile header. Read when the job is created.
+requested_profile: ContextVar = ContextVar("requested_profile", default=None)
+
+_TOP_FUNCTIONS = 50
+_TOP_ALLOCATIONS = 20
+
+# tracemalloc traces the whole process. It runs as long as at least one profiled job needs it.
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+# tracemalloc started by the application itself is left running
+_tracemalloc_started_here = False
+
+
+def parse_profile_modes(value: Union[str, None]) -> Union[Tuple[str, ...], None]:
+    """
+    Parse comma separated profile modes like "cpu,memory". Unknown modes are ignored.
+    :return: the modes or None if there are none.
+    """
+    if not value:
+        return None
+    modes = tuple(mode for mode in PROFILE_MODES if mode in {part.strip().lower() for part in value.split(",")})
+    return modes if len(modes) > 0 else None
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started_here
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            _tracemalloc_started_here = not tracemalloc.is_tracing()
+            if _tracemalloc_started_here:
+                tracemalloc.start()
+        _tracemalloc_users += 1
+        tracemalloc.reset_peak()
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started_here:
+            tracemalloc.stop()
+
+
+class JobProfiler:
+    """
+    Profiles the execution of a job in the current thread.
+    - cpu: cProfile of the calls of the task function. Kept as text summary and as pstats dump.
+    - memory: peak of the traced memory and the largest allocations still alive when the job ended.
+      tracemalloc traces the whole process, so jobs running at the same time are included.
+    """
+    def __init__(self, modes: Tuple[str, ...]):
+        self.modes = tuple(modes)
+        self.summary: dict = {}
+        self.pstats_dump: Union[bytes, None] = None
+        self._profile = None
+
+    def start(self) -> "JobProfiler":
+        if "memory" in self.modes:
+            _start_tracemalloc()
+            self._memory_at_start = tracemalloc.get_traced_memory()[0]
+        if "cpu" in self.modes:
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError:
+                # another profiler is active (python >= 3.12 allows only one at a time)
+                self._profile = None
+        self._started = time.perf_counter()
+        return self
+
+    def stop(self) -> "JobProfiler":
+        duration = time.perf_counter() - self._started
+        if self._profile is not None:
+            self._profile.disable()
+        self.summary = {"modes": list(self.modes), "duration_seconds": duration}
+
+        if "memory" in self.modes:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            _stop_tracemalloc()
+            self.summary["peak_memory_bytes"] = max(peak - self._memory_at_start, 0)
+            self.summary["memory_delta_bytes"] = current - self._memory_at_start
+            self.summary["top_allocations"] = [
+                {"location": str(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:_TOP_ALLOCATIONS]
+            ]
+
+        if self._profile is not None:
+            stats = pstats.Stats(self._profile, stream=io.StringIO())
+            stats.sort_stats("cumulative").print_stats(_TOP_FUNCTIONS)
+            self.summary["cpu_stats"] = stats.stream.getvalue()
+            # same format as pstats.Stats.dump_stats. Loadable with pstats.Stats(path) or snakeviz.
+            self.pstats_dump = marshal.dumps(stats.stats)
+            self._profile = None
+        elif "cpu" in self.modes:
+            self.summary["cpu_stats"] = None
+        return self
@@ -0,0 +1,113 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, Tuple
+
+# upper bounds in seconds of the histogram buckets. Covers fast api calls up to long running model inference.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+# counter name: help text. Exported as fast_task_api_jobs_{name}_total.
+_COUNTERS = {
+    "submitted": "Jobs submitted to the queue, including rejected jobs and jobs answered from the result cache.",
+    "finished": "Executed jobs which finished successfully.",
+    "failed": "Executed jobs which raised an exception.",
+    "timeout": "Executed jobs which exceeded their timeout.",
+    "rejected": "Jobs rejected because the queue of the function was full.",
+}
+_HISTOGRAMS = {
+    "queue_wait_seconds": "Seconds the jobs waited in the queue until their execution started.",
+    "execution_seconds": "Seconds from the start to the end of the execution of the jobs.",
+}
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets. Observing a value is a binary search and two additions without allocations.
+    Not thread-safe: the JobQueue observes values while it holds its lock anyway.
+    """
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        # the last bucket counts the values larger than the largest bound (+Inf)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def copy(self) -> "Histogram":
+        histogram = Histogram(self.bounds)
+        histogram.counts = list(self.counts)
+        histogram.sum = self.sum
+        return histogram
+
+
+class JobMetrics:
+    """
+    Counters and histograms of the jobs per task function. Updated by the JobQueue with its lock held and exported
+    in the Prometheus text format by the /metrics endpoint.
+    """
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.counters: Dict[str, Counter] = {name: Counter() for name in _COUNTERS}
+        self.histograms: Dict[str, Dict[str, Histogram]] = {
+            name: defaultdict(lambda: Histogram(buckets)) for name in _HISTOGRAMS
+        }
+
+    def count(self, counter: str, function_name: str, n: int = 1):
+        self.counters[counter][function_name] += n
+
+    def observe(self, histogram: str, function_name: str, seconds: float):
+        self.histograms[histogram][function_name].observe(seconds)
+
+    def copy(self) -> "JobMetrics":
+        """
+        A snapshot which can be rendered without holding the lock of the JobQueue.
+        """
+        metrics = JobMetrics()
+        metrics.counters = {name: Counter(counter) for name, counter in self.counters.items()}
+        metrics.histograms = {
+            name: {function_name: histogram.copy() for function_name, histogram in histograms.items()}
+            for name, histograms in self.histograms.items()
+        }
+        return metrics
+
+    def to_prometheus(self, queued: Dict[str, int], in_progress: Dict[str, int]) -> str:
+        """
+        The metrics in the Prometheus text exposition format.
+        :param queued: the number of queued jobs per function.
+        :param in_progress: the number of executing jobs per function.
+        """
+        lines = []
+        for name, help_text in _COUNTERS.items():
+            metric = f"fast_task_api_jobs_{name}_total"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{function="{_escape(function_name)}"}} {value}'
+                      for function_name, value in sorted(self.counters[name].items())]
+
+        for metric, help_text, values in (
+                ("fast_task_api_queued_jobs", "Jobs waiting in the queue.", queued),
+                ("fast_task_api_in_progress_jobs", "Jobs being executed.", in_progress)):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            lines += [f'{metric}{{function="{_escape(function_name)}"}} {value}'
+                      for function_name, value in sorted(values.items())]
+
+        for name, help_text in _HISTOGRAMS.items():
+            metric = f"fast_task_api_job_{name}"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            for function_name, histogram in sorted(self.histograms[name].items()):
+                label = f'function="{_escape(function_name)}"'
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                cumulative += histogram.counts[-1]
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {cumulative}')
+                lines.append(f"{metric}_sum{{{label}}} {histogram.sum}")
+                lines.append(f"{metric}_count{{{label}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,327 @@
+"""
+Executes jobs in a pool of worker processes.
+- CPU bound task functions don't hold the GIL of the server process.
+- Jobs which exceed their timeout are killed together with their worker process. A fresh worker replaces it.
+- Large arguments and results (bytes, media files, numpy arrays) are transferred via shared memory instead of pipes.
+"""
+import inspect
+import multiprocessing
+import pickle
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+from typing import Union, Dict, List
+
+from fast_task_api.compatibility.upload import is_param_media_toolkit_file, media_file_size
+from fast_task_api.core.job.JobProgress import JobProgress
+
+# Functions which can be executed in the worker processes. Organized like {function_key: function}.
+# Worker processes resolve the function by its key. Forked workers inherit the registry.
+# Spawned workers fill it by importing the main module which runs the task_endpoint decorators again.
+_process_functions: Dict[str, callable] = {}
+
+
+def get_function_key(func: callable) -> str:
+    module = func.__module__
+    # spawned worker processes import the main module as __mp_main__
+    if module == "__mp_main__":
+        module = "__main__"
+    return f"{module}.{func.__qualname__}"
+
+
+def register_process_function(func: callable) -> str:
+    key = get_function_key(func)
+    _process_functions[key] = func
+    return key
+
+
+class _MediaFilePayload:
+    """
+    Transport container for media-toolkit files. The content is pickled out-of-band and thus lands in shared memory.
+    """
+    def __init__(self, media_file):
+        self.media_file_type = type(media_file)
+        self.file_name = media_file.file_name
+        self.content_type = media_file.content_type
+        self.content = pickle.PickleBuffer(media_file.to_bytes())
+
+    def to_media_file(self):
+        media_file = self.media_file_type(file_name=self.file_name, content_type=self.content_type)
+        return media_file.from_bytes(bytes(self.content))
+
+
+def _pack(value, threshold: int):
+    """
+    Wrap large bytes and media files so that pickle transfers their content out-of-band.
+    Numpy arrays support out-of-band pickling natively. Lists (batches) are packed item by item.
+    """
+    if isinstance(value, list):
+        return [_pack(item, threshold) for item in value]
+    if isinstance(value, (bytes, bytearray)) and len(value) >= threshold:
+        return pickle.PickleBuffer(value)
+    if is_param_media_toolkit_file(value) and hasattr(value, "file_size") and media_file_size(value) >= threshold:
+        return _MediaFilePayload(value)
+    return value
+
+
+def _unpack(value):
+    if isinstance(value, list):
+        return [_unpack(item) for item in value]
+    if isinstance(value, _MediaFilePayload):
+        return value.to_media_file()
+    return value
+
+
+def dumps(obj, threshold: int) -> tuple:
+    """
+    Pickle obj. Out-of-band buffers larger than threshold are copied into shared memory blocks.
+    :return: (pickled_data, buffers) where buffers is a list of (shared_memory_name or raw bytes, readonly)
+    """
+    out_of_band = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=out_of_band.append)
+
+    buffers = []
+    for pickle_buffer in out_of_band:
+        raw = pickle_buffer.raw()
+        if raw.nbytes < threshold:
+            buffers.append((bytes(raw), raw.readonly))
+            continue
+        shm = shared_memory.SharedMemory(create=True, size=raw.nbytes)
+        shm.buf[:raw.nbytes] = raw
+        buffers.append((shm.name, raw.readonly, raw.nbytes))
+        shm.close()
+    return data, buffers
+
+
+def loads(data: bytes, buffers: list):
+    """
+    Inverse of dumps. Shared memory blocks are released after reading.
+    """
+    materialized = []
+    for buffer in buffers:
+        if isinstance(buffer[0], bytes):
+            content, readonly = buffer
+        else:
+            name, readonly, size = buffer
+            shm = shared_memory.SharedMemory(name=name)
+            try:
+                content = bytes(shm.buf[:size]) if readonly else bytearray(shm.buf[:size])
+            finally:
+                shm.close()
+                shm.unlink()
+        materialized.append(content)
+    return pickle.loads(data, buffers=materialized)
+
+
+def _release_buffers(buffers: list):
+    """
+    Free the shared memory blocks of a message which will never be read.
+    """
+    for buffer in buffers:
+        if isinstance(buffer[0], bytes):
+            continue
+        try:
+            shm = shared_memory.SharedMemory(name=buffer[0])
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _ProcessJobProgress(JobProgress):
+    """
+    JobProgress inside a worker process. Forwards the updates to the JobProgress of the job in the server process.
+    """
+    def __init__(self, connection, index: int = None):
+        """
+        :param index: position of the job in the batch if the function is executed in batches.
+        """
+        super().__init__()
+        self._connection = connection
+        self._index = index
+
+    def set_status(self, progress: float, message: str):
+        super().set_status(progress=progress, message=message)
+        self._connection.send(("progress", progress, message, self._index))
+
+
+def _worker_main(connection, threshold: int):
+    """
+    Main loop of a worker process.
+    Receives jobs as (function_key, data, buffers, progress_param_names, batch_size) via the connection.
+    For batches (batch_size is not None) each progress parameter receives a list with one JobProgress per job.
+    Chunks of generator functions are sent one by one as ("chunk", data, buffers) before the result.
+    """
+    while True:
+        try:
+            task = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+
+        function_key, data, buffers, progress_param_names, batch_size = task
+        try:
+            func = _process_functions.get(function_key, None)
+            if func is None:
+                raise Exception(f"Function {function_key} is not registered in the worker process.")
+
+            params = {key: _unpack(value) for key, value in loads(data, buffers).items()}
+            if len(progress_param_names) > 0:
+                if batch_size is None:
+                    job_progress = _ProcessJobProgress(connection)
+                else:
+                    job_progress = [_ProcessJobProgress(connection, index=i) for i in range(batch_size)]
+                for name in progress_param_names:
+                    params[name] = job_progress
+
+            result = func(**params)
+            if inspect.isgenerator(result):
+                for chunk in result:
+                    connection.send(("chunk", *dumps(_pack(chunk, threshold), threshold)))
+                result = None
+            connection.send(("result", *dumps(_pack(result, threshold), threshold)))
+        except Exception as e:
+            connection.send(("error", str(e), traceback.format_exc()))
+
+
+class _ProcessWorker:
+    def __init__(self, context, threshold: int):
+        self.connection, child_connection = context.Pipe(duplex=True)
+        self.process = context.Process(target=_worker_main, args=(child_connection, threshold), daemon=True)
+        self.process.start()
+        child_connection.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class ProcessWorkerPool:
+    def __init__(self, max_workers: int, shared_memory_threshold: int = 1024 * 1024, start_method: str = None):
+        """
+        Pool of worker processes. Workers are started on demand and reused for further jobs.
+        :param max_workers: maximum number of worker processes.
+        :param shared_memory_threshold: arguments and results of at least this size in bytes are transferred via
+            shared memory.
+        :param start_method: multiprocessing start method (fork, spawn, forkserver). Defaults to the platform default.
+        """
+        self.max_workers = max_workers
+        self.shared_memory_threshold = shared_memory_threshold
+        self._context = multiprocessing.get_context(start_method)
+        self._idle_workers: List[_ProcessWorker] = []
+        self._lock = threading.Lock()
+        self._free_slots = threading.Semaphore(max_workers)
+
+    def _acquire_worker(self) -> _ProcessWorker:
+        self._free_slots.acquire()
+        with self._lock:
+            while self._idle_workers:
+                worker = self._idle_workers.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.kill()
+        try:
+            return _ProcessWorker(self._context, self.shared_memory_threshold)
+        except Exception:
+            self._free_slots.release()
+            raise
+
+    def _release_worker(self, worker: Union[_ProcessWorker, None]):
+        if worker is not None:
+            with self._lock:
+                self._idle_workers.append(worker)
+        self._free_slots.release()
+
+    def _replace_worker(self, worker: _ProcessWorker):
+        """
+        Kill a (hanging) worker and start a fresh one so that the capacity of the pool is restored.
+        """
+        worker.kill()
+        try:
+            replacement = _ProcessWorker(self._context, self.shared_memory_threshold)
+        except Exception:
+            replacement = None
+            print(traceback.format_exc())
+        self._release_worker(replacement)
+
+    def run(
+            self,
+            func: callable,
+            params: dict,
+            progress_param_names: list = None,
+            job_progress: Union[JobProgress, List[JobProgress]] = None,
+            timeout: float = None,
+            on_chunk: callable = None
+    ):
+        """
+        Execute func(**params) in a worker process and block until the result is available.
+        :param progress_param_names: names of the JobProgress parameters of func.
+            Progress updates of the worker are forwarded to job_progress.
+        :param job_progress: the JobProgress of the job or, for a batch, a list with the JobProgress of each job.
+        :param timeout: seconds until the worker is killed and a TimeoutError is raised. None waits forever.
+        :param on_chunk: called with each chunk if func is a generator. The result of a generator is None.
+        """
+        function_key = get_function_key(func)
+        if function_key not in _process_functions:
+            register_process_function(func)
+
+        batch_size = len(job_progress) if isinstance(job_progress, list) else None
+        params = {key: _pack(value, self.shared_memory_threshold) for key, value in params.items()}
+        data, buffers = dumps(params, self.shared_memory_threshold)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        worker = self._acquire_worker()
+        try:
+            worker.connection.send((function_key, data, buffers, progress_param_names or [], batch_size))
+            message = self._wait_for_result(worker, deadline, job_progress, on_chunk)
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            # the worker died. For example killed by the OOM killer.
+            _release_buffers(buffers)
+            self._replace_worker(worker)
+            raise Exception("The worker process executing the job died unexpectedly.")
+        except BaseException:
+            self._replace_worker(worker)
+            raise
+
+        if message is None:
+            _release_buffers(buffers)
+            self._replace_worker(worker)
+            raise TimeoutError(f"Job exceeded its timeout of {timeout} seconds. The worker process was killed.")
+
+        self._release_worker(worker)
+        if message[0] == "error":
+            raise Exception(message[1])
+        return _unpack(loads(message[1], message[2]))
+
+    @staticmethod
+    def _wait_for_result(
+            worker: _ProcessWorker,
+            deadline: Union[float, None],
+            job_progress: Union[JobProgress, List[JobProgress], None],
+            on_chunk: callable = None
+    ):
+        """
+        Receive messages of the worker until the job finished. Progress updates are forwarded to job_progress,
+        chunks of generators to on_chunk.
+        :return: the result or error message of the worker. None if the deadline passed.
+        """
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not worker.connection.poll(remaining):
+                return None
+
+            message = worker.connection.recv()
+            if message[0] == "chunk":
+                chunk = _unpack(loads(message[1], message[2]))
+                if on_chunk is not None:
+                    on_chunk(chunk)
+                continue
+            if message[0] != "progress":
+                return message
+            if isinstance(job_progress, list):
+                job_progress[message[3]].set_status(message[1], message[2])
+            elif job_progress is not None:
+                job_progress.set_status(message[1], message[2])
@@ -0,0 +1,125 @@
+import zlib
+from typing import Iterable, Iterator, Union
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# used by the negotiation if the client accepts multiple encodings with the same weight
+_PREFERENCE = ("zstd", "br", "gzip")
+# fast levels suited to compress responses on the fly
+_DEFAULT_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+_MAX_LEVELS = {"gzip": 9, "br": 11, "zstd": 22}
+# bodies of at least this size are compressed while they are sent instead of at once
+STREAM_MIN_BYTES = 1024 * 1024
+_STREAM_CHUNK_SIZE = 256 * 1024
+
+_COMPRESSIBLE_TYPES = ("application/json", "application/xml", "application/javascript", "application/x-ndjson",
+                       "image/svg+xml")
+
+
+def available_encodings() -> tuple:
+    """
+    The content encodings which can be produced with the installed libraries, in order of preference.
+    """
+    return tuple(
+        encoding for encoding in _PREFERENCE
+        if encoding == "gzip" or (encoding == "br" and brotli is not None)
+        or (encoding == "zstd" and zstandard is not None)
+    )
+
+
+def negotiate_encoding(accept_encoding: Union[str, None]) -> Union[str, None]:
+    """
+    Choose the content encoding for a response by the Accept-Encoding header of the request.
+    :return: gzip, br, zstd or None if the client accepts none of the available encodings.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        encoding, _, params = part.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[encoding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(content_type: Union[str, None]) -> bool:
+    """
+    Text-like content types. Images, audio and video are compressed already and are sent as they are.
+    """
+    if not content_type:
+        return False
+    content_type = content_type.split(";")[0].strip().lower()
+    return (content_type.startswith("text/") or content_type in _COMPRESSIBLE_TYPES
+            or content_type.endswith("+json") or content_type.endswith("+xml"))
+
+
+def _level(encoding: str, level: Union[int, None]) -> int:
+    if level is None:
+        return _DEFAULT_LEVELS[encoding]
+    return max(1 if encoding != "br" else 0, min(level, _MAX_LEVELS[encoding]))
+
+
+class _Compressor:
+    """
+    Incremental compressor with the same interface for all encodings.
+    """
+    def __init__(self, encoding: str, level: int = None):
+        level = _level(encoding, level)
+        if encoding == "gzip":
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress, self.flush = compressor.compress, compressor.flush
+        elif encoding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self.compress, self.flush = compressor.process, compressor.finish
+        elif encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self.compress, self.flush = compressor.compress, compressor.flush
+        else:
+            raise ValueError(f"Content encoding {encoding} is not supported.")
+
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    """
+    Compress data with the content encoding gzip, br or zstd.
+    :param level: compression level. None uses a fast default of the encoding.
+    """
+    compressor = _Compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: int = None) -> Iterator[bytes]:
+    """
+    Compress the chunks while they are iterated. Only the compressed output of one chunk is held in memory.
+    """
+    compressor = _Compressor(encoding, level)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_chunks(data: bytes, chunk_size: int = _STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
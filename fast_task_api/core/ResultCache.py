@@ -0,0 +1,118 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Union, Tuple
+
+from fast_task_api.compatibility.upload import is_param_media_toolkit_file, iter_media_file_chunks, media_file_size
+from fast_task_api.core.ResultRetention import estimate_size
+
+
+def _update_hash(hasher, value, _depth: int = 0) -> bool:
+    """
+    Feed a job parameter into the hasher. Each value is prefixed with its type, so that for example 1 and "1" differ.
+    :return: False if the value can't be hashed stably. Then the job is not cached.
+    """
+    if _depth > 16:
+        return False
+    if value is None or isinstance(value, (bool, int, float, str)):
+        hasher.update(f"{type(value).__name__}:{value!r};".encode())
+        return True
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        hasher.update(f"bytes:{len(value)}:".encode())
+        hasher.update(value)
+        return True
+    if is_param_media_toolkit_file(value):
+        # uploads are hashed by content. The file name doesn't change the result of the task.
+        hasher.update(f"{type(value).__name__}:{media_file_size(value)}:".encode())
+        for chunk in iter_media_file_chunks(value):
+            hasher.update(chunk)
+        return True
+    if hasattr(value, "tobytes") and hasattr(value, "dtype") and hasattr(value, "shape"):
+        hasher.update(f"array:{value.dtype}:{value.shape}:".encode())
+        hasher.update(value.tobytes())
+        return True
+    if isinstance(value, dict):
+        hasher.update(f"dict:{len(value)}:".encode())
+        for key in sorted(value, key=repr):
+            if not _update_hash(hasher, key, _depth + 1) or not _update_hash(hasher, value[key], _depth + 1):
+                return False
+        return True
+    if isinstance(value, (list, tuple)):
+        hasher.update(f"{type(value).__name__}:{len(value)}:".encode())
+        return all(_update_hash(hasher, item, _depth + 1) for item in value)
+    return False
+
+
+def hash_params(function_name: str, params: Union[dict, None]) -> Union[str, None]:
+    """
+    Stable hash of a job: the same function with equal parameters gets the same key across requests and restarts.
+    :return: the hex digest or None if a parameter can't be hashed.
+    """
+    hasher = hashlib.blake2b(digest_size=32)
+    hasher.update(function_name.encode())
+    if not _update_hash(hasher, params or {}):
+        return None
+    return hasher.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache of the results of a task function, keyed by hash_params.
+    - ttl: seconds a result is served from the cache.
+    - max_bytes: maximum estimated size of all cached results. Least recently used results are evicted first.
+    """
+    def __init__(self, ttl: Union[float, None] = 3600, max_bytes: Union[int, None] = 256 * 1024 ** 2):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # {key: (result, estimated size, monotonic expiry time)} in LRU order
+        self.stored_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0  # requests attached to an identical job which was still running
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Tuple[bool, object]:
+        """
+        :return: (found, result). A cached result can be None, thus found tells if it was a hit.
+        """
+        entry = self._entries.get(key, None)
+        if entry is not None and entry[2] < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[0]
+
+    def put(self, key: str, result) -> None:
+        self._remove(key)
+        size = estimate_size(result)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._entries[key] = (result, size, expires_at)
+        self.stored_bytes += size
+        while self.max_bytes is not None and self.stored_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.stored_bytes -= entry[1]
+
+    def get_stats(self) -> dict:
+        return {
+            "cached_results": len(self._entries),
+            "cached_bytes": self.stored_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "deduplicated": self.deduplicated,
+            "evictions": self.evictions,
+            "ttl": self.ttl,
+            "max_bytes": self.max_bytes
+        }
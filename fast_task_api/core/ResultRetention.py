@@ -0,0 +1,143 @@
+import sys
+import time
+from collections import OrderedDict, Counter
+from typing import Union, List
+
+from fast_task_api.compatibility.upload import is_param_media_toolkit_file, media_file_size
+
+
+def estimate_size(obj, _depth: int = 0) -> int:
+    """
+    Estimate the memory footprint of a job result in bytes.
+    Media files, bytes, strings and numpy arrays are measured by their payload. Containers are summed up.
+    """
+    if obj is None:
+        return 0
+    if is_param_media_toolkit_file(obj) and hasattr(obj, "file_size"):
+        try:
+            return media_file_size(obj)
+        except Exception:
+            return sys.getsizeof(obj)
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if _depth < 3:
+        if isinstance(obj, dict):
+            return sys.getsizeof(obj) + sum(estimate_size(v, _depth + 1) for v in obj.values())
+        if isinstance(obj, (list, tuple, set)):
+            return sys.getsizeof(obj) + sum(estimate_size(v, _depth + 1) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class ResultRetention:
+    """
+    Decides how long finished jobs are kept in memory.
+    - ttl: seconds a result is kept after the job finished.
+    - max_results: maximum number of finished jobs kept in memory.
+    - memory_budget: maximum estimated size in bytes of all kept results.
+    If max_results or memory_budget are exceeded, the least recently used results are evicted first.
+    """
+    def __init__(
+            self,
+            ttl: Union[float, None] = 3600,
+            max_results: Union[int, None] = 10000,
+            memory_budget: Union[int, None] = 1024 ** 3,
+            remember_evicted: int = 100000
+    ):
+        """
+        :param remember_evicted: number of evicted job ids remembered to tell clients that their result expired.
+        """
+        self.ttl = ttl
+        self.max_results = max_results
+        self.memory_budget = memory_budget
+        self.remember_evicted = remember_evicted
+
+        self._finished_at = OrderedDict()  # {job_id: monotonic finish time} in finish order. Used for the ttl.
+        self._lru = OrderedDict()  # {job_id: estimated size} in least recently used order
+        self.stored_bytes = 0
+
+        self._evicted = OrderedDict()  # {job_id: reason} of the last evicted jobs
+        self.evicted_count = Counter()  # {reason: count}
+        self.evicted_bytes = 0
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._lru
+
+    def add(self, job_id: str, result) -> None:
+        if job_id in self._lru:
+            return
+        size = estimate_size(result)
+        self._finished_at[job_id] = time.monotonic()
+        self._lru[job_id] = size
+        self.stored_bytes += size
+
+    def touch(self, job_id: str) -> None:
+        """
+        Mark the result as recently used.
+        """
+        if job_id in self._lru:
+            self._lru.move_to_end(job_id)
+
+    def remove(self, job_id: str, reason: str) -> None:
+        size = self._lru.pop(job_id, None)
+        if size is None:
+            return
+        self._finished_at.pop(job_id, None)
+        self.stored_bytes -= size
+
+        self._evicted[job_id] = reason
+        if len(self._evicted) > self.remember_evicted:
+            self._evicted.popitem(last=False)
+        self.evicted_count[reason] += 1
+        self.evicted_bytes += size
+
+    def evict(self) -> List[str]:
+        """
+        Apply the retention policy.
+        :return: the ids of the evicted jobs. The caller needs to remove them from its job store.
+        """
+        evicted = []
+        if self.ttl is not None:
+            expired_before = time.monotonic() - self.ttl
+            while self._finished_at:
+                job_id, finished_at = next(iter(self._finished_at.items()))
+                if finished_at > expired_before:
+                    break
+                self.remove(job_id, reason="ttl")
+                evicted.append(job_id)
+
+        while self.max_results is not None and len(self._lru) > self.max_results:
+            job_id = next(iter(self._lru))
+            self.remove(job_id, reason="max_results")
+            evicted.append(job_id)
+
+        while self.memory_budget is not None and self.stored_bytes > self.memory_budget and self._lru:
+            job_id = next(iter(self._lru))
+            self.remove(job_id, reason="memory_budget")
+            evicted.append(job_id)
+
+        return evicted
+
+    def seconds_until_next_expiry(self) -> Union[float, None]:
+        if self.ttl is None or not self._finished_at:
+            return None
+        finished_at = next(iter(self._finished_at.values()))
+        return max(0.0, finished_at + self.ttl - time.monotonic())
+
+    def eviction_reason(self, job_id: str) -> Union[str, None]:
+        """
+        :return: why the job was removed from memory. None if the job was never evicted or is long forgotten.
+        """
+        return self._evicted.get(job_id, None)
+
+    def get_stats(self) -> dict:
+        return {
+            "stored_results": len(self._lru),
+            "stored_result_bytes": self.stored_bytes,
+            "evicted_results": dict(self.evicted_count),
+            "evicted_result_bytes": self.evicted_bytes,
+            "ttl": self.ttl,
+            "max_results": self.max_results,
+            "memory_budget": self.memory_budget
+        }
@@ -0,0 +1,50 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class WorkerThreadPool:
+    """
+    Executes the jobs of sync task functions in daemon worker threads.
+    Unlike the workers of a ThreadPoolExecutor, the workers are not joined when the interpreter exits. A thread
+    can't be killed, a job which exceeded its timeout would otherwise block the exit of the server until it returns.
+    Workers are started on demand, up to max_workers. Further jobs wait until a worker is free.
+    """
+    def __init__(self, max_workers: int, thread_name_prefix: str = "fast_task_api_worker"):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._work = queue.SimpleQueue()
+        self._threads = []
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+
+    def submit(self, fn: callable, *args) -> Future:
+        """
+        Execute fn(*args) in a worker thread.
+        :return: a concurrent.futures.Future which is resolved with the result of fn.
+        """
+        # an idle worker picks the job up. Otherwise a new worker is started if the limit allows it.
+        # The worker is started first: if that fails (at interpreter shutdown), the job isn't queued either.
+        if not self._idle.acquire(blocking=False):
+            with self._lock:
+                if len(self._threads) < self.max_workers:
+                    thread = threading.Thread(
+                        target=self._work_loop, name=f"{self.thread_name_prefix}_{len(self._threads)}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+        future = Future()
+        self._work.put((future, fn, args))
+        return future
+
+    def _work_loop(self):
+        while True:
+            future, fn, args = self._work.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            # the job is done. Don't keep its result alive while waiting for the next one.
+            del future, fn, args
+            self._idle.release()
@@ -0,0 +1,35 @@
+import threading
+from collections import deque
+from itertools import islice
+from typing import Tuple
+
+
+class ChunkBuffer:
+    """
+    Bounded buffer for the chunks yielded by generator task functions.
+    Chunks are numbered in the order they were yielded. Clients read them with a cursor: the number of the first
+    chunk they haven't seen yet. If the buffer is full, the oldest chunks are dropped.
+    """
+    def __init__(self, max_chunks: int = 1000):
+        self._chunks = deque(maxlen=max_chunks)
+        self.total = 0  # number of chunks yielded so far. Cursor after the last chunk.
+        self._lock = threading.Lock()
+
+    def append(self, chunk):
+        with self._lock:
+            self._chunks.append(chunk)
+            self.total += 1
+
+    def since(self, cursor: int = 0) -> Tuple[list, int]:
+        """
+        :return: (chunks, next_cursor). The chunks from cursor on which are still in the buffer.
+            If chunks were dropped, the returned chunks start at the oldest chunk in the buffer.
+        """
+        with self._lock:
+            first = self.total - len(self._chunks)
+            start = max(cursor, first)
+            return list(islice(self._chunks, start - first, None)), self.total
+
+    def to_list(self) -> list:
+        with self._lock:
+            return list(self._chunks)
@@ -1,8 +1,11 @@
+import itertools
+import time
 from datetime import datetime, timedelta
-from typing import Union
+from typing import Union, Tuple
 from uuid import uuid4
 from enum import Enum
 
+from fast_task_api.core.job.ChunkBuffer import ChunkBuffer
 from fast_task_api.core.job.JobProgress import JobProgress
 
 
@@ -14,6 +17,26 @@ class JOB_STATUS(Enum):
     TIMEOUT = "Timeout"
 
 
+class JOB_PRIORITY(Enum):
+    # jobs of a higher priority class are always started before queued jobs of a lower one
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+
+# sequence numbers of job changes across all jobs. next() of itertools.count is atomic in CPython.
+# The count starts at the microseconds since the epoch: the numbers of a restarted server are larger than the ones of
+# the jobs it loads from the job store, unless the previous server changed more than a million jobs per second.
+_change_counter = itertools.count(time.time_ns() // 1000)
+
+
+def next_change_seq() -> int:
+    """
+    A sequence number larger than the change_seq of every job changed so far. Used as cursor for changed jobs.
+    """
+    return next(_change_counter)
+
+
 class PROVIDERS(Enum):
     RUNPOD = "runpod"
     OPENAI = "openai"
@@ -25,33 +48,108 @@ class InternalJob:
             self,
             job_function: callable,
             job_params: Union[dict, None],
-            timeout: int = 3600
+            timeout: int = 3600,
+            priority: JOB_PRIORITY = JOB_PRIORITY.NORMAL
     ):
         """
         Internal Job object to keep track of the job status and relevant information.
         :job_function (callable): The function to execute
         :job_params (dict): Parameters for the request
-        :timeout (int): Timeout in seconds. If none timeout is set to one year.
+        :timeout (int): Timeout in seconds of the execution. If none timeout is set to one year.
+        :priority (JOB_PRIORITY): Priority class of the job in the queue.
         """
 
         self.id = str(uuid4())
         self.job_function = job_function
+        # jobs loaded from a persistent job store have no job_function until the function is registered again
+        self.job_function_name = job_function.__name__ if job_function is not None else None
         self.job_params: Union[dict, None] = job_params
         self.status: JOB_STATUS = JOB_STATUS.QUEUED
-        self.job_progress = JobProgress()
+        self.priority: JOB_PRIORITY = priority
+        # callables which are notified on status and progress updates. For example by clients waiting for the job.
+        self._listeners = []
+        self.job_progress = JobProgress(on_update=self.notify_listeners)
+        # sequence number of the last change of status, progress or chunks. See next_change_seq.
+        self.change_seq = next_change_seq()
+
+        # hash of the job function and parameters if results of the function are cached
+        self.cache_key: Union[str, None] = None
 
         self.result = None
+        # chunks yielded so far if the job function is a generator
+        self.chunks: Union[ChunkBuffer, None] = None
+        # profile modes ("cpu", "memory") if the execution of the job is profiled
+        self.profile: Union[Tuple[str, ...], None] = None
 
-        # timeout used to kill long running jobs in the queue
-        if timeout is not None:
-            self.time_out_at = datetime.utcnow() + timedelta(seconds=timeout)
-        else:
-            # set timeout to one year avoids other none checks
-            self.time_out_at = datetime.utcnow() + timedelta(days=365)
+        # timeout used to kill long running jobs in the queue. The deadline is set again when the execution starts,
+        # the time the job waited in the queue doesn't count.
+        self.set_timeout(timeout)
 
         # statistics
         self.created_at = datetime.utcnow()
         self.queued_at = None
         self.execution_started_at = None
         self.execution_finished_at = None
+        # cached string representations for the JobResult, see formatted_timestamps
+        self._formatted_timestamps = None
+        # (options, bytes, {content encoding: compressed bytes}) of the serialized JobResult of the finished job.
+        # Set by JobResultFactory.to_json.
+        self.encoded_result = None
 
+    def set_timeout(self, timeout: Union[float, None]):
+        """
+        Set time_out_at to timeout seconds from now. If timeout is None, the job has no deadline.
+        """
+        self.timeout = timeout
+        if timeout is not None:
+            self.time_out_at = datetime.utcnow() + timedelta(seconds=timeout)
+        else:
+            # set timeout to one year avoids other none checks
+            self.time_out_at = datetime.utcnow() + timedelta(days=365)
+
+    def formatted_timestamps(self) -> Tuple[Union[str, None], ...]:
+        """
+        created_at, queued_at, execution_started_at and execution_finished_at formatted as strings.
+        They are cached, because a job is usually polled far more often than its timestamps change.
+        """
+        timestamps = (self.created_at, self.queued_at, self.execution_started_at, self.execution_finished_at)
+        if self._formatted_timestamps is None or self._formatted_timestamps[0] != timestamps:
+            formatted = tuple(t.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if t else None for t in timestamps)
+            self._formatted_timestamps = (timestamps, formatted)
+        return self._formatted_timestamps[1]
+
+    def add_listener(self, listener: callable):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: callable):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def notify_listeners(self):
+        """
+        Call the listeners. They are called in the thread that updated the job and thus need to be thread-safe.
+        """
+        self.change_seq = next_change_seq()
+        for listener in list(self._listeners):
+            listener()
+
+    @property
+    def queue_wait_time(self) -> Union[float, None]:
+        """
+        Seconds the job waited in the queue until a worker started executing it.
+        If the job is still waiting, the time waited so far is returned.
+        """
+        if self.queued_at is None:
+            return None
+        started_at = self.execution_started_at if self.execution_started_at is not None else datetime.utcnow()
+        return (started_at - self.queued_at).total_seconds()
+
+    @property
+    def execution_time(self) -> Union[float, None]:
+        """
+        Seconds the job function was executing. If the job is still running, the time elapsed so far is returned.
+        """
+        if self.execution_started_at is None:
+            return None
+        finished_at = self.execution_finished_at if self.execution_finished_at is not None else datetime.utcnow()
+        return (finished_at - self.execution_started_at).total_seconds()
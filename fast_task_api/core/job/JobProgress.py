@@ -1,16 +1,20 @@
 class JobProgress:
-    def __init__(self, progress: float = 0, message: str = None):
+    def __init__(self, progress: float = 0, message: str = None, on_update: callable = None):
         """
         Used to display _progress of a job while executing.
         :param progress: value between 0 and 1.0
         :param message: message to deliver to client.
+        :param on_update: called without arguments after each set_status. Used to wake up waiting clients.
         """
         self._progress = progress
         self._message = message
+        self._on_update = on_update
 
     def set_status(self, progress: float, message: str):
         self._progress = progress
         self._message = message
+        if self._on_update is not None:
+            self._on_update()
 
 
 class JobProgressRunpod(JobProgress):
@@ -1,17 +1,51 @@
-import gzip
-from io import BytesIO
-from typing import Optional, Union, Any
+import json
+from typing import Optional, Union, Any, List
 
 from pydantic import BaseModel
-from fast_task_api.compatibility.upload import is_param_media_toolkit_file
+from fast_task_api.compatibility.upload import is_param_media_toolkit_file, media_file_size
 from fast_task_api.core.job import InternalJob
 from fast_task_api.core.job.InternalJob import JOB_STATUS
+from fast_task_api.core.ResponseCompression import compress
+from fast_task_api.settings import FTAPI_COMPRESSION_LEVEL
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# serialized results of finished jobs up to this size are kept with the job for the following polls
+_MAX_ENCODED_RESULT_BYTES = 1024 * 1024
+
+
+def _to_jsonable(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", by_alias=True)
+    # imported on first use, so that runpod workers don't load fastapi
+    from fastapi.encoders import jsonable_encoder
+    return jsonable_encoder(value)
+
+
+def dumps(value) -> bytes:
+    """
+    Serialize to compact json. Uses orjson if it is installed and falls back to the json module.
+    Values the encoders don't support natively, like pydantic models, are converted like FastAPI does.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=_to_jsonable, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # for example integers larger than 64 bit
+            pass
+    return json.dumps(value, default=_to_jsonable, separators=(",", ":")).encode("utf-8")
 
 
 class FileResult(BaseModel):
     file_name: str
     content_type: str
-    content: str  # base64 encoded
+    content: Optional[str] = None  # base64 encoded
+    # set instead of content for large files: the raw bytes are downloaded from this url
+    url: Optional[str] = None
+    size: Optional[int] = None
 
 
 class JobResult(BaseModel):
@@ -24,6 +58,9 @@ class JobResult(BaseModel):
     progress: Optional[float] = 0.0
     message: Optional[str] = None
     result: Union[FileResult, Any, str, None] = None
+    # partial results of generator task functions since the requested cursor and the cursor for the next request
+    chunks: Optional[List[Union[FileResult, Any]]] = None
+    cursor: Optional[int] = None
     refresh_job_url: Optional[str] = None
 
     created_at: Optional[str] = None
@@ -34,20 +71,53 @@ class JobResult(BaseModel):
     endpoint_protocol: Optional[str] = "socaity"
 
 
+class JobStatusQuery(BaseModel):
+    """
+    Request of POST /jobs: the status of many jobs at once.
+    - cursor: the cursor of the previous response. Only the jobs which changed since then are returned.
+      Ignored with a shared job store.
+    """
+    job_ids: List[str]
+    cursor: Optional[int] = None
+    keep_in_memory: bool = False
+
+
+class JobStatusList(BaseModel):
+    """
+    Response of POST /jobs. Pass the cursor with the next request to only get the jobs which changed meanwhile.
+    """
+    cursor: int
+    jobs: List[JobResult]
+
+
 class JobResultFactory:
 
     @staticmethod
-    def from_internal_job(ij: InternalJob) -> JobResult:
-        format_date = lambda date: date.strftime("%Y-%m-%dT%H:%M:%S.%f%z") if date else None
-        created_at = format_date(ij.created_at)
-        queued_at = format_date(ij.queued_at)
-        execution_started_at = format_date(ij.execution_started_at)
-        execution_finished_at = format_date(ij.execution_finished_at)
+    def from_internal_job(ij: InternalJob, cursor: int = 0, inline_max_bytes: int = None) -> JobResult:
+        """
+        :param cursor: for generator jobs, only the chunks from this cursor on are returned.
+        :param inline_max_bytes: file results larger than this are returned as url of the result endpoint
+            instead of base64 content. None always inlines the content.
+        """
+        created_at, queued_at, execution_started_at, execution_finished_at = ij.formatted_timestamps()
 
         # if the internal job returned a media-toolkit file, convert it to a json serializable FileResult
         result = ij.result
         if is_param_media_toolkit_file(ij.result):
-            result = FileResult(**result.to_json())
+            if JobResultFactory.is_result_served_by_url(ij, inline_max_bytes):
+                result = FileResult(
+                    file_name=result.file_name,
+                    content_type=result.content_type,
+                    url=f"/job/{ij.id}/result",
+                    size=media_file_size(result)
+                )
+            else:
+                result = FileResult(**result.to_json())
+
+        chunks, next_cursor = None, None
+        if ij.chunks is not None:
+            chunks, next_cursor = ij.chunks.since(cursor)
+            chunks = [FileResult(**c.to_json()) if is_param_media_toolkit_file(c) else c for c in chunks]
 
         # Job_status is an Enum, convert it to a string to return it as json
         status = ij.status
@@ -60,6 +130,8 @@ class JobResultFactory:
             progress=ij.job_progress._progress,
             message=ij.job_progress._message,
             result=result,
+            chunks=chunks,
+            cursor=next_cursor,
             created_at=created_at,
             queued_at=queued_at,
             execution_started_at=execution_started_at,
@@ -67,21 +139,118 @@ class JobResultFactory:
         )
 
     @staticmethod
-    def gzip_job_result(job_result: JobResult) -> bytes:
-        job_result_bytes = job_result.json().encode('utf-8')
-        # Compress the serialized bytes with gzip
-        gzip_buffer = BytesIO()
-        with gzip.GzipFile(fileobj=gzip_buffer, mode='wb') as gzip_file:
-            gzip_file.write(job_result_bytes)
+    def _file_result_dict(media_file, url: str = None) -> dict:
+        if url is not None:
+            return {"file_name": media_file.file_name, "content_type": media_file.content_type, "content": None,
+                    "url": url, "size": media_file_size(media_file)}
+        return {**media_file.to_json(), "url": None, "size": None}
+
+    @staticmethod
+    def to_dict(ij: InternalJob, cursor: int = 0, inline_max_bytes: int = None) -> dict:
+        """
+        Like from_internal_job, but returns the fields of the JobResult as a plain dict without validation.
+        """
+        created_at, queued_at, execution_started_at, execution_finished_at = ij.formatted_timestamps()
+        result = ij.result
+        if is_param_media_toolkit_file(result):
+            url = f"/job/{ij.id}/result" if JobResultFactory.is_result_served_by_url(ij, inline_max_bytes) else None
+            result = JobResultFactory._file_result_dict(result, url)
+
+        chunks, next_cursor = None, None
+        if ij.chunks is not None:
+            chunks, next_cursor = ij.chunks.since(cursor)
+            chunks = [
+                JobResultFactory._file_result_dict(c) if is_param_media_toolkit_file(c) else c
+                for c in chunks
+            ]
+
+        status = ij.status
+        return {
+            "id": ij.id,
+            "status": status.value if isinstance(status, JOB_STATUS) else status,
+            "progress": ij.job_progress._progress,
+            "message": ij.job_progress._message,
+            "result": result,
+            "chunks": chunks,
+            "cursor": next_cursor,
+            "refresh_job_url": f"/job?job_id={ij.id}",
+            "created_at": created_at,
+            "queued_at": queued_at,
+            "execution_started_at": execution_started_at,
+            "execution_finished_at": execution_finished_at,
+            "endpoint_protocol": "socaity"
+        }
+
+    @staticmethod
+    def to_json(ij: InternalJob, cursor: int = 0, inline_max_bytes: int = None, finished: bool = False) -> bytes:
+        """
+        Serialize the JobResult of the job to json without building the pydantic model.
+        :param finished: the job is finished and won't change anymore. Then the serialized bytes are kept with the
+            job and returned again by the following calls with the same cursor and inline_max_bytes.
+        """
+        options = (cursor, inline_max_bytes)
+        encoded = ij.encoded_result
+        if finished and encoded is not None and encoded[0] == options:
+            return encoded[1]
+
+        encoded_bytes = dumps(JobResultFactory.to_dict(ij, cursor=cursor, inline_max_bytes=inline_max_bytes))
+        if finished and len(encoded_bytes) <= _MAX_ENCODED_RESULT_BYTES:
+            ij.encoded_result = (options, encoded_bytes, {})
+        return encoded_bytes
+
+    @staticmethod
+    def compressed_cache(ij: InternalJob, encoded_bytes: bytes) -> Union[dict, None]:
+        """
+        The compressed variants of the json returned by to_json, if it is kept with the finished job.
+        :return: dict {content encoding: compressed bytes} to read and fill or None.
+        """
+        encoded = ij.encoded_result
+        if encoded is not None and encoded[1] is encoded_bytes:
+            return encoded[2]
+        return None
 
-        # Retrieve the gzipped data
-        return gzip_buffer.getvalue()
+    @staticmethod
+    def is_result_served_by_url(ij: InternalJob, inline_max_bytes: int = None) -> bool:
+        """
+        True if the result of the job is a file which is too large to be inlined into the json of the job.
+        """
+        return (
+            inline_max_bytes is not None
+            and is_param_media_toolkit_file(ij.result)
+            and media_file_size(ij.result) > inline_max_bytes
+        )
 
+    @staticmethod
+    def gzip_job_result(job_result: Union[JobResult, bytes]) -> bytes:
+        """
+        The job result as gzip file. For return_format="gzipped" of the /job endpoint.
+        :param job_result: the JobResult or its json.
+        """
+        if isinstance(job_result, JobResult):
+            job_result = dumps(job_result)
+        return compress(job_result, "gzip", FTAPI_COMPRESSION_LEVEL)
 
     @staticmethod
     def job_not_found(job_id: str) -> JobResult:
         return JobResult(
             id=job_id,
-            status=JOB_STATUS.FAILED,
+            status=JOB_STATUS.FAILED.value,
             message="Job not found.",
         )
+
+    @staticmethod
+    def job_expired(job_id: str, reason: str) -> JobResult:
+        """
+        The job existed, but it was removed from memory by the result retention.
+        :param reason: ttl, max_results, memory_budget or retrieved
+        """
+        if reason == "retrieved":
+            message = ("Job result was already retrieved and removed from memory. "
+                       "Use keep_in_memory=True to retrieve a result multiple times.")
+        else:
+            message = f"Job result expired and was removed from memory (reason: {reason})."
+        return JobResult(
+            id=job_id,
+            status=JOB_STATUS.FAILED.value,
+            message=message,
+        )
@@ -0,0 +1,16 @@
+from starlette.responses import Response
+
+from fast_task_api.core.job.JobResult import dumps
+
+
+class JobResultResponse(Response):
+    """
+    Response for JobResults which are already serialized with JobResultFactory.to_json.
+    FastAPI's validation and serialization of the response model is skipped.
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
@@ -0,0 +1,52 @@
+import asyncio
+from typing import List
+
+from fast_task_api.core.job.InternalJob import InternalJob
+
+
+class JobSubscription:
+    """
+    Lets a coroutine wait for status and progress updates of a set of jobs.
+    Updates happen in worker threads. They are coalesced: no matter how often a job function calls set_status,
+    at most one wakeup is scheduled on the event loop until the subscriber consumed it.
+    Use it as context manager inside the event loop of the subscriber.
+    """
+    def __init__(self, jobs: List[InternalJob]):
+        self._jobs = jobs
+        self._loop = None
+        self._updated = None
+        self._wakeup_scheduled = False
+
+    def __enter__(self):
+        self._loop = asyncio.get_running_loop()
+        self._updated = asyncio.Event()
+        for job in self._jobs:
+            job.add_listener(self._on_update)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for job in self._jobs:
+            job.remove_listener(self._on_update)
+
+    def _on_update(self):
+        if self._wakeup_scheduled:
+            return
+        self._wakeup_scheduled = True
+        try:
+            self._loop.call_soon_threadsafe(self._updated.set)
+        except RuntimeError:
+            pass  # the event loop of the subscriber was closed
+
+    async def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until one of the jobs was updated.
+        :return: False if the timeout passed without update.
+        """
+        try:
+            await asyncio.wait_for(self._updated.wait(), timeout=timeout)
+        except (asyncio.TimeoutError, TimeoutError):
+            return False
+        # reset before the subscriber reads the job states, so that later updates schedule a new wakeup
+        self._updated.clear()
+        self._wakeup_scheduled = False
+        return True
@@ -0,0 +1,21 @@
+from typing import List, Union
+
+from fast_task_api.core.job.InternalJob import InternalJob
+from fast_task_api.core.job_store.JobStore import JobStore
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Default job store. Jobs only live in the memory of the JobQueue and are lost on restart.
+    """
+    def save(self, job: InternalJob) -> None:
+        pass
+
+    def delete(self, job_id: str) -> None:
+        pass
+
+    def load(self, job_id: str) -> Union[InternalJob, None]:
+        return None
+
+    def load_unfinished(self) -> List[InternalJob]:
+        return []
@@ -0,0 +1,66 @@
+from typing import List, Union
+
+from fast_task_api.core.job.InternalJob import InternalJob
+
+
+class JobStore:
+    """
+    Persistence layer of the JobQueue.
+    The JobQueue keeps the live jobs in memory. The job store additionally saves their state, so that queued jobs
+    can be resumed and finished jobs can be retrieved after a restart of the server.
+    A shared job store is the job queue of multiple processes. Jobs are executed by the process which claims them.
+    """
+    shared = False
+    def save(self, job: InternalJob) -> None:
+        """
+        Save the current state of the job. Called when the job is queued and when it finished.
+        """
+        raise NotImplementedError("Implement in subclass")
+
+    def delete(self, job_id: str) -> None:
+        """
+        Delete a job. Called when its result was retrieved or expired.
+        """
+        raise NotImplementedError("Implement in subclass")
+
+    def load(self, job_id: str) -> Union[InternalJob, None]:
+        """
+        Load a job which is not in memory (anymore). The job_function of the loaded job is None.
+        """
+        raise NotImplementedError("Implement in subclass")
+
+    def load_unfinished(self) -> List[InternalJob]:
+        """
+        Load the jobs which were queued or processing when the server stopped, in the order they were queued.
+        Their job_function is None and job_function_name tells which function to resume them with.
+        """
+        raise NotImplementedError("Implement in subclass")
+
+    def enqueue(self, jobs: List[InternalJob], max_queued: int, reserved: int = 0) -> bool:
+        """
+        Atomically save the queued jobs of one function if the queued jobs of the function in all processes plus
+        the new jobs don't exceed max_queued. Only needed by shared job stores.
+        :param reserved: further jobs counted against max_queued, without being saved.
+        :return: False if the jobs don't fit. None of them is saved then.
+        :raises ValueError: if a job can't be stored, for example because its parameters are not serializable.
+            None of the jobs is saved then.
+        """
+        raise NotImplementedError("Implement in subclass")
+
+    def claim(self, function_names: List[str], limit: int, worker_id: str) -> List[InternalJob]:
+        """
+        Atomically mark up to limit queued jobs of the functions as processing by worker_id, highest priority and
+        oldest first. Each job is claimed by one worker only. Only needed by shared job stores.
+        Also called with limit 0 while the worker is busy, so that the store knows it is alive.
+        :return: the claimed jobs. Their job_function is None.
+        """
+        raise NotImplementedError("Implement in subclass")
+
+    def reset_after_fork(self) -> None:
+        """
+        Called in a forked server worker process before it uses the job store.
+        """
+        pass
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,401 @@
+import atexit
+import io
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import List, Union
+
+from fast_task_api.compatibility.upload import is_param_media_toolkit_file, iter_media_file_chunks
+from fast_task_api.core.job.ChunkBuffer import ChunkBuffer
+from fast_task_api.core.job.InternalJob import InternalJob, JOB_STATUS, JOB_PRIORITY
+from fast_task_api.core.job.JobProgress import JobProgress
+from fast_task_api.core.job_store.JobStore import JobStore
+
+_logger = logging.getLogger(__name__)
+
+_COLUMNS = (
+    "id", "function_name", "status", "priority", "params", "result", "chunks", "progress", "message",
+    "created_at", "queued_at", "execution_started_at", "execution_finished_at", "change_seq"
+)
+_FINISHED = (JOB_STATUS.FINISHED.value, JOB_STATUS.FAILED.value, JOB_STATUS.TIMEOUT.value)
+# the claimed_by column is only written by claim. Saving a job doesn't release its claim.
+_UPSERT = (
+    f"INSERT INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))}) "
+    f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in _COLUMNS[1:])}"
+)
+_PRIORITY_ORDER = "CASE priority " + " ".join(
+    f"WHEN '{priority.value}' THEN {rank}" for rank, priority in enumerate(JOB_PRIORITY)
+) + " END"
+
+
+def _media_file_from_bytes(media_file_type, file_name: str, content_type: str, content: bytes):
+    media_file = media_file_type(file_name=file_name, content_type=content_type)
+    return media_file.from_bytes(content)
+
+
+class _JobPickler(pickle.Pickler):
+    """
+    Pickles media-toolkit files by their content. The temporary file of a file-backed media file (spooled uploads)
+    can't be pickled. Restored media files keep their content in memory.
+    """
+    def reducer_override(self, obj):
+        if is_param_media_toolkit_file(obj) and hasattr(obj, "from_bytes"):
+            content = b"".join(iter_media_file_chunks(obj))
+            return _media_file_from_bytes, (type(obj), obj.file_name, obj.content_type, content)
+        return NotImplemented
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Persists the jobs in a SQLite database.
+    Writes don't happen in the calling thread. A writer thread commits them in groups every flush_interval seconds.
+    Multiple updates of a job in the same interval result in a single write. The database runs in WAL mode.
+    If the server crashes, the writes of the last flush_interval are lost.
+    Parameters and results are pickled. Jobs with unpicklable parameters can't be resumed and fail when they are
+    loaded. In a shared database they can't be queued at all.
+
+    With shared=True multiple processes (uvicorn workers, containers on the same volume) use the database as their
+    common job queue. Each process claims queued jobs atomically with claim. Processes send a heartbeat while
+    claiming. The jobs of a process which stopped sending heartbeats are queued again.
+    """
+    def __init__(
+            self,
+            path: str = "fast_task_api_jobs.db",
+            flush_interval: float = 0.05,
+            ttl: float = None,
+            shared: bool = False,
+            worker_timeout: float = 30,
+            delete_on_close: bool = False
+    ):
+        """
+        :param path: path of the database file.
+        :param flush_interval: seconds the writes are collected before they are committed together.
+        :param ttl: seconds finished jobs are kept in the database. None keeps them until they are retrieved.
+        :param shared: if the database is the job queue of multiple processes.
+        :param worker_timeout: seconds without heartbeat after which the processing jobs of a worker are queued again.
+        :param delete_on_close: delete the database files when the process which created the store closes it.
+            For temporary databases. Forked processes only close their connection.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.shared = shared
+        self.worker_timeout = worker_timeout
+        self.delete_on_close = delete_on_close
+        self._creator_pid = os.getpid()
+        self._open()
+        self._create_tables()
+        atexit.register(self.close)
+
+    def reset_after_fork(self):
+        # a SQLite connection must not be used in a forked process. The child opens its own.
+        self._open()
+
+    def _open(self):
+        # timeout: seconds to wait for the write lock of other processes
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._db_lock = threading.Lock()
+        self._last_purge = 0.0
+        self._last_heartbeat = 0.0
+
+        # writes waiting for the next flush. {job_id: snapshot of the job or None to delete it}
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._has_pending = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="fast_task_api_job_store", daemon=True)
+        self._writer.start()
+
+    def _create_tables(self):
+        with self._db_lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, function_name TEXT, status TEXT, priority TEXT, params BLOB, result BLOB, "
+                "chunks BLOB, progress REAL, message TEXT, created_at TEXT, queued_at TEXT, "
+                "execution_started_at TEXT, execution_finished_at TEXT, claimed_by TEXT, change_seq INTEGER)"
+            )
+            # databases created before jobs could be claimed or before their changes were numbered
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")]
+            if "claimed_by" not in columns:
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN claimed_by TEXT")
+            if "change_seq" not in columns:
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN change_seq INTEGER")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, heartbeat REAL)")
+            if self.shared:
+                # jobs which were processing in a not shared database have no worker to wait for
+                self._connection.execute(
+                    "UPDATE jobs SET status = ? WHERE status = ? AND claimed_by IS NULL",
+                    (JOB_STATUS.QUEUED.value, JOB_STATUS.PROCESSING.value)
+                )
+
+    @staticmethod
+    def _snapshot(job: InternalJob) -> dict:
+        finished = job.status.value in _FINISHED
+        return {
+            "id": job.id,
+            "function_name": job.job_function_name,
+            "status": job.status.value,
+            "priority": job.priority.value,
+            # the parameters are only needed to resume unfinished jobs. The JobProgress injected into the parameters
+            # of a running job is not a parameter of the request. It is injected again when the job is resumed.
+            "params": None if finished or job.job_params is None else {
+                name: value for name, value in job.job_params.items() if not isinstance(value, JobProgress)
+            },
+            "result": job.result,
+            "chunks": job.chunks.to_list() if job.chunks is not None else None,
+            "progress": job.job_progress._progress,
+            "message": job.job_progress._message,
+            "created_at": job.created_at,
+            "queued_at": job.queued_at,
+            "execution_started_at": job.execution_started_at,
+            "execution_finished_at": job.execution_finished_at,
+            "change_seq": job.change_seq
+        }
+
+    def save(self, job: InternalJob) -> None:
+        snapshot = self._snapshot(job)
+        with self._pending_lock:
+            self._pending[job.id] = snapshot
+            self._has_pending.set()
+
+    def delete(self, job_id: str) -> None:
+        with self._pending_lock:
+            self._pending[job_id] = None
+            self._has_pending.set()
+
+    def _write_loop(self):
+        while not self._closed:
+            self._has_pending.wait()
+            # collect the writes of this interval to commit them in one transaction
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                print(traceback.format_exc())
+
+    @staticmethod
+    def _dumps(value) -> Union[bytes, None]:
+        if value is None:
+            return None
+        buffer = io.BytesIO()
+        _JobPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(value)
+        return buffer.getvalue()
+
+    def _to_row(self, snapshot: dict, strict: bool = False) -> tuple:
+        """
+        :param strict: raise a ValueError if the parameters are not picklable. Otherwise the job is stored without
+            parameters and fails when it is resumed.
+        """
+        row = dict(snapshot)
+        for column in ("params", "result", "chunks"):
+            try:
+                row[column] = self._dumps(row[column])
+            except Exception as e:
+                if column == "params" and strict:
+                    raise ValueError(f"Its parameters are not picklable: {e}") from e
+                _logger.warning(f"The {column} of job {row['id']} are not persisted. They are not picklable: {e}")
+                row[column] = None
+        for column in ("created_at", "queued_at", "execution_started_at", "execution_finished_at"):
+            row[column] = row[column].isoformat() if row[column] is not None else None
+        return tuple(row[column] for column in _COLUMNS)
+
+    def flush(self) -> None:
+        """
+        Commit the pending writes. Returns after they are committed, also if the writer thread is flushing them.
+        """
+        with self._db_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                self._has_pending.clear()
+            if not pending or self._closed:
+                return
+
+            rows = [self._to_row(snapshot) for snapshot in pending.values() if snapshot is not None]
+            deletes = [(job_id,) for job_id, snapshot in pending.items() if snapshot is None]
+
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany(_UPSERT, rows)
+                self._connection.executemany("DELETE FROM jobs WHERE id = ?", deletes)
+                self._purge_expired()
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    def _purge_expired(self):
+        # at most once a minute. Needs to be called with the db lock held.
+        if self.ttl is None or time.monotonic() - self._last_purge < 60:
+            return
+        self._last_purge = time.monotonic()
+        expired_before = (datetime.utcnow() - timedelta(seconds=self.ttl)).isoformat()
+        self._connection.execute(
+            f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(_FINISHED))}) AND execution_finished_at < ?",
+            (*_FINISHED, expired_before)
+        )
+
+    @staticmethod
+    def _to_job(values: dict) -> InternalJob:
+        job = InternalJob(job_function=None, job_params=values["params"])
+        job.id = values["id"]
+        job.job_function_name = values["function_name"]
+        job.status = JOB_STATUS(values["status"])
+        job.priority = JOB_PRIORITY(values["priority"])
+        job.result = values["result"]
+        if values["chunks"] is not None:
+            job.chunks = ChunkBuffer(max_chunks=max(1, len(values["chunks"])))
+            for chunk in values["chunks"]:
+                job.chunks.append(chunk)
+        job.job_progress._progress = values["progress"]
+        job.job_progress._message = values["message"]
+        for column in ("created_at", "queued_at", "execution_started_at", "execution_finished_at"):
+            setattr(job, column, values[column])
+        # a loaded job didn't change. Jobs of databases without change_seq keep the new one.
+        if values["change_seq"] is not None:
+            job.change_seq = values["change_seq"]
+        return job
+
+    def _from_row(self, row: tuple) -> InternalJob:
+        values = dict(zip(_COLUMNS, row))
+        for column in ("params", "result", "chunks"):
+            values[column] = pickle.loads(values[column]) if values[column] is not None else None
+        for column in ("created_at", "queued_at", "execution_started_at", "execution_finished_at"):
+            values[column] = datetime.fromisoformat(values[column]) if values[column] is not None else None
+        return self._to_job(values)
+
+    def load(self, job_id: str) -> Union[InternalJob, None]:
+        with self._pending_lock:
+            if job_id in self._pending:
+                snapshot = self._pending[job_id]
+                return self._to_job(snapshot) if snapshot is not None else None
+
+        with self._db_lock:
+            row = self._connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._from_row(row) if row is not None else None
+
+    def load_unfinished(self) -> List[InternalJob]:
+        self.flush()
+        with self._db_lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY queued_at",
+                (JOB_STATUS.QUEUED.value, JOB_STATUS.PROCESSING.value)
+            ).fetchall()
+
+        jobs = []
+        for row in rows:
+            try:
+                jobs.append(self._from_row(row))
+            except Exception:
+                print(f"Job {row[0]} can't be resumed: {traceback.format_exc()}")
+        return jobs
+
+    def enqueue(self, jobs: List[InternalJob], max_queued: int, reserved: int = 0) -> bool:
+        if len(jobs) == 0:
+            return reserved <= max_queued
+        # the jobs are only executed by the process which claims them. Jobs without parameters can't be executed.
+        rows = [self._to_row(self._snapshot(job), strict=True) for job in jobs]
+        with self._db_lock:
+            # BEGIN IMMEDIATE takes the write lock of the database. The count stays valid until the jobs are inserted,
+            # concurrent submissions of other processes can't exceed max_queued.
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                queued = self._connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND function_name = ?",
+                    (JOB_STATUS.QUEUED.value, jobs[0].job_function_name)
+                ).fetchone()[0]
+                if queued + len(jobs) + reserved > max_queued:
+                    self._connection.execute("ROLLBACK")
+                    return False
+                self._connection.executemany(_UPSERT, rows)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return True
+
+    def claim(self, function_names: List[str], limit: int, worker_id: str) -> List[InternalJob]:
+        now = time.time()
+        heartbeat_due = now - self._last_heartbeat >= self.worker_timeout / 5
+        function_names = list(function_names) if limit > 0 else []
+        names = ', '.join('?' * len(function_names))
+        with self._db_lock:
+            # cheap read first. Most of the time there is nothing to claim and the write lock is not needed.
+            has_queued = bool(function_names) and self._connection.execute(
+                f"SELECT 1 FROM jobs WHERE status = ? AND function_name IN ({names}) LIMIT 1",
+                (JOB_STATUS.QUEUED.value, *function_names)
+            ).fetchone() is not None
+            if not has_queued and not heartbeat_due:
+                return []
+
+            # BEGIN IMMEDIATE takes the write lock of the database. No other process can claim the same jobs.
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                if heartbeat_due:
+                    self._heartbeat(worker_id, now)
+                rows = []
+                ids = [] if not has_queued else [row[0] for row in self._connection.execute(
+                    f"SELECT id FROM jobs WHERE status = ? AND function_name IN ({names}) "
+                    f"ORDER BY {_PRIORITY_ORDER}, queued_at LIMIT ?",
+                    (JOB_STATUS.QUEUED.value, *function_names, limit)
+                )]
+                if ids:
+                    placeholders = ', '.join('?' * len(ids))
+                    self._connection.execute(
+                        f"UPDATE jobs SET status = ?, claimed_by = ? WHERE id IN ({placeholders})",
+                        (JOB_STATUS.PROCESSING.value, worker_id, *ids)
+                    )
+                    rows = self._connection.execute(
+                        f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id IN ({placeholders}) "
+                        f"ORDER BY {_PRIORITY_ORDER}, queued_at",
+                        ids
+                    ).fetchall()
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+
+        jobs = []
+        for row in rows:
+            try:
+                jobs.append(self._from_row(row))
+            except Exception:
+                print(f"Job {row[0]} can't be executed: {traceback.format_exc()}")
+        return jobs
+
+    def _heartbeat(self, worker_id: str, now: float):
+        # Needs to be called in a transaction.
+        self._last_heartbeat = now
+        self._connection.execute("INSERT OR REPLACE INTO workers (id, heartbeat) VALUES (?, ?)", (worker_id, now))
+        dead_before = now - self.worker_timeout
+        self._connection.execute(
+            "UPDATE jobs SET status = ?, claimed_by = NULL WHERE status = ? "
+            "AND claimed_by IN (SELECT id FROM workers WHERE heartbeat < ?)",
+            (JOB_STATUS.QUEUED.value, JOB_STATUS.PROCESSING.value, dead_before)
+        )
+        self._connection.execute("DELETE FROM workers WHERE heartbeat < ?", (dead_before,))
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._has_pending.set()
+        with self._db_lock:
+            self._connection.close()
+        if self.delete_on_close and os.getpid() == self._creator_pid:
+            # the write-ahead log and the shared memory index of WAL mode are files next to the database
+            for path in (self.path, f"{self.path}-wal", f"{self.path}-shm"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,3 @@
+from fast_task_api.core.job_store.JobStore import JobStore
+from fast_task_api.core.job_store.InMemoryJobStore import InMemoryJobStore
+from fast_task_api.core.job_store.SQLiteJobStore import SQLiteJobStore
@@ -1,21 +1,60 @@
+import asyncio
 import functools
 import inspect
-from typing import Union
-from fastapi import APIRouter, FastAPI
+import os
+import signal
+import threading
+from typing import Union, List, Tuple, Any
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import ConfigDict, create_model
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
 from fast_task_api.compatibility.upload import (convert_param_type_to_fast_api_upload_file,
-                                                is_param_media_toolkit_file)
-from fast_task_api.settings import FTAPI_PORT, FTAPI_HOST
-from media_toolkit import media_from_any
-from fast_task_api.CONSTS import SERVER_STATUS
+                                                is_param_media_toolkit_file, media_from_upload,
+                                                iter_media_file_chunks, media_file_size)
+from fast_task_api.settings import (FTAPI_PORT, FTAPI_HOST, FTAPI_WORKERS, FTAPI_RESULT_INLINE_MAX_BYTES,
+                                   FTAPI_COMPRESSION_MIN_BYTES, FTAPI_COMPRESSION_LEVEL, FTAPI_PROFILE_ON_REQUEST,
+                                   FTAPI_MAX_WAIT)
+from fast_task_api.CONSTS import SERVER_STATUS, FTAPI_EXECUTORS
+from fast_task_api.core.CallPlan import CallPlan, get_call_plan
 from fast_task_api.core.JobManager import JobQueue
-from fast_task_api.core.job.JobResult import JobResult, JobResultFactory
+from fast_task_api.core.JobProfiler import requested_profile, parse_profile_modes
+from fast_task_api.core.Metrics import PROMETHEUS_CONTENT_TYPE
+from fast_task_api.core.ResponseCompression import (negotiate_encoding, is_compressible, compress, compress_stream,
+                                                    iter_chunks, STREAM_MIN_BYTES)
+from fast_task_api.core.job.InternalJob import InternalJob, JOB_PRIORITY, JOB_STATUS, next_change_seq
+from fast_task_api.core.job.JobResult import JobResult, JobResultFactory, JobStatusQuery, JobStatusList, dumps
+from fast_task_api.core.job.JobResultResponse import JobResultResponse
+from fast_task_api.core.job.JobSubscription import JobSubscription
 from fast_task_api.core.routers._socaity_router import _SocaityRouter
 from fast_task_api.core.routers.router_mixins._queue_mixin import _QueueMixin
 
 import importlib.metadata
 
 
+# route options of a task endpoint which don't apply to its batch route
+_BATCH_ROUTE_EXCLUDED_KWARGS = (
+    "response_model", "response_class", "name", "operation_id", "summary", "description", "response_description"
+)
+
+
+async def _read_profile_header(x_ftapi_profile: Union[str, None] = Header(default=None, include_in_schema=False)):
+    # async, so that the context variable is set in the context which the sync endpoint is copied from
+    if x_ftapi_profile:
+        requested_profile.set(parse_profile_modes(x_ftapi_profile))
+
+
+async def _reject_profile_header(x_ftapi_profile: Union[str, None] = Header(default=None, include_in_schema=False)):
+    # used by endpoints whose jobs can't be profiled, so that a requested profile doesn't silently go missing
+    if x_ftapi_profile:
+        raise HTTPException(
+            status_code=400,
+            detail="Profiling is only supported for sync task functions executed in worker threads without batching."
+        )
+
+
 class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
     def __init__(
             self,
@@ -61,12 +100,21 @@ class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
         self.app = app
         self.prefix = prefix
         self.add_standard_routes()
+        # copied to the app by include_router. Starts the warm-up when the server starts.
+        self.on_startup.append(self._start_warm_up)
         self._orig_openapi_func = self.app.openapi
         self.app.openapi = self.custom_openapi
 
     def add_standard_routes(self):
         self.api_route(path="/job", methods=["GET", "POST"])(self.get_job)
+        self.api_route(path="/jobs", methods=["POST"], response_model=JobStatusList)(self.get_jobs)
+        self.api_route(path="/job/stream", methods=["GET"])(self.stream_jobs)
+        self.api_route(path="/job/{job_id}/result", methods=["GET", "HEAD"])(self.get_job_result)
+        self.api_route(path="/job/{job_id}/profile", methods=["GET"])(self.get_job_profile)
         self.api_route(path="/status", methods=["GET", "POST"])(self.get_status)
+        self.api_route(path="/ready", methods=["GET"])(self.get_ready)
+        self.api_route(path="/stats", methods=["GET"])(self.get_stats)
+        self.api_route(path="/metrics", methods=["GET"], response_class=PlainTextResponse)(self.get_metrics)
         # ToDo: add favicon
         #self.api_route('/favicon.ico', include_in_schema=False)(self.favicon)
 
@@ -77,25 +125,402 @@ class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
         self.app.openapi_schema["info"]["fast-task-api"] = version
         return self.app.openapi_schema
 
-    def get_job(self, job_id: str, return_format: str = 'json', keep_in_memory: bool = False) -> JobResult:
+    async def get_job(
+            self,
+            job_id: str,
+            return_format: str = 'json',
+            keep_in_memory: bool = False,
+            wait: float = 0,
+            progress_threshold: float = None,
+            cursor: int = 0,
+            request: Request = None
+    ) -> JobResult:
         """
         Get the job with the given job_id.
+        The json is compressed with gzip, br or zstd if the Accept-Encoding header of the request allows it.
         :param job_id: The id of the job.
-        :param return_format: json or gzipped
+        :param return_format: json or gzipped. gzipped returns the json as gzip file (application/gzip).
         :param keep_in_memory: If the job should be kept in memory.
             If False, the job is removed after the result is returned.
+        :param wait: Long-poll. Seconds to wait for the job to change its status before responding.
+            Returns as soon as the job is started or finished, instead of polling in a tight loop.
+            At most FTAPI_MAX_WAIT seconds.
+        :param progress_threshold: Used with wait. Also return when the progress of the job reaches this value.
+        :param cursor: For generator task functions. Only the chunks from this cursor on are returned.
+            Pass the cursor of the previous response to get the new chunks. With wait, new chunks end the wait.
+
+        File results larger than FTAPI_RESULT_INLINE_MAX_BYTES are returned with the url of /job/{job_id}/result
+        instead of base64 content. Such jobs are kept in memory until the file was downloaded.
+        """
+        if wait > 0:
+            await self.job_queue.wait_for_update(
+                job_id, timeout=min(wait, FTAPI_MAX_WAIT), progress_threshold=progress_threshold, cursor=cursor
+            )
+
+        # only the wait is async. Reading the job (from the job store), serializing and compressing it block.
+        accept_encoding = request.headers.get("accept-encoding") if request is not None else None
+        return await run_in_threadpool(
+            self._job_response, job_id, return_format, keep_in_memory, cursor, accept_encoding
+        )
+
+    def _job_response(
+            self,
+            job_id: str,
+            return_format: str,
+            keep_in_memory: bool,
+            cursor: int,
+            accept_encoding: Union[str, None]
+    ) -> Response:
+        body, internal_job = self._job_json(job_id, keep_in_memory=keep_in_memory, cursor=cursor)
+        if return_format != 'json':
+            return Response(JobResultFactory.gzip_job_result(body), media_type="application/gzip")
+
+        cache = JobResultFactory.compressed_cache(internal_job, body) if internal_job is not None else None
+        return self._compressed_response(body, accept_encoding, cache)
+
+    def _job_json(
+            self,
+            job_id: str,
+            keep_in_memory: bool,
+            cursor: int = 0,
+            changed_since: int = None
+    ) -> Tuple[Union[bytes, None], Union[InternalJob, None]]:
+        """
+        The JobResult of the job serialized to json, like get_job returns it.
+        :param changed_since: change cursor. If the job didn't change since then, None is returned as json.
+        :return: (json, internal_job). internal_job is None if the job doesn't exist (anymore).
+        """
+        internal_job = self.job_queue.get_job(job_id, keep_in_memory=True)
+        if internal_job is None:
+            eviction_reason = self.job_queue.get_eviction_reason(job_id)
+            if eviction_reason is not None:
+                return dumps(JobResultFactory.job_expired(job_id, eviction_reason)), None
+            return dumps(JobResultFactory.job_not_found(job_id)), None
+        if changed_since is not None and internal_job.change_seq <= changed_since:
+            return None, internal_job
+
+        # the job is only removed if it was already finished when its state is read below
+        finished = self.job_queue.is_result_available(job_id)
+        if (not keep_in_memory and finished
+                and not JobResultFactory.is_result_served_by_url(internal_job, FTAPI_RESULT_INLINE_MAX_BYTES)):
+            self.job_queue.get_job(job_id, keep_in_memory=False)
+
+        # serialized without building the JobResult model. Finished jobs are serialized and compressed only once.
+        body = JobResultFactory.to_json(
+            internal_job, cursor=cursor, inline_max_bytes=FTAPI_RESULT_INLINE_MAX_BYTES, finished=finished
+        )
+        return body, internal_job
+
+    def get_jobs(self, query: JobStatusQuery, request: Request) -> Response:
+        """
+        Get the status of many jobs with one request instead of polling every job.
+        Returns {"cursor": int, "jobs": [JobResult]}. Pass the cursor with the next request to only get the jobs
+        which changed since the previous response. Jobs which don't exist (anymore) are always returned.
+        Finished jobs are removed after their result was returned, unless keep_in_memory is set.
+        With a shared job store the cursor is ignored and all jobs are returned: the changes of other processes
+        reach the store with a delay and could be missed.
+        """
+        # taken before the jobs are read: changes while reading are returned again with the next request
+        cursor = next_change_seq()
+        changed_since = query.cursor if not self.job_queue.job_store.shared else None
+        bodies = []
+        for job_id in dict.fromkeys(query.job_ids):
+            body, _ = self._job_json(job_id, keep_in_memory=query.keep_in_memory, changed_since=changed_since)
+            if body is not None:
+                bodies.append(body)
+        body = b'{"cursor":%d,"jobs":[%s]}' % (cursor, b",".join(bodies))
+        return self._compressed_response(body, request.headers.get("accept-encoding"))
+
+    @staticmethod
+    def _compressed_response(body: bytes, accept_encoding: Union[str, None], cache: dict = None) -> Response:
+        """
+        Response with the json body compressed in the encoding negotiated by the Accept-Encoding header.
+        :param cache: compressed variants of the body, which are reused and filled. Without cache, large bodies are
+            compressed while they are sent.
+        """
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None or len(body) < FTAPI_COMPRESSION_MIN_BYTES:
+            return JobResultResponse(body)
+
+        headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+        if cache is not None and encoding in cache:
+            return JobResultResponse(cache[encoding], headers=headers)
+        if cache is None and len(body) >= STREAM_MIN_BYTES:
+            return StreamingResponse(
+                compress_stream(iter_chunks(body), encoding, FTAPI_COMPRESSION_LEVEL),
+                media_type=JobResultResponse.media_type,
+                headers=headers
+            )
+        compressed = compress(body, encoding, FTAPI_COMPRESSION_LEVEL)
+        if cache is not None:
+            cache[encoding] = compressed
+        return JobResultResponse(compressed, headers=headers)
+
+    def get_job_result(self, job_id: str, request: Request, keep_in_memory: bool = False) -> Response:
         """
-        internal_job = self.job_queue.get_job(job_id, keep_in_memory=keep_in_memory)
+        Download the file result of a finished job as raw bytes instead of base64 encoded json.
+        Supports Range requests to resume downloads and conditional requests with the ETag.
+        :param job_id: The id of the job.
+        :param keep_in_memory: If the job should be kept in memory after the file was downloaded completely.
+            Range requests never remove the job, so that interrupted downloads can be resumed.
+        """
+        internal_job = self.job_queue.get_job(job_id, keep_in_memory=True)
         if internal_job is None:
-            return JobResultFactory.job_not_found(job_id)
+            eviction_reason = self.job_queue.get_eviction_reason(job_id)
+            if eviction_reason is not None:
+                return JobResultResponse(JobResultFactory.job_expired(job_id, eviction_reason), status_code=404)
+            return JobResultResponse(JobResultFactory.job_not_found(job_id), status_code=404)
+        if internal_job.status != JOB_STATUS.FINISHED or not is_param_media_toolkit_file(internal_job.result):
+            ret_job = JobResultFactory.to_dict(internal_job)
+            ret_job["result"] = None
+            ret_job["message"] = ret_job["message"] or "The job has no file result. Use /job to get its result."
+            return JobResultResponse(ret_job, status_code=409)
+
+        media_file = internal_job.result
+        size = media_file_size(media_file)
+        # the result of a finished job doesn't change. Thus the id and size are a strong validator.
+        etag = f'"{job_id}-{size}"'
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": f'attachment; filename="{media_file.file_name}"',
+        }
 
-        ret_job = JobResultFactory.from_internal_job(internal_job)
-        ret_job.refresh_job_url = f"/job?job_id={ret_job.id}"
+        byte_range = None
+        range_header = request.headers.get("range")
+        # an empty file has no satisfiable range. It is sent as a whole (RFC 9110 allows ignoring the Range header).
+        if range_header is not None and size > 0 and request.headers.get("if-range", etag) == etag:
+            byte_range = self._parse_range_header(range_header, size)
+            if byte_range == (0, 0):
+                return Response(
+                    status_code=416, headers={**headers, "ETag": etag, "Content-Range": f"bytes */{size}"}
+                )
+
+        # text-like files are compressed while they are sent. Ranges refer to the uncompressed bytes, thus ranges are
+        # sent uncompressed. The compressed variant has its own ETag.
+        encoding = None
+        if is_compressible(media_file.content_type):
+            headers["Vary"] = "Accept-Encoding"
+            if byte_range is None and size >= FTAPI_COMPRESSION_MIN_BYTES:
+                encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding is not None:
+            etag = f'"{job_id}-{size}-{encoding}"'
+            headers["Content-Encoding"] = encoding
+        headers["ETag"] = etag
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and etag in (tag.strip() for tag in if_none_match.split(",")):
+            return Response(status_code=304, headers=headers)
+
+        if byte_range is None:
+            start, end, status_code = 0, size, 200
+        else:
+            start, end, status_code = byte_range[0], byte_range[1], 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        if encoding is None:
+            headers["Content-Length"] = str(end - start)
+
+        # a complete download retrieves the job like GET /job does
+        background = None
+        if not keep_in_memory and byte_range is None:
+            background = BackgroundTask(self.job_queue.get_job, job_id, keep_in_memory=False)
+        if request.method == "HEAD":
+            return Response(status_code=status_code, headers=headers, media_type=media_file.content_type)
+        chunks = iter_media_file_chunks(media_file, start=start, end=end)
+        if encoding is not None:
+            chunks = compress_stream(chunks, encoding, FTAPI_COMPRESSION_LEVEL)
+        return StreamingResponse(
+            chunks,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_file.content_type,
+            background=background
+        )
 
-        if return_format != 'json':
-            ret_job = JobResultFactory.gzip_job_result(ret_job)
+    def get_job_profile(self, job_id: str, format: str = "json") -> Response:
+        """
+        Download the profile of a profiled job. Jobs are profiled with the rate FTAPI_PROFILE_SAMPLE_RATE or on
+        request with the header X-FTAPI-Profile: cpu,memory if FTAPI_PROFILE_ON_REQUEST is set.
+        :param format: json returns the duration, the cProfile statistics as text, the peak memory and the largest
+            allocations. pstats returns the raw cProfile statistics. Open them with pstats.Stats or snakeviz.
+        """
+        profile = self.job_queue.get_profile(job_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="No profile found for this job.")
+        if format == "pstats":
+            if profile.pstats_dump is None:
+                raise HTTPException(status_code=404, detail="The job was not profiled with cpu.")
+            return Response(
+                profile.pstats_dump,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f'attachment; filename="{job_id}.pstats"'}
+            )
+        return JobResultResponse(dumps({"id": job_id, **profile.summary}))
+
+    @staticmethod
+    def _parse_range_header(range_header: str, size: int) -> Union[Tuple[int, int], None]:
+        """
+        Parse a single range of a Range header like "bytes=0-499", "bytes=500-" or "bytes=-500".
+        :return: (start, end) with end exclusive. (0, 0) if the range can't be satisfied.
+            None if the header is invalid or has multiple ranges. Then the whole file is sent.
+        """
+        unit, _, ranges = range_header.partition("=")
+        if unit.strip() != "bytes" or "," in ranges:
+            return None
+        first, _, last = ranges.strip().partition("-")
+        try:
+            if first == "":
+                suffix_length = int(last)
+                if suffix_length <= 0:
+                    return 0, 0
+                return max(size - suffix_length, 0), size
+            start = int(first)
+            end = size if last == "" else min(int(last) + 1, size)
+        except ValueError:
+            return None
+        if start >= size or end <= start:
+            return 0, 0
+        return start, end
+
+    def stream_jobs(
+            self,
+            job_id: List[str] = Query(),
+            keep_in_memory: bool = False,
+            min_interval: float = 0.1
+    ) -> StreamingResponse:
+        """
+        Stream the status, progress and message of one or multiple jobs as server-sent events.
+        Sends an "update" event whenever a job changed and a "result" event with the JobResult when it finished.
+        Chunks of generator task functions are sent as "chunks" events. The stream ends when all jobs finished.
+        :param job_id: The id of the job. Repeat the parameter to subscribe to multiple jobs.
+        :param keep_in_memory: If the jobs should be kept in memory after their result was sent.
+        :param min_interval: Seconds between two updates. Updates in between are coalesced.
+        """
+        return StreamingResponse(
+            self._job_events(job_id, keep_in_memory=keep_in_memory, min_interval=min_interval),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    async def _job_events(self, job_ids: List[str], keep_in_memory: bool, min_interval: float):
+        # get_job reads jobs of other processes from the job store. That blocks and runs in the threadpool.
+        get_job = functools.partial(run_in_threadpool, self.job_queue.get_job, keep_in_memory=True)
+        pending = {}
+        for job_id in dict.fromkeys(job_ids):
+            job = await get_job(job_id)
+            if job is None:
+                yield self._sse_event("result", (await self.get_job(job_id)).body)
+            else:
+                pending[job_id] = job
+
+        last_sent = {}
+        cursors = {job_id: 0 for job_id in pending}
+        with JobSubscription(list(pending.values())) as subscription:
+            while pending:
+                has_remote = False
+                for job_id, job in list(pending.items()):
+                    # jobs executed by other processes are polled from the shared job store
+                    remote = self.job_queue.job_store.shared and job_id not in self.job_queue.jobs
+                    if remote:
+                        has_remote = True
+                        job = await get_job(job_id)
+                        if job is not None:
+                            pending[job_id] = job
+                    if (job is None or self.job_queue.is_result_available(job_id)
+                            or (not remote and job.id not in self.job_queue.jobs)):
+                        del pending[job_id]
+                        yield self._sse_event("result", (await self.get_job(
+                            job_id, keep_in_memory=keep_in_memory, cursor=cursors[job_id]
+                        )).body)
+                        continue
+
+                    if job.chunks is not None and job.chunks.total > cursors[job_id]:
+                        chunks = JobResultFactory.to_dict(job, cursor=cursors[job_id])
+                        cursors[job_id] = chunks["cursor"]
+                        yield self._sse_event(
+                            "chunks", {"id": job_id, "chunks": chunks["chunks"], "cursor": chunks["cursor"]}
+                        )
+
+                    update = (job.status.value, job.job_progress._progress, job.job_progress._message)
+                    if last_sent.get(job_id) != update:
+                        last_sent[job_id] = update
+                        yield self._sse_event("update", {
+                            "id": job_id, "status": update[0], "progress": update[1], "message": update[2]
+                        })
+
+                if pending and has_remote:
+                    await asyncio.sleep(max(min_interval, 0.1))
+                elif pending:
+                    if not await subscription.wait(timeout=15):
+                        # comment line keeping proxies from closing the idle connection
+                        yield ": keep-alive\n\n"
+                    await asyncio.sleep(min_interval)
+
+    @staticmethod
+    def _sse_event(event: str, data: Union[bytes, dict]) -> str:
+        # same encoding as the json responses of the regular routes. Json never contains raw line breaks.
+        data = (data if isinstance(data, bytes) else dumps(data)).decode("utf-8")
+        return f"event: {event}\ndata: {data}\n\n"
+
+    async def _start_warm_up(self):
+        # each server process (FTAPI_WORKERS) warms up on its own. Including the router twice starts it only once.
+        if self.status != SERVER_STATUS.INITIALIZING:
+            return
+        if len(self._warm_up_hooks) == 0:
+            self.status = SERVER_STATUS.RUNNING
+            return
+        # the server answers requests while the hooks run: /ready reports 503 and submitted jobs stay queued
+        self.status = SERVER_STATUS.BOOTING
+        threading.Thread(target=self.warm_up, name="fast_task_api_warm_up", daemon=True).start()
+
+    def warm_up(self):
+        """
+        Run the warm-up hooks. The job queue is paused meanwhile, jobs submitted during the warm-up are queued and
+        start afterwards.
+        """
+        self.job_queue.pause()
+        try:
+            super().warm_up()
+        finally:
+            self.job_queue.resume()
 
-        return ret_job
+    def get_ready(self) -> JSONResponse:
+        """
+        Readiness probe for load balancers and orchestrators. 200 if the warm-up hooks finished, otherwise 503.
+        Also reports the duration of the warm-up and of each hook and the error of a failed hook.
+        """
+        return JSONResponse(status_code=200 if self.is_ready else 503, content={
+            "status": self.status.value,
+            "ready": self.is_ready,
+            "warm_up_seconds": self.warm_up_seconds,
+            "warm_up_durations": self.warm_up_durations,
+            "error": self.startup_error,
+        })
+
+    def get_stats(self) -> dict:
+        """
+        Statistics of the job queue: queued and running jobs, results kept in memory and evicted results.
+        """
+        return self.job_queue.get_stats()
+
+    def get_metrics(self) -> PlainTextResponse:
+        """
+        Metrics in the Prometheus text format: submitted, finished, failed, timed out and rejected jobs,
+        queued and in progress jobs and histograms of the queue wait and execution time per task function.
+        """
+        lines = [
+            "# HELP fast_task_api_ready 1 if the warm-up finished and the server accepts traffic.",
+            "# TYPE fast_task_api_ready gauge",
+            f"fast_task_api_ready {int(self.is_ready)}",
+        ]
+        if self.warm_up_seconds is not None:
+            lines += [
+                "# HELP fast_task_api_warm_up_seconds Duration of the warm-up hooks.",
+                "# TYPE fast_task_api_warm_up_seconds gauge",
+                f"fast_task_api_warm_up_seconds {self.warm_up_seconds}",
+            ]
+        return PlainTextResponse(
+            self.job_queue.get_metrics() + "\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE
+        )
 
     @staticmethod
     def _job_progress_signature_change(func: callable) -> callable:
@@ -116,32 +541,20 @@ class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
 
         # original func parameter names: needed multiple times
         original_func_parameters = inspect.signature(func).parameters.values()
-        # create a dict to store the params that are UploadFiles
-        # this is used to later map the file while reading
-        upload_params = {
-            param.name: param.annotation
-            for param in original_func_parameters
-            if is_param_media_toolkit_file(param)
-        }
-
-        def read_file_if_is_upload_file(param_name: str, data):
-            # check if we have the file in our list
-            my_data_type = upload_params.get(param_name, None)
-            if my_data_type is not None:
-                return media_from_any(data, my_data_type)
-            # if is not a file, return as is
-            return data
+        # the params that are UploadFiles are looked up once and used to map the files of every request.
+        # Not cached with get_call_plan, because the signature of func is replaced below.
+        call_plan = CallPlan(func)
 
         @functools.wraps(func)
         def file_upload_wrapper(*args, **kwargs):
             # args, kwargs to _ kwargs
-            org_func_names = [param.name for param in original_func_parameters]
-            nkwargs = {org_func_names[i]: arg for i, arg in enumerate(args)}
-            nkwargs.update(kwargs)
+            kwargs.update(zip(call_plan.param_names, args))
             # convert to socaity MediaFile if it is a file
-            n_kwargs = {key: read_file_if_is_upload_file(key, value) for key, value in kwargs.items()}
+            for param_name, media_file_type in call_plan.upload_params.items():
+                if param_name in kwargs:
+                    kwargs[param_name] = media_from_upload(kwargs[param_name], media_file_type)
 
-            return func(**n_kwargs)
+            return func(**kwargs)
 
         # replace signature with fastapi signature
         new_sig = inspect.signature(func).replace(parameters=[
@@ -165,6 +578,17 @@ class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
             path: str,
             queue_size: int = 100,
             methods: list[str] = None,
+            max_concurrency: int = None,
+            executor: Union[FTAPI_EXECUTORS, str] = FTAPI_EXECUTORS.THREAD,
+            timeout: int = 3600,
+            batch_size: int = None,
+            max_batch_wait_ms: float = 20,
+            priority: Union[JOB_PRIORITY, str] = JOB_PRIORITY.NORMAL,
+            weight: float = 1,
+            cache: bool = False,
+            cache_ttl: float = 3600,
+            cache_max_bytes: int = 256 * 1024 ** 2,
+            batch_route: bool = False,
             *args,
             **kwargs
     ):
@@ -173,20 +597,40 @@ class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
         - Add api key validation
         - Create a job and add to the job queue
         - Return job
+        :param queue_size: The maximum number of jobs that can be queued. If exceeded the job is rejected.
+        :param max_concurrency: The maximum number of jobs of this endpoint that are executed at the same time.
+            Further jobs stay queued until a slot frees up.
+        :param executor: "thread" or "process". With "process" the jobs run in worker processes and are killed
+            when they exceed their timeout.
+        :param timeout: Seconds after which a job is set to status Timeout. None disables the timeout.
+        :param batch_size: If set, up to batch_size queued jobs are executed with a single call of the function.
+            The function receives a list of values for each parameter and returns a list with one result per job.
+        :param max_batch_wait_ms: Milliseconds a queued job waits for further jobs to fill its batch.
+        :param priority: "high", "normal" or "low". Queued jobs of a higher priority are started first.
+        :param weight: Share of the workers relative to other endpoints of the same priority while both have jobs queued.
+        :param cache: Cache the results by the request parameters. Uploaded files are compared by content.
+            Equal requests are answered from the cache or follow the running job instead of executing the function again.
+        :param cache_ttl: Seconds a result is served from the cache.
+        :param cache_max_bytes: Maximum size of the cached results. Least recently used results are evicted first.
+        :param batch_route: Also add POST {path}/batch, which creates one job per input of a list.
+            It has the same dependencies and route options as the endpoint.
         """
         if len(path) > 0 and path[0] != "/":
             path = "/" + path
 
-        fastapi_route_decorator_func = self.api_route(
-            path=path,
-            methods=["POST"] if methods is None else methods,
-            *args,
-            **kwargs
-        )
-
         queue_router_decorator_func = super().job_queue_func(
             path=path,
             queue_size=queue_size,
+            max_concurrency=max_concurrency,
+            executor=executor,
+            timeout=timeout,
+            batch_size=batch_size,
+            max_batch_wait_ms=max_batch_wait_ms,
+            priority=priority,
+            weight=weight,
+            cache=cache,
+            cache_ttl=cache_ttl,
+            cache_max_bytes=cache_max_bytes,
             *args,
             **kwargs
         )
@@ -199,20 +643,86 @@ class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
             file_upload_modified = self._handle_file_uploads(job_progress_removed)
             # modify file responses so that functions can return multimodal files.
             # file_response_modified = self._handle_file_responses(file_upload_modified)
+            # FastAPI unwraps the route to check if it needs to be awaited. The route creates a job and returns
+            # right away, no matter if the task function is async. Thus the chain to the task function is cut.
+            # The signature for the openapi docs was already set explicitly.
+            del file_upload_modified.__wrapped__
+
+            route_kwargs = kwargs
+            if FTAPI_PROFILE_ON_REQUEST:
+                profile_dependency = (
+                    _read_profile_header if self.job_queue.can_profile(func) else _reject_profile_header
+                )
+                route_kwargs = {
+                    **kwargs, "dependencies": [*kwargs.get("dependencies", []), Depends(profile_dependency)]
+                }
+            if batch_route:
+                self._add_batch_route(path, func, *args, **route_kwargs)
             # add the route to fastapi
-            return fastapi_route_decorator_func(file_upload_modified)
+            return self.api_route(
+                path=path,
+                methods=["POST"] if methods is None else methods,
+                *args,
+                **route_kwargs
+            )(file_upload_modified)
 
         return decorator
 
-    def get(self, path: str = None, queue_size: int = 100, *args, **kwargs):
-        return self.task_endpoint(path=path, queue_size=queue_size, methods=["GET"], *args, **kwargs)
+    def _add_batch_route(self, path: str, func: callable, *args, **kwargs):
+        """
+        Add POST {path}/batch. It accepts a list of inputs of the task function and creates one job per input.
+        Returns the list of job ids. Either all jobs are queued or, if they exceed the queue size, none (status 429).
+        Files are passed as url or base64 string.
+        :param kwargs: the route options of the task endpoint, for example its dependencies.
+            Options describing the response or the identity of the endpoint are not applied to the batch route.
+        """
+        call_plan = get_call_plan(func)
+        fields = {}
+        for param in inspect.signature(func).parameters.values():
+            if param.name in call_plan.progress_param_names:
+                continue
+            if param.name in call_plan.upload_params:
+                annotation = Union[str, None]
+            else:
+                annotation = Any if param.annotation is inspect.Parameter.empty else param.annotation
+            fields[param.name] = (annotation, call_plan.defaults.get(param.name, ...))
+        input_model = create_model(
+            f"{func.__name__}_batch_input", __config__=ConfigDict(arbitrary_types_allowed=True), **fields
+        )
 
-    def post(self, path: str = None, queue_size: int = 100, *args, **kwargs):
-        return self.task_endpoint(path=path, queue_size=queue_size, methods=["POST"], *args, **kwargs)
+        def batch_endpoint(inputs: List[input_model]) -> List[str]:
+            job_params = []
+            for model in inputs:
+                params = dict(model)
+                for param_name, media_file_type in call_plan.upload_params.items():
+                    if params.get(param_name) is not None:
+                        params[param_name] = media_from_upload(params[param_name], media_file_type)
+                job_params.append(params)
+
+            jobs = self.job_queue.add_jobs(func, job_params, profile=requested_profile.get())
+            if len(jobs) < len(job_params):
+                raise HTTPException(status_code=429, detail=f"Queue size for function {func.__name__} reached.")
+            return [job.id for job in jobs]
+
+        batch_endpoint.__name__ = f"{func.__name__}_batch"
+        route_kwargs = {key: value for key, value in kwargs.items() if key not in _BATCH_ROUTE_EXCLUDED_KWARGS}
+        self.api_route(path=f"{path.rstrip('/')}/batch", methods=["POST"], *args, **route_kwargs)(batch_endpoint)
+
+    def get(self, path: str = None, queue_size: int = 100, max_concurrency: int = None, *args, **kwargs):
+        return self.task_endpoint(
+            path=path, queue_size=queue_size, methods=["GET"], max_concurrency=max_concurrency, *args, **kwargs
+        )
 
-    def start(self, port: int = FTAPI_PORT, host: str = FTAPI_HOST, *args, **kwargs):
+    def post(self, path: str = None, queue_size: int = 100, max_concurrency: int = None, *args, **kwargs):
+        return self.task_endpoint(
+            path=path, queue_size=queue_size, methods=["POST"], max_concurrency=max_concurrency, *args, **kwargs
+        )
+
+    def start(self, port: int = FTAPI_PORT, host: str = FTAPI_HOST, workers: int = FTAPI_WORKERS, *args, **kwargs):
         """
         Start the FastAPI server and add this app.
+        :param workers: number of server processes. They share the port and the jobs. Jobs are queued in a shared
+            job store and executed by the first process with a free worker. Any process answers requests for any job.
         """
         # fast API start
         if self.app is None:
@@ -225,5 +735,39 @@ class SocaityFastAPIRouter(APIRouter, _SocaityRouter, _QueueMixin):
         print(f"FastTaskAPI {self.app.title} started. Use http://{print_host}:{port}/docs to see the API documentation.")
         # start uvicorn
         import uvicorn
-        uvicorn.run(self.app, host=host, port=port)
+        if workers <= 1 or not hasattr(os, "fork"):
+            if workers > 1:
+                print("Multiple workers are not supported on this platform. Starting a single worker.")
+            uvicorn.run(self.app, host=host, port=port)
+            return
+        self._run_workers(uvicorn.Config(self.app, host=host, port=int(port)), workers)
+
+    def _run_workers(self, config, workers: int):
+        """
+        Fork workers - 1 processes which serve the app on the same socket as this process.
+        The app can't be passed to uvicorn's own multiprocessing, because it needs an import string.
+        """
+        import uvicorn
+        self.job_queue.share_job_store()
+        sock = config.bind_socket()
+        children = []
+        for _ in range(workers - 1):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.job_queue.reset_after_fork()
+                    uvicorn.Server(config).run(sockets=[sock])
+                finally:
+                    os._exit(0)
+            children.append(pid)
+
+        try:
+            uvicorn.Server(config).run(sockets=[sock])
+        finally:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    os.waitpid(pid, 0)
+                except (ProcessLookupError, ChildProcessError):
+                    pass
 
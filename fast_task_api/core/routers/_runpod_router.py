@@ -1,20 +1,21 @@
 import functools
 import importlib
 import inspect
-import json
 from datetime import datetime
 from typing import Union
 
 from fast_task_api.CONSTS import SERVER_STATUS
-from fast_task_api.compatibility.upload import is_param_media_toolkit_file
+from fast_task_api.compatibility.upload import is_param_media_toolkit_file, media_from_upload
+from fast_task_api.core.CallPlan import CallPlan, get_call_plan
 from fast_task_api.core.job.InternalJob import JOB_STATUS
-from fast_task_api.core.job.JobProgress import JobProgressRunpod, JobProgress
-from fast_task_api.core.job.JobResult import JobResult
+from fast_task_api.core.job.JobProgress import JobProgressRunpod
+from fast_task_api.core.job.JobResult import JobResult, dumps
 from fast_task_api.core.routers._socaity_router import _SocaityRouter
 
 from fast_task_api.CONSTS import FTAPI_DEPLOYMENTS
 from fast_task_api.settings import FTAPI_DEPLOYMENT, FTAPI_PORT
-from media_toolkit import media_from_any
+
+_JOB_RESULT_FIELDS = tuple(JobResult.model_fields)
 
 
 class SocaityRunpodRouter(_SocaityRouter):
@@ -29,10 +30,12 @@ class SocaityRunpodRouter(_SocaityRouter):
     def __init__(self, title: str = "FastTaskAPI for ", summary: str = None, *args, **kwargs):
         super().__init__(title=title, summary=summary, *args, **kwargs)
         self.routes = {}  # routes are organized like {"ROUTE_NAME": "ROUTE_FUNCTION"}
+        self.call_plans = {}  # {"ROUTE_NAME": CallPlan} built once per route and reused for every request
 
     def task_endpoint(
             self,
             path: str = None,
+            batch_size: int = None,
             *args,
             **kwargs
     ):
@@ -41,72 +44,101 @@ class SocaityRunpodRouter(_SocaityRouter):
         - Add api key validation
         - Create a job and add to the job queue
         - Return job
+        :param batch_size: if set, the function is batch-aware. Runpod passes one job per call,
+            thus the function is called with batches of a single job.
         """
         if len(path) > 0 and path[0] == "/":
             path = path[1:]
 
         def decorator(func):
-            @functools.wraps(func)
-            def wrapper(*wrapped_func_args, **wrapped_func_kwargs):
-                self.status = SERVER_STATUS.BUSY
-                ret = func(*wrapped_func_args, **wrapped_func_kwargs)
-                self.server_status = SERVER_STATUS.RUNNING
-                return ret
+            call_plan = get_call_plan(func)
+            call = self._as_single_job_batch(func) if batch_size is not None else func
+            if call_plan.is_async_generator:
+                @functools.wraps(func)
+                async def wrapper(*wrapped_func_args, **wrapped_func_kwargs):
+                    self.status = SERVER_STATUS.BUSY
+                    async for chunk in func(*wrapped_func_args, **wrapped_func_kwargs):
+                        yield chunk
+                    self.status = SERVER_STATUS.RUNNING
+            elif call_plan.is_generator:
+                @functools.wraps(func)
+                def wrapper(*wrapped_func_args, **wrapped_func_kwargs):
+                    self.status = SERVER_STATUS.BUSY
+                    yield from func(*wrapped_func_args, **wrapped_func_kwargs)
+                    self.status = SERVER_STATUS.RUNNING
+            elif call_plan.is_coroutine:
+                @functools.wraps(func)
+                async def wrapper(*wrapped_func_args, **wrapped_func_kwargs):
+                    self.status = SERVER_STATUS.BUSY
+                    ret = await call(*wrapped_func_args, **wrapped_func_kwargs)
+                    self.status = SERVER_STATUS.RUNNING
+                    return ret
+            else:
+                @functools.wraps(func)
+                def wrapper(*wrapped_func_args, **wrapped_func_kwargs):
+                    self.status = SERVER_STATUS.BUSY
+                    ret = call(*wrapped_func_args, **wrapped_func_kwargs)
+                    self.status = SERVER_STATUS.RUNNING
+                    return ret
 
             self.routes[path] = wrapper
+            self.call_plans[path] = call_plan
             return wrapper
 
         return decorator
 
+    @staticmethod
+    def _as_single_job_batch(func: callable) -> callable:
+        """
+        Call a batch-aware function with a batch of one job and return the result of that job.
+        """
+        def unpack(results):
+            if isinstance(results[0], Exception):
+                raise results[0]
+            return results[0]
+
+        if inspect.iscoroutinefunction(func):
+            async def call(**kwargs):
+                return unpack(await func(**{key: [value] for key, value in kwargs.items()}))
+        else:
+            def call(**kwargs):
+                return unpack(func(**{key: [value] for key, value in kwargs.items()}))
+        return call
+
     def get(self, path: str = None, queue_size: int = 1, *args, **kwargs):
         return self.task_endpoint(path=path, queue_size=queue_size, *args, **kwargs)
 
     def post(self, path: str = None, queue_size: int = 1, *args, **kwargs):
         return self.task_endpoint(path=path, queue_size=queue_size, *args, **kwargs)
 
-    def _add_job_progress_to_kwargs(self, func, job, kwargs):
+    @staticmethod
+    def _add_job_progress_to_kwargs(call_plan: CallPlan, job, kwargs):
         """
         If the function has a job_progress parameter, it is passed to the function normally.
         The parameter changes the progress of the runpod job.
-        :param func: the function that is called
+        :param call_plan: the call plan of the function that is called
         :param job: the runpod job
         :param kwargs: the arguments that are passed to the function
         :return: the arguments with the job_progress object added if necessary
         """
         # Therefore instead of initiating a normal JobProgress object a specialized RunpodProgress object is initiated.
         # The RunpodProgress object has a reference to the runpopd job.
-
-        job_progress_params = []
-        for param in inspect.signature(func).parameters.values():
-            if param.annotation == JobProgress or param.name == "job_progress":
-                job_progress_params.append(param.name)
-
-        if len(job_progress_params) > 0:
+        if len(call_plan.progress_param_names) > 0:
             jp = JobProgressRunpod(job)
-            for job_progress_param in job_progress_params:
+            for job_progress_param in call_plan.progress_param_names:
                 kwargs[job_progress_param] = jp
 
         return kwargs
 
     @staticmethod
-    def _handle_file_uploads(func: callable, **kwargs):
+    def _handle_file_uploads(call_plan: CallPlan, kwargs):
         """
         Params of the function that are annotated with UploadDataType will be replaced with the file content.
         """
-        # original func parameter names: needed multiple times
-        original_func_parameters = inspect.signature(func).parameters
-        # create a dict to store the params that are UploadFiles
-        # this is used to later map the file while reading
-        upload_params = {
-            param.name: param.annotation
-            for param in original_func_parameters.values()
-            if is_param_media_toolkit_file(param)
-        }
-
         # convert to media files
-        for key, value in upload_params.items():
+        for key, media_file_type in call_plan.upload_params.items():
             if key in kwargs:
-                kwargs[key] = media_from_any(kwargs[key], media_file_type=original_func_parameters[key].annotation)
+                kwargs[key] = media_from_upload(kwargs[key], media_file_type=media_file_type)
 
         return kwargs
 
@@ -124,35 +156,61 @@ class SocaityRunpodRouter(_SocaityRouter):
         route_function = self.routes.get(path, None)
         if route_function is None:
             raise Exception(f"Route {path} not found")
+        call_plan = self.call_plans[path]
 
         # add the runpod job_progress object to the function if necessary
-        kwargs = self._add_job_progress_to_kwargs(route_function, job, kwargs)
+        kwargs = self._add_job_progress_to_kwargs(call_plan, job, kwargs)
 
-        # check the arguments for the path function
-        sig = inspect.signature(route_function)
-        missing_args = [arg for arg in sig.parameters if arg not in kwargs]
+        # check the arguments for the path function. Parameters with a default value can be omitted.
+        missing_args = call_plan.missing_params(kwargs)
         if len(missing_args) > 0:
             raise Exception(f"Arguments {missing_args} are missing")
 
         # handle file uploads
-        kwargs = self._handle_file_uploads(route_function, **kwargs)
+        kwargs = self._handle_file_uploads(call_plan, kwargs)
 
-        # catch errors and display readable error messages
+        # generators are iterated by the stream_handler
+        if call_plan.is_generator or call_plan.is_async_generator:
+            return route_function(**kwargs)
+
+        # async route functions are awaited by the runpod serverless framework
         start_time = datetime.utcnow()
-        result = JobResult(id=job['id'], execution_started_at=start_time.strftime("%Y-%m-%dT%H:%M:%S.%f%z"))
+        if call_plan.is_coroutine:
+            return self._run_async_route(route_function, job, start_time, kwargs)
+
+        # catch errors and display readable error messages
+        try:
+            res, error = route_function(**kwargs), None
+        except Exception as e:
+            res, error = None, e
+        return self._to_runpod_result(job, start_time, res, error)
 
+    async def _run_async_route(self, route_function: callable, job, start_time: datetime, kwargs: dict):
         try:
-            # execute the function
-            res = route_function(**kwargs)
+            res, error = await route_function(**kwargs), None
+        except Exception as e:
+            res, error = None, e
+        return self._to_runpod_result(job, start_time, res, error)
+
+    @staticmethod
+    def _to_runpod_result(job, start_time: datetime, res, error: Union[Exception, None]) -> str:
+        """
+        Convert the return value of a route function to the serialized JobResult runpod returns to the client.
+        """
+        # the fields of the JobResult, serialized without building the pydantic model
+        result = dict.fromkeys(_JOB_RESULT_FIELDS)
+        # isoformat of the naive utc times equals strftime("%Y-%m-%dT%H:%M:%S.%f%z"), but is much faster
+        result.update(id=job['id'], progress=0.0, endpoint_protocol="socaity",
+                      execution_started_at=start_time.isoformat(timespec="microseconds"))
+        if error is None:
             if is_param_media_toolkit_file(res):
                 res = res.to_json()
-            result.result = res
-            result.status = JOB_STATUS.FINISHED.value
-        except Exception as e:
-            result.status = JOB_STATUS.FAILED.value
-            result.message = str(e)
-        finally:
-            result.execution_finished_at = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+            result["result"] = res
+            result["status"] = JOB_STATUS.FINISHED.value
+        else:
+            result["status"] = JOB_STATUS.FAILED.value
+            result["message"] = str(error)
+        result["execution_finished_at"] = datetime.utcnow().isoformat(timespec="microseconds")
 
         # yet generated by client, because there's no way to find the serverless endpoint ID in the runpod job
         #ret_job.refresh_job_url = f"/job?job_id={ret_job.id}"
@@ -160,12 +218,8 @@ class SocaityRunpodRouter(_SocaityRouter):
         #if return_format != 'json':
         #    ret_job = JobResultFactory.gzip_job_result(ret_job)
 
-        # runpod expects dict and does not auto serialization
-        # to check if serialization works use json.dumps(result.dict()) in debug mode
-        result = result.dict()
-        result = json.dumps(result)
-
-        return result
+        # runpod expects a string and does not auto serialize
+        return dumps(result).decode("utf-8")
 
     def handler(self, job):
         """
@@ -184,6 +238,39 @@ class SocaityRunpodRouter(_SocaityRouter):
 
         return self._router(route, job, **inputs)
 
+    async def stream_handler(self, job):
+        """
+        Handler used if the app has generator routes. Runpod streams each yielded value to the client (/stream)
+        and, with return_aggregate_stream, returns the list of all yielded values (/run, /runsync).
+        Generator routes yield their chunks. Other routes yield their single result.
+        """
+        output = self.handler(job)
+        if inspect.isasyncgen(output):
+            async for chunk in output:
+                yield self._to_runpod_chunk(chunk)
+        elif inspect.isgenerator(output):
+            for chunk in output:
+                yield self._to_runpod_chunk(chunk)
+        elif inspect.isawaitable(output):
+            yield await output
+        else:
+            yield output
+
+    @staticmethod
+    def _to_runpod_chunk(chunk):
+        if is_param_media_toolkit_file(chunk):
+            return chunk.to_json()
+        return chunk
+
+    def _runpod_config(self) -> dict:
+        """
+        Runpod decides by the handler function if the output of all jobs is streamed.
+        Thus, if one route is a generator, all routes are served by the stream_handler.
+        """
+        if any(plan.is_generator or plan.is_async_generator for plan in self.call_plans.values()):
+            return {"handler": self.stream_handler, "return_aggregate_stream": True}
+        return {"handler": self.handler}
+
     def start_runpod_serverless_localhost(self, port):
         # add the -rp_serve_api to the command line arguments to allow debugging
         import sys
@@ -219,17 +306,22 @@ class SocaityRunpodRouter(_SocaityRouter):
 
         rp_fastapi.WorkerAPI = WorkerAPIWithModifiedInfo
 
-        runpod.serverless.start({"handler": self.handler})
+        runpod.serverless.start(self._runpod_config())
 
     def start(self, deployment: Union[FTAPI_DEPLOYMENTS, str] = FTAPI_DEPLOYMENT, port: int = FTAPI_PORT, *args, **kwargs):
         if type(deployment) is str:
             deployment = FTAPI_DEPLOYMENTS(deployment)
 
+        # runpod sends jobs as soon as the worker started. Warm up before, a failed warm-up stops the worker.
+        self.warm_up()
+        if self.status == SERVER_STATUS.ERROR:
+            raise RuntimeError(f"Warm-up of {self.title} failed: {self.startup_error}")
+
         if deployment == deployment.LOCALHOST:
             self.start_runpod_serverless_localhost(port=port)
         elif deployment == deployment.SERVERLESS:
             import runpod.serverless
-            runpod.serverless.start({"handler": self.handler})
+            runpod.serverless.start(self._runpod_config())
         else:
             raise Exception(f"Not implemented for environment {deployment}")
 
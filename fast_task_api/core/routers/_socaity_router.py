@@ -1,7 +1,11 @@
+import inspect
+import time
+import traceback
 from typing import Union
 
-from fast_task_api.CONSTS import SERVER_STATUS, FTAPI_DEPLOYMENTS
+from fast_task_api.CONSTS import SERVER_STATUS, FTAPI_DEPLOYMENTS, FTAPI_EXECUTORS
 from fast_task_api.settings import FTAPI_DEPLOYMENT, FTAPI_PORT
+from fast_task_api.core.job.InternalJob import JOB_PRIORITY
 
 
 class _SocaityRouter:
@@ -20,9 +24,74 @@ class _SocaityRouter:
         self.summary = summary
         self.status = SERVER_STATUS.INITIALIZING
 
+        # warm-up hooks registered with on_warm_up: [(hook, parallel)]
+        self._warm_up_hooks = []
+        self.warm_up_seconds: Union[float, None] = None
+        self.warm_up_durations = {}  # {hook name: seconds}
+        self.startup_error: Union[str, None] = None
+
     def get_status(self) -> SERVER_STATUS:
         return self.status
 
+    @property
+    def is_ready(self) -> bool:
+        return self.status in (SERVER_STATUS.RUNNING, SERVER_STATUS.BUSY)
+
+    def on_warm_up(self, func: callable = None, parallel: bool = False):
+        """
+        Register a warm-up hook, for example to load a model and run a first inference with it.
+        The hooks run when the server starts. Until all of them finished, the status is BOOTING and the server is
+        not ready. Use it as @app.on_warm_up or @app.on_warm_up(parallel=True). Hooks can be sync or async functions.
+        :param parallel: Run the hook in a thread at the same time as the other parallel hooks, for example to load
+            independent models. The other hooks run one after another in the order they were registered.
+        """
+        def decorator(hook: callable):
+            self._warm_up_hooks.append((hook, parallel))
+            return hook
+
+        return decorator if func is None else decorator(func)
+
+    def warm_up(self):
+        """
+        Run the startup hooks. The status is BOOTING meanwhile and RUNNING afterwards, or ERROR if a hook failed.
+        The duration of each hook and of the whole warm-up is recorded in warm_up_durations and warm_up_seconds.
+        """
+        # imported here to keep the import of the package fast
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.status = SERVER_STATUS.BOOTING
+        started = time.perf_counter()
+        parallel_hooks = [hook for hook, parallel in self._warm_up_hooks if parallel]
+        sequential_hooks = [hook for hook, parallel in self._warm_up_hooks if not parallel]
+        try:
+            with ThreadPoolExecutor(
+                    max_workers=max(len(parallel_hooks), 1), thread_name_prefix="fast_task_api_warm_up"
+            ) as pool:
+                futures = [pool.submit(self._run_warm_up_hook, hook) for hook in parallel_hooks]
+                for hook in sequential_hooks:
+                    self._run_warm_up_hook(hook)
+                for future in futures:
+                    future.result()
+        except Exception as e:
+            self.startup_error = f"{type(e).__name__}: {e}"
+            self.status = SERVER_STATUS.ERROR
+            print(traceback.format_exc())
+        else:
+            self.status = SERVER_STATUS.RUNNING
+        finally:
+            self.warm_up_seconds = time.perf_counter() - started
+
+    def _run_warm_up_hook(self, hook: callable):
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(hook):
+                import asyncio
+                asyncio.run(hook())
+            else:
+                hook()
+        finally:
+            self.warm_up_durations[getattr(hook, "__name__", str(hook))] = time.perf_counter() - started
+
     def get_job(self, job_id: str):
         """
         Get the job with the given job_id if it exists.
@@ -50,14 +119,42 @@ class _SocaityRouter:
             self,
             path: str = None,
             queue_size: int = 100,
+            max_concurrency: int = None,
+            executor: Union[FTAPI_EXECUTORS, str] = FTAPI_EXECUTORS.THREAD,
+            timeout: int = 3600,
+            batch_size: int = None,
+            max_batch_wait_ms: float = 20,
+            priority: Union[JOB_PRIORITY, str] = JOB_PRIORITY.NORMAL,
+            weight: float = 1,
+            cache: bool = False,
+            cache_ttl: float = 3600,
+            cache_max_bytes: int = 256 * 1024 ** 2,
+            batch_route: bool = False,
             *args,
             **kwargs
     ):
         """
-        This adds a task-route to the app. This means a job thread is created for each request.
+        This adds a task-route to the app. This means a job is created for each request and executed by a worker.
         Then the method returns an JobResult object with the job_id.
         :param path: will be resolved as url in form http://{host:port}/{prefix}/{path}
         :param queue_size: The maximum number of jobs that can be queued. If exceeded the job is rejected.
+        :param max_concurrency: The maximum number of jobs of this endpoint that are executed at the same time.
+            If None, only the global number of workers (FTAPI_MAX_WORKERS) limits the execution.
+        :param executor: "thread" runs the jobs in worker threads. "process" runs them in worker processes.
+            Use it for CPU bound tasks. Jobs exceeding their timeout are killed and the worker is replaced.
+        :param timeout: Seconds after which a job is set to status Timeout. None disables the timeout.
+        :param batch_size: If set, up to batch_size queued jobs are executed with a single call of the function.
+            The function receives a list of values for each parameter (one per job) and returns a list with one
+            result per job. An Exception instance in the returned list marks only that job as failed.
+        :param max_batch_wait_ms: Milliseconds a queued job waits for further jobs to fill its batch.
+        :param priority: "high", "normal" or "low". Queued jobs of a higher priority are started first.
+        :param weight: Share of the workers relative to other endpoints of the same priority while both have jobs queued.
+        :param cache: Cache the results by the request parameters. Uploaded files are compared by content.
+            Equal requests are answered from the cache or follow the running job instead of executing the function again.
+        :param cache_ttl: Seconds a result is served from the cache.
+        :param cache_max_bytes: Maximum size of the cached results. Least recently used results are evicted first.
+        :param batch_route: Also add POST {path}/batch, which creates one job per input of a list.
+            Not available with runpod.
         """
         raise NotImplementedError("Implement in subclass")
 
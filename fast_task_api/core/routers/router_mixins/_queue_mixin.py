@@ -1,8 +1,13 @@
 import functools
+from typing import Union
 
-from fast_task_api.CONSTS import SERVER_STATUS
+from fast_task_api.CONSTS import SERVER_STATUS, FTAPI_EXECUTORS
 from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.JobProfiler import requested_profile
+from fast_task_api.core.job.InternalJob import JOB_PRIORITY
 from fast_task_api.core.job.JobResult import JobResultFactory, JobResult
+from fast_task_api.core.job.JobResultResponse import JobResultResponse
+from fast_task_api.settings import FTAPI_RESULT_INLINE_MAX_BYTES
 
 class _QueueMixin:
     """
@@ -20,6 +25,16 @@ class _QueueMixin:
     def job_queue_func(
             self,
             queue_size: int = 100,
+            max_concurrency: int = None,
+            executor: Union[FTAPI_EXECUTORS, str] = FTAPI_EXECUTORS.THREAD,
+            timeout: int = 3600,
+            batch_size: int = None,
+            max_batch_wait_ms: float = 20,
+            priority: Union[JOB_PRIORITY, str] = JOB_PRIORITY.NORMAL,
+            weight: float = 1,
+            cache: bool = False,
+            cache_ttl: float = 3600,
+            cache_max_bytes: int = 256 * 1024 ** 2,
             *args,
             **kwargs
     ):
@@ -28,11 +43,35 @@ class _QueueMixin:
         - Add api key validation
         - Create a job and add to the job queue
         - Return job
+        :param queue_size: The maximum number of jobs that can be queued. If exceeded the job is rejected.
+        :param max_concurrency: The maximum number of jobs of this function that are executed at the same time.
+            If None, only the global number of workers (FTAPI_MAX_WORKERS) limits the execution.
+        :param executor: "thread" runs the jobs in worker threads of the server.
+            "process" runs the jobs in worker processes. Use it for CPU bound tasks. Jobs exceeding their timeout
+            are killed. The function and its arguments must be picklable.
+        :param timeout: Seconds after which a job is set to status Timeout. None disables the timeout.
+        :param batch_size: If set, queued jobs are executed in batches of up to batch_size jobs with a single call.
+            The function receives a list of values for each parameter and returns a list with one result per job.
+        :param max_batch_wait_ms: Milliseconds a queued job waits for further jobs to fill its batch.
+        :param priority: "high", "normal" or "low". Queued jobs of a higher priority are started first.
+        :param weight: Share of the workers relative to other endpoints of the same priority while both have jobs queued.
+        :param cache: Cache the results by the request parameters. Uploaded files are compared by content.
+            Equal requests are answered from the cache or follow the running job instead of executing the function again.
+        :param cache_ttl: Seconds a result is served from the cache.
+        :param cache_max_bytes: Maximum size of the cached results. Least recently used results are evicted first.
         """
 
         # add the queue to the job queue
         def decorator(func):
             self.job_queue.set_queue_size(func, queue_size)
+            self.job_queue.set_max_concurrency(func, max_concurrency)
+            self.job_queue.set_executor(func, executor)
+            self.job_queue.set_timeout(func, timeout)
+            self.job_queue.set_batching(func, batch_size, max_batch_wait_ms)
+            self.job_queue.set_priority(func, priority, weight)
+            self.job_queue.set_cache(func, cache, ttl=cache_ttl, max_bytes=cache_max_bytes)
+            # resumes the jobs of this function which are still queued in the job store
+            self.job_queue.register_function(func)
 
             @functools.wraps(func)
             def job_creation_func_wrapper(*wrapped_func_args, **wrapped_func_kwargs) -> JobResult:
@@ -41,11 +80,13 @@ class _QueueMixin:
                 # create a job and add to the job queue
                 internal_job = self.job_queue.add_job(
                     job_function=func,
-                    job_params=wrapped_func_kwargs
+                    job_params=wrapped_func_kwargs,
+                    profile=requested_profile.get()
                 )
-                ret_job = JobResultFactory.from_internal_job(internal_job)
-                ret_job.refresh_job_url = f"/job?job_id={ret_job.id}"
-                return ret_job
+                # jobs answered from the result cache are finished right away
+                return JobResultResponse(JobResultFactory.to_json(
+                    internal_job, inline_max_bytes=FTAPI_RESULT_INLINE_MAX_BYTES
+                ))
 
             return job_creation_func_wrapper
 
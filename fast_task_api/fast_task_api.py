@@ -1,9 +1,25 @@
+import importlib
 from fast_task_api.CONSTS import FTAPI_BACKENDS, FTAPI_DEPLOYMENTS
 from fast_task_api.settings import FTAPI_BACKEND, FTAPI_PORT, FTAPI_DEPLOYMENT, FTAPI_HOST
 from fast_task_api.core.routers._socaity_router import _SocaityRouter
-from fast_task_api.core.routers._runpod_router import SocaityRunpodRouter
-from fast_task_api.core.routers._fastapi_router import SocaityFastAPIRouter
-from typing import Union
+from typing import Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fast_task_api.core.routers._runpod_router import SocaityRunpodRouter
+    from fast_task_api.core.routers._fastapi_router import SocaityFastAPIRouter
+
+# the routers are imported when their backend is used. A runpod worker never loads fastapi and uvicorn and vice versa.
+_ROUTER_MODULES = {
+    "SocaityFastAPIRouter": "fast_task_api.core.routers._fastapi_router",
+    "SocaityRunpodRouter": "fast_task_api.core.routers._runpod_router",
+}
+
+
+def __getattr__(name: str):
+    if name in _ROUTER_MODULES:
+        return getattr(importlib.import_module(_ROUTER_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def FastTaskAPI(
         backend: Union[FTAPI_BACKENDS, str] = FTAPI_BACKEND,
@@ -11,7 +27,7 @@ def FastTaskAPI(
         host: str = FTAPI_HOST,
         port: int = FTAPI_PORT,
         *args, **kwargs
-) -> Union[_SocaityRouter, SocaityRunpodRouter, SocaityFastAPIRouter]:
+) -> Union[_SocaityRouter, "SocaityRunpodRouter", "SocaityFastAPIRouter"]:
     """
     Initialize a _SocaityRouter with the appropriate backend running in the specified environment
     This function is a factory function that returns the appropriate app based on the backend and environment
@@ -30,11 +46,12 @@ def FastTaskAPI(
     backend = FTAPI_BACKENDS(backend) if type(backend) is str else backend
 
     class_map = {
-        FTAPI_BACKENDS.FASTAPI: SocaityFastAPIRouter,
-        FTAPI_BACKENDS.RUNPOD: SocaityRunpodRouter
+        FTAPI_BACKENDS.FASTAPI: "SocaityFastAPIRouter",
+        FTAPI_BACKENDS.RUNPOD: "SocaityRunpodRouter"
     }
     if backend not in class_map:
         raise Exception(f"Backend {backend.value} not found")
+    router_class = __getattr__(class_map[backend])
 
     if deployment is None:
         deployment = FTAPI_DEPLOYMENTS.LOCALHOST
@@ -42,7 +59,7 @@ def FastTaskAPI(
 
     print(f"Starting fast-task-api with backend {backend} in deployment mode {deployment}  "
           f"with host {host} on port {port}")
-    backend_instance = class_map[backend](deployment=deployment, host=host, port=port, *args, **kwargs)
+    backend_instance = router_class(deployment=deployment, host=host, port=port, *args, **kwargs)
     # ToDo: add default endpoints status, get_job here instead of the subclasses
     #app.add_route(path="/status")(app.get_status)
     #app.add_route(path="/job")(app.get_job)
@@ -1,4 +1,4 @@
-import sys
+import os
 from os import environ
 from fast_task_api.CONSTS import FTAPI_BACKENDS, FTAPI_DEPLOYMENTS
 
@@ -9,8 +9,50 @@ FTAPI_BACKEND = environ.get("FTAPI_BACKEND", FTAPI_BACKENDS.FASTAPI)
 FTAPI_HOST = environ.get("FTAPI_HOST", "0.0.0.0")
 FTAPI_PORT = environ.get("FTAPI_PORT", 8000)
 
-# to run the runpod serverless framework locally, the following two lines must be added
-if FTAPI_BACKEND == FTAPI_BACKENDS.RUNPOD and FTAPI_DEPLOYMENT == FTAPI_DEPLOYMENTS.LOCALHOST:
-    sys.argv.extend(['rp_serve_api', '1'])
-    sys.argv.extend(['--rp_serve_api', '1'])
+# Maximum number of jobs executed at the same time by the job queue. Further jobs stay queued until a worker is free.
+FTAPI_MAX_WORKERS = int(environ.get("FTAPI_MAX_WORKERS", 8))
+# Number of worker processes for endpoints with executor="process". Defaults to the number of cpu cores.
+FTAPI_MAX_PROCESS_WORKERS = int(environ.get("FTAPI_MAX_PROCESS_WORKERS", os.cpu_count() or 1))
+# Arguments and results of process jobs of at least this size (bytes) are transferred via shared memory.
+FTAPI_SHARED_MEMORY_THRESHOLD = int(environ.get("FTAPI_SHARED_MEMORY_THRESHOLD", 1024 * 1024))
+# Maximum number of jobs of async task functions running concurrently on the event loop of the job queue.
+FTAPI_MAX_ASYNC_JOBS = int(environ.get("FTAPI_MAX_ASYNC_JOBS", 1000))
+# Maximum number of chunks of a generator task function buffered per job. If exceeded, the oldest chunks are dropped.
+FTAPI_MAX_STREAM_CHUNKS = int(environ.get("FTAPI_MAX_STREAM_CHUNKS", 1000))
+# Maximum seconds a long-poll of the /job endpoint (wait parameter) holds the request open.
+FTAPI_MAX_WAIT = float(environ.get("FTAPI_MAX_WAIT", 60))
 
+# Uploaded files of at least this size (bytes) are streamed into a temporary file instead of being kept in memory.
+FTAPI_UPLOAD_SPOOL_THRESHOLD = int(environ.get("FTAPI_UPLOAD_SPOOL_THRESHOLD", 16 * 1024 * 1024))
+# File results larger than this size (bytes) are not inlined as base64 into the json of the job. Instead the job
+# carries the url of the /job/{job_id}/result endpoint, which streams the raw bytes.
+FTAPI_RESULT_INLINE_MAX_BYTES = int(environ.get("FTAPI_RESULT_INLINE_MAX_BYTES", 8 * 1024 * 1024))
+# Responses of at least this size (bytes) are compressed if the client accepts gzip, or br / zstd if brotli /
+# zstandard are installed.
+FTAPI_COMPRESSION_MIN_BYTES = int(environ.get("FTAPI_COMPRESSION_MIN_BYTES", 1024))
+# Compression level of the responses. Unset uses a fast level of each encoding (gzip 6, br 4, zstd 3).
+FTAPI_COMPRESSION_LEVEL = int(environ["FTAPI_COMPRESSION_LEVEL"]) if environ.get("FTAPI_COMPRESSION_LEVEL") else None
+
+# Profiling of the task functions. Fraction (0 - 1) of the jobs whose execution is profiled. 0 disables it.
+FTAPI_PROFILE_SAMPLE_RATE = float(environ.get("FTAPI_PROFILE_SAMPLE_RATE", 0))
+# Profilers used for the sampled jobs, comma separated: "cpu" (cProfile) and / or "memory" (tracemalloc).
+FTAPI_PROFILE_MODES = environ.get("FTAPI_PROFILE_MODES", "cpu,memory")
+# If true, a request can ask to profile its job with the header X-FTAPI-Profile: cpu,memory.
+FTAPI_PROFILE_ON_REQUEST = environ.get("FTAPI_PROFILE_ON_REQUEST", "false").lower() in ("1", "true", "yes")
+# Number of profiles kept for the /job/{job_id}/profile endpoint. The oldest are removed first.
+FTAPI_MAX_PROFILES = int(environ.get("FTAPI_MAX_PROFILES", 100))
+
+# Retention of finished jobs which results were not retrieved yet
+# Seconds a result is kept in memory after the job finished.
+FTAPI_RESULT_TTL = float(environ.get("FTAPI_RESULT_TTL", 3600))
+# Maximum number of finished jobs kept in memory. Least recently used results are evicted first.
+FTAPI_MAX_RESULTS = int(environ.get("FTAPI_MAX_RESULTS", 10000))
+# Maximum estimated size in bytes of all results kept in memory. Least recently used results are evicted first.
+FTAPI_RESULT_MEMORY_BUDGET = int(environ.get("FTAPI_RESULT_MEMORY_BUDGET", 1024 ** 3))
+
+# Persistence of the jobs. "memory" keeps them only in memory. "sqlite:<path>" persists them in a SQLite database,
+# so that queued jobs are resumed and results can be retrieved after a restart.
+FTAPI_JOB_STORE = environ.get("FTAPI_JOB_STORE", "memory")
+# Number of server processes. With more than one, the processes share their jobs via the job store (a SQLite
+# database in the temp directory if FTAPI_JOB_STORE is "memory"). Any process can answer the requests for any job.
+FTAPI_WORKERS = int(environ.get("FTAPI_WORKERS", 1))
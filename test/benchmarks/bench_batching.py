@@ -0,0 +1,70 @@
+"""
+Benchmark of dynamic micro-batching in the JobQueue.
+Runs the same NumPy workload (a dense layer: matrix product + activation) once as one job per call and once
+as a batch-aware function with batch_size jobs per call, and compares the throughput in jobs/sec.
+
+Usage: python -m test.benchmarks.bench_batching [--jobs 5000] [--dim 512] [--batch-size 32] [--max-batch-wait-ms 20]
+Requires numpy.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.job.InternalJob import JOB_STATUS
+
+
+def _make_functions(weights: np.ndarray):
+    def dense(x: np.ndarray):
+        return np.tanh(weights @ x)
+
+    def dense_batch(x: list):
+        return list(np.tanh(np.stack(x) @ weights.T))
+
+    return dense, dense_batch
+
+
+def _throughput(job_queue, job_function, inputs: list) -> float:
+    start = time.perf_counter()
+    jobs = [job_queue.add_job(job_function, {"x": x}) for x in inputs]
+    pending = list(jobs)
+    while pending:
+        pending = [job for job in pending if job.status in (JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING)]
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    failed = [job for job in jobs if job.status != JOB_STATUS.FINISHED]
+    if failed:
+        raise Exception(f"{len(failed)} jobs failed: {failed[0].job_progress._message}")
+    return len(jobs) / elapsed
+
+
+def run(n_jobs: int, dim: int, batch_size: int, max_batch_wait_ms: float):
+    rng = np.random.default_rng(0)
+    weights = rng.standard_normal((dim, dim)).astype(np.float32)
+    inputs = list(rng.standard_normal((n_jobs, dim)).astype(np.float32))
+    dense, dense_batch = _make_functions(weights)
+
+    # use a fresh (non singleton) instance to not interfere with other queues in the process
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_queue_size(dense, n_jobs + 1)
+    job_queue.set_queue_size(dense_batch, n_jobs + 1)
+    job_queue.set_batching(dense_batch, batch_size, max_batch_wait_ms)
+
+    unbatched = _throughput(job_queue, dense, inputs)
+    batched = _throughput(job_queue, dense_batch, inputs)
+    print(f"{'mode':>24} | {'jobs/sec':>10}")
+    print(f"{'one job per call':>24} | {unbatched:10.0f}")
+    print(f"{f'batch_size={batch_size}':>24} | {batched:10.0f}")
+    print(f"speedup: {batched / unbatched:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-batch-wait-ms", type=float, default=20)
+    args = parser.parse_args()
+    run(args.jobs, args.dim, args.batch_size, args.max_batch_wait_ms)
@@ -0,0 +1,62 @@
+"""
+Microbenchmark of the per-job dispatch overhead for trivial task functions.
+Measures the time the JobQueue needs to execute a queued job in a worker thread (process_job without the queueing)
+and the time the runpod router needs to route a request to the task function, for a function with a JobProgress
+parameter and a parameter with a default value.
+
+Usage: python -m test.benchmarks.bench_dispatch_overhead [--iterations 20000]
+"""
+import argparse
+import time
+
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.job.InternalJob import InternalJob
+from fast_task_api.core.job.JobProgress import JobProgress
+from fast_task_api.core.routers._runpod_router import SocaityRunpodRouter
+
+
+def trivial(x: int, job_progress: JobProgress, scale: float = 1.0):
+    return x * scale
+
+
+def _job_queue_overhead(iterations: int) -> float:
+    job_queue = JobQueue.__wrapped__()
+    job_queue.register_function(trivial)
+    jobs = [InternalJob(job_function=trivial, job_params={"x": i}) for i in range(iterations)]
+    start = time.perf_counter()
+    for job in jobs:
+        job_queue.process_job(job)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _runpod_overhead(iterations: int) -> float:
+    router = SocaityRunpodRouter()
+    router.task_endpoint("/trivial")(trivial)
+    # the handler consumes the path of the input
+    jobs = [{"id": str(i), "input": {"path": "trivial", "x": i}} for i in range(iterations)]
+    start = time.perf_counter()
+    for job in jobs:
+        router.handler(job)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _direct_call(iterations: int) -> float:
+    job_progress = JobProgress()
+    start = time.perf_counter()
+    for i in range(iterations):
+        trivial(x=i, job_progress=job_progress)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations: int):
+    print(f"{'dispatch':>26} | {'us per job':>10}")
+    print(f"{'direct call':>26} | {_direct_call(iterations):10.2f}")
+    print(f"{'JobQueue.process_job':>26} | {_job_queue_overhead(iterations):10.2f}")
+    print(f"{'SocaityRunpodRouter':>26} | {_runpod_overhead(iterations):10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    run(args.iterations)
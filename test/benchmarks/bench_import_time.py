@@ -0,0 +1,98 @@
+"""
+Cold start benchmark: the import time of fast_task_api and of creating the router of each backend, measured with
+python -X importtime in a fresh process. Fails (exit code 1) if a scenario exceeds its time budget or imports a
+module of the other backend, for example a runpod worker importing fastapi or uvicorn.
+Every scenario is measured --repeat times and the fastest run is reported, to reduce the noise of disk caches.
+
+Usage: python -m test.benchmarks.bench_import_time [--repeat 5] [--budget-scale 1.0] [--top 5]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# name: (code, budget in ms, modules which must not be imported)
+SCENARIOS = {
+    "import": (
+        "import fast_task_api",
+        50, ("fastapi", "starlette", "uvicorn", "runpod", "media_toolkit")
+    ),
+    "runpod router": (
+        "import fast_task_api; fast_task_api.FastTaskAPI(backend='runpod')",
+        400, ("fastapi", "starlette", "uvicorn", "media_toolkit")
+    ),
+    "fastapi router": (
+        "import fast_task_api; fast_task_api.FastTaskAPI(backend='fastapi')",
+        1500, ("runpod", "media_toolkit")
+    ),
+}
+
+_IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _measure(code: str) -> tuple:
+    """
+    :return: (total ms, {module: cumulative ms} of the top level imports, set of all imported modules)
+    """
+    # settings are read from the environment. Keep the defaults for every run.
+    env = {k: v for k, v in os.environ.items() if not k.startswith("FTAPI_")}
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env
+    )
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1])
+
+    top_level, modules = {}, set()
+    for line in output.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        cumulative_us, indent, module = int(match.group(2)), len(match.group(3)), match.group(4)
+        modules.add(module)
+        if indent == 1:
+            top_level[module] = cumulative_us / 1000
+    return sum(top_level.values()), top_level, modules
+
+
+def _baseline() -> float:
+    # the interpreter start up imports (site, encodings) which every scenario pays
+    total, _, _ = _measure("pass")
+    return total
+
+
+def run(repeat: int, budget_scale: float, top: int) -> bool:
+    baseline = min(_baseline() for _ in range(repeat))
+    print(f"interpreter baseline: {baseline:.1f}ms (subtracted)")
+    print(f"{'scenario':>16} | {'import ms':>9} | {'budget ms':>9} | result")
+    passed = True
+    for name, (code, budget, forbidden) in SCENARIOS.items():
+        runs = [_measure(code) for _ in range(repeat)]
+        total, top_level, modules = min(runs, key=lambda r: r[0])
+        total -= baseline
+        budget *= budget_scale
+        forbidden_imports = sorted(module for module in forbidden if module in modules)
+        ok = total <= budget and len(forbidden_imports) == 0
+        passed = passed and ok
+        result = "ok" if ok else "FAILED"
+        if total > budget:
+            result += " over budget"
+        if forbidden_imports:
+            result += f" imports {', '.join(forbidden_imports)}"
+        print(f"{name:>16} | {total:9.1f} | {budget:9.0f} | {result}")
+        slowest = sorted(
+            ((module, ms) for module, ms in top_level.items() if module not in ("site", "encodings")),
+            key=lambda item: -item[1]
+        )[:top]
+        for module, ms in slowest:
+            print(f"{'':>16}   {ms:9.1f}   {module}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="multiplies the budgets for slow machines")
+    parser.add_argument("--top", type=int, default=5, help="number of the slowest top level imports to show")
+    args = parser.parse_args()
+    sys.exit(0 if run(args.repeat, args.budget_scale, args.top) else 1)
@@ -0,0 +1,63 @@
+"""
+Benchmark of the JobQueue job store.
+Measures the latency of add_job and get_job while the store holds an increasing number of retained jobs.
+With an indexed store the latency should stay flat from 10 to 1,000,000 stored jobs.
+
+Usage: python -m test.benchmarks.bench_job_queue [--sizes 10 1000 1000000] [--samples 1000]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.job.InternalJob import InternalJob, JOB_STATUS
+
+
+def noop():
+    return None
+
+
+def _fill_store(job_queue, n_jobs: int):
+    # simulate retained, finished jobs of which the results were not retrieved yet
+    while len(job_queue.jobs) < n_jobs:
+        job = InternalJob(job_function=noop, job_params={})
+        job.status = JOB_STATUS.FINISHED
+        job_queue.jobs[job.id] = job
+
+
+def _measure(func, args_list) -> list:
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def _fmt(timings: list) -> str:
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    return f"median {statistics.median(timings):8.2f}us  p99 {p99:8.2f}us"
+
+
+def run(sizes: list, samples: int):
+    # use a fresh (non singleton) instance to not interfere with other queues in the process
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_queue_size(noop, samples * len(sizes) + 1)
+
+    print(f"{'stored jobs':>12} | {'get_job':^32} | {'add_job':^32}")
+    for size in sizes:
+        _fill_store(job_queue, size)
+        job_ids = random.choices(list(job_queue.jobs.keys()), k=samples)
+        get_timings = _measure(job_queue.get_job, [(job_id, True) for job_id in job_ids])
+        add_timings = _measure(job_queue.add_job, [(noop, {})] * samples)
+        print(f"{size:>12} | {_fmt(get_timings)} | {_fmt(add_timings)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1_000, 100_000, 1_000_000])
+    parser.add_argument("--samples", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.sizes, args.samples)
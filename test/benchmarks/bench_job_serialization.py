@@ -0,0 +1,97 @@
+"""
+Microbenchmark of the serialization of a polled job to the json response body.
+Compares the previous path (JobResult pydantic model built by from_internal_job, serialized like FastAPI does
+with jsonable_encoder and json.dumps) with JobResultFactory.to_json, for a running job and for a finished job whose
+serialized result is kept with the job. The runpod result serialization is compared the same way.
+
+Usage: python -m test.benchmarks.bench_job_serialization [--iterations 20000] [--result-items 100]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from fast_task_api.core.job.InternalJob import InternalJob, JOB_STATUS
+from fast_task_api.core.job.JobResult import JobResult, JobResultFactory, orjson
+from fast_task_api.core.routers._runpod_router import SocaityRunpodRouter
+
+
+def _task():
+    pass
+
+
+def _make_job(result_items: int, finished: bool) -> InternalJob:
+    job = InternalJob(_task, {})
+    job.queued_at = job.execution_started_at = datetime.utcnow()
+    if finished:
+        job.result = {
+            "labels": [f"label_{i}" for i in range(result_items)],
+            "scores": [i / 3 for i in range(result_items)]
+        }
+        job.status = JOB_STATUS.FINISHED
+        job.job_progress.set_status(1.0, None)
+        job.execution_finished_at = datetime.utcnow()
+    else:
+        job.status = JOB_STATUS.PROCESSING
+        job.job_progress.set_status(0.42, "running inference")
+    return job
+
+
+def _previous_path(job: InternalJob) -> bytes:
+    ret_job = JobResultFactory.from_internal_job(job)
+    ret_job.refresh_job_url = f"/job?job_id={ret_job.id}"
+    return json.dumps(jsonable_encoder(ret_job)).encode("utf-8")
+
+
+def _previous_runpod(job: dict, start_time: datetime, res) -> str:
+    result = JobResult(id=job['id'], execution_started_at=start_time.strftime("%Y-%m-%dT%H:%M:%S.%f%z"))
+    result.result = res
+    result.status = JOB_STATUS.FINISHED.value
+    result.execution_finished_at = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%f%z")
+    return json.dumps(result.model_dump())
+
+
+def _per_second(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - start)
+
+
+def run(iterations: int, result_items: int):
+    running = _make_job(result_items, finished=False)
+    finished = _make_job(result_items, finished=True)
+    runpod_job, start_time = {"id": "runpod-job"}, datetime.utcnow()
+    assert json.loads(_previous_path(finished)) == json.loads(JobResultFactory.to_json(finished))
+
+    rows = [
+        ("running job", "pydantic + json",
+         _per_second(lambda: _previous_path(running), iterations)),
+        ("running job", "to_json",
+         _per_second(lambda: JobResultFactory.to_json(running), iterations)),
+        ("finished job", "pydantic + json",
+         _per_second(lambda: _previous_path(finished), iterations)),
+        ("finished job", "to_json",
+         _per_second(lambda: JobResultFactory.to_json(finished), iterations)),
+        ("finished job", "to_json (kept)",
+         _per_second(lambda: JobResultFactory.to_json(finished, finished=True), iterations)),
+        ("runpod result", "pydantic + json",
+         _per_second(lambda: _previous_runpod(runpod_job, start_time, finished.result), iterations)),
+        ("runpod result", "dict + dumps",
+         _per_second(lambda: SocaityRunpodRouter._to_runpod_result(runpod_job, start_time, finished.result, None),
+                     iterations)),
+    ]
+    print(f"json encoder: {'orjson' if orjson is not None else 'json'}, result items: {result_items}")
+    print(f"{'job':>14} | {'serialization':>16} | {'calls/sec':>10}")
+    for job, serialization, per_second in rows:
+        print(f"{job:>14} | {serialization:>16} | {per_second:10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--result-items", type=int, default=100)
+    args = parser.parse_args()
+    run(args.iterations, args.result_items)
@@ -0,0 +1,64 @@
+"""
+Benchmark of the job stores of the JobQueue.
+Measures the submit throughput (add_job calls/sec) without persistence and with the SQLite job store, which commits
+the writes of a background thread in groups. Afterwards it checks that all submitted jobs were persisted.
+
+Usage: python -m test.benchmarks.bench_job_store [--jobs 20000] [--flush-interval 0.05]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.job_store import InMemoryJobStore, SQLiteJobStore
+
+
+def _submit_throughput(job_store, n_jobs: int) -> float:
+    # the jobs block until all are submitted, so that only the submit path is measured
+    release = threading.Event()
+
+    def blocked_task(x: int):
+        release.wait()
+        return x
+
+    # use a fresh (non singleton) instance to not interfere with other queues in the process
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_job_store(job_store)
+    job_queue.set_queue_size(blocked_task, n_jobs + 1)
+    job_queue.register_function(blocked_task)
+
+    start = time.perf_counter()
+    for i in range(n_jobs):
+        job_queue.add_job(blocked_task, {"x": i})
+    elapsed = time.perf_counter() - start
+    release.set()
+    return n_jobs / elapsed
+
+
+def run(n_jobs: int, flush_interval: float):
+    memory = _submit_throughput(InMemoryJobStore(), n_jobs)
+
+    path = os.path.join(tempfile.mkdtemp(), "bench_jobs.db")
+    job_store = SQLiteJobStore(path=path, flush_interval=flush_interval)
+    sqlite = _submit_throughput(job_store, n_jobs)
+    job_store.flush()
+    persisted = sqlite3.connect(path).execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+    job_store.close()
+
+    print(f"{'job store':>24} | {'add_job/sec':>12}")
+    print(f"{'memory':>24} | {memory:12.0f}")
+    print(f"{'sqlite':>24} | {sqlite:12.0f}")
+    print(f"persisted jobs: {persisted} of {n_jobs}")
+    if persisted < n_jobs:
+        raise Exception("Not all submitted jobs were persisted.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--flush-interval", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.jobs, args.flush_interval)
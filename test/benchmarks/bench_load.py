@@ -0,0 +1,265 @@
+"""
+Load test of the job lifecycle of a SocaityFastAPIRouter running in-process behind httpx's ASGI transport.
+Jobs are submitted open-loop at a fixed rate and polled until they finished. Every workload runs in its own process.
+Reported per workload:
+- submit latency: duration of the request which creates the job
+- submit-to-start: created_at to execution_started_at of the job (server clock)
+- end-to-end: start of the submit request until the client saw the finished job
+- jobs/sec: finished jobs per second of wall time
+- peak RSS and peak thread count of the process
+
+The results are written as json with --output. Pass a previous result file with --compare to print the changes.
+
+Usage: python -m test.benchmarks.bench_load [--workloads quick slow upload] [--jobs 500] [--rate 200]
+       [--duration-ms 0] [--payload-bytes 0] [--result-bytes 100] [--poll-interval 0.05]
+       [--output results.json] [--compare previous.json]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+# rate: submitted jobs per second, duration_ms: run time of the task function,
+# poll_interval: seconds between two polls of a job. 0 long-polls with wait instead.
+WORKLOADS = {
+    "quick": {"jobs": 1000, "rate": 500, "duration_ms": 0, "payload_bytes": 0, "result_bytes": 100,
+              "poll_interval": 0.05},
+    "slow": {"jobs": 200, "rate": 50, "duration_ms": 100, "payload_bytes": 0, "result_bytes": 100,
+             "poll_interval": 0.05},
+    "long_poll": {"jobs": 200, "rate": 50, "duration_ms": 100, "payload_bytes": 0, "result_bytes": 100,
+                  "poll_interval": 0},
+    "upload": {"jobs": 100, "rate": 20, "duration_ms": 0, "payload_bytes": 1024 ** 2, "result_bytes": 100,
+               "poll_interval": 0.05},
+    "large_result": {"jobs": 100, "rate": 20, "duration_ms": 0, "payload_bytes": 0, "result_bytes": 1024 ** 2,
+                     "poll_interval": 0.05},
+}
+# metrics where a smaller value is better. Used by --compare.
+_LOWER_IS_BETTER = ("latency", "peak_rss_mb", "peak_threads", "failed")
+
+
+def _percentiles(values: list) -> dict:
+    if len(values) == 0:
+        return {}
+    values = sorted(values)
+    return {
+        "p50": values[int(len(values) * 0.5)],
+        "p90": values[int(len(values) * 0.9)],
+        "p99": values[int(len(values) * 0.99)],
+        "max": values[-1]
+    }
+
+
+class _PeakThreads:
+    """
+    Samples the number of threads in a background thread while the with block runs.
+    """
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count() - 1)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+
+def _create_app(workload: dict):
+    from fast_task_api.core.routers._fastapi_router import SocaityFastAPIRouter
+    from media_toolkit import MediaFile
+
+    router = SocaityFastAPIRouter()
+    queue_size = workload["jobs"] + 1
+
+    if workload["payload_bytes"] > 0:
+        @router.task_endpoint("/work", queue_size=queue_size)
+        def work(payload: MediaFile, duration_ms: float = 0, result_bytes: int = 0):
+            time.sleep(duration_ms / 1000)
+            return "x" * result_bytes
+    else:
+        @router.task_endpoint("/work", queue_size=queue_size)
+        def work(duration_ms: float = 0, result_bytes: int = 0):
+            time.sleep(duration_ms / 1000)
+            return "x" * result_bytes
+
+    router.app.include_router(router)
+    return router.app
+
+
+async def _run_job(client, workload: dict, payload: bytes, timings: dict):
+    params = {"duration_ms": workload["duration_ms"], "result_bytes": workload["result_bytes"]}
+    submitted_at = time.perf_counter()
+    if payload is not None:
+        response = await client.post("/api/work", params=params, files={"payload": ("payload.bin", payload)})
+    else:
+        response = await client.post("/api/work", params=params)
+    timings["submit"].append(time.perf_counter() - submitted_at)
+    job = response.json()
+
+    poll_params = {"job_id": job["id"], "keep_in_memory": True}
+    if workload["poll_interval"] <= 0:
+        poll_params["wait"] = 30
+    while job.get("status") in ("Queued", "Processing"):
+        if workload["poll_interval"] > 0:
+            await asyncio.sleep(workload["poll_interval"])
+        job = (await client.get("/api/job", params=poll_params)).json()
+    timings["end_to_end"].append(time.perf_counter() - submitted_at)
+
+    if job.get("status") != "Finished":
+        timings["failed"] += 1
+        return
+    # the last poll removes the job
+    await client.get("/api/job", params={"job_id": job["id"]})
+    created_at = datetime.fromisoformat(job["created_at"])
+    started_at = datetime.fromisoformat(job["execution_started_at"])
+    timings["submit_to_start"].append((started_at - created_at).total_seconds())
+
+
+async def _drive(workload: dict) -> dict:
+    import httpx
+
+    app = _create_app(workload)
+    payload = b"\0" * workload["payload_bytes"] if workload["payload_bytes"] > 0 else None
+    timings = {"submit": [], "submit_to_start": [], "end_to_end": [], "failed": 0}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        # warm up the routes and the worker threads
+        await _run_job(client, workload, payload, {"submit": [], "submit_to_start": [], "end_to_end": [],
+                                                   "failed": 0})
+        with _PeakThreads() as threads:
+            start = time.perf_counter()
+            tasks = []
+            for i in range(workload["jobs"]):
+                # open-loop: jobs are submitted at the rate no matter how fast the previous ones finish
+                delay = start + i / workload["rate"] - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(_run_job(client, workload, payload, timings)))
+            await asyncio.gather(*tasks)
+            wall_time = time.perf_counter() - start
+
+    return {
+        "jobs": workload["jobs"],
+        "failed": timings["failed"],
+        "wall_seconds": wall_time,
+        "jobs_per_second": (workload["jobs"] - timings["failed"]) / wall_time,
+        "submit_latency_ms": {k: v * 1000 for k, v in _percentiles(timings["submit"]).items()},
+        "submit_to_start_latency_ms": {k: v * 1000 for k, v in _percentiles(timings["submit_to_start"]).items()},
+        "end_to_end_latency_ms": {k: v * 1000 for k, v in _percentiles(timings["end_to_end"]).items()},
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_threads": threads.peak,
+    }
+
+
+def _version() -> dict:
+    version = {"python": platform.python_version(), "platform": platform.platform()}
+    try:
+        import importlib.metadata
+        version["fast_task_api"] = importlib.metadata.version("fast-task-api")
+    except Exception:
+        version["fast_task_api"] = None
+    try:
+        version["git"] = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        version["git"] = None
+    return version
+
+
+def _flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _compare(previous: dict, current: dict):
+    print(f"\nchanges compared to {previous['version'].get('git') or previous['created_at']}")
+    print(f"{'metric':>52} | {'previous':>10} | {'current':>10} | {'change':>8}")
+    for name, workload in current["workloads"].items():
+        if name not in previous["workloads"]:
+            continue
+        before = _flatten(previous["workloads"][name]["results"])
+        after = _flatten(workload["results"])
+        for metric, value in after.items():
+            if metric not in before or before[metric] == 0 or metric in ("jobs", "wall_seconds"):
+                continue
+            change = value / before[metric] - 1
+            worse = change > 0 if any(key in metric for key in _LOWER_IS_BETTER) else change < 0
+            flag = " !" if worse and abs(change) > 0.1 else ""
+            print(f"{name + '.' + metric:>52} | {before[metric]:10.2f} | {value:10.2f} | {change:+8.1%}{flag}")
+
+
+def _print_results(name: str, results: dict):
+    print(f"\n{name}: {results['jobs']} jobs, {results['failed']} failed, {results['jobs_per_second']:.1f} jobs/sec, "
+          f"peak rss {results['peak_rss_mb']:.0f} MB, peak threads {results['peak_threads']}")
+    for metric in ("submit_latency_ms", "submit_to_start_latency_ms", "end_to_end_latency_ms"):
+        values = "  ".join(f"{k} {v:8.2f}" for k, v in results[metric].items())
+        print(f"{metric:>27}  {values}")
+
+
+def run(workload_names: list, overrides: dict, output: str = None, compare: str = None):
+    report = {"created_at": datetime.now().isoformat(), "version": _version(), "workloads": {}}
+    for name in workload_names:
+        workload = {**WORKLOADS[name], **{k: v for k, v in overrides.items() if v is not None}}
+        child = subprocess.run(
+            [sys.executable, "-m", "test.benchmarks.bench_load", "--child", json.dumps(workload)],
+            capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            print(f"\n{name}: failed: {child.stderr.strip().splitlines()[-1:]}")
+            continue
+        results = json.loads(child.stdout.strip().splitlines()[-1])
+        report["workloads"][name] = {"workload": workload, "results": results}
+        _print_results(name, results)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {output}")
+    if compare:
+        with open(compare) as f:
+            _compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--rate", type=float, help="submitted jobs per second")
+    parser.add_argument("--duration-ms", type=float, help="run time of the task function")
+    parser.add_argument("--payload-bytes", type=int, help="size of the uploaded file. 0 uploads no file")
+    parser.add_argument("--result-bytes", type=int, help="size of the result of the task function")
+    parser.add_argument("--poll-interval", type=float, help="seconds between two polls. 0 long-polls")
+    parser.add_argument("--output", help="write the results as json to this file")
+    parser.add_argument("--compare", help="json results of a previous run to compare with")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(_drive(json.loads(args.child)))))
+    else:
+        run(args.workloads, {
+            "jobs": args.jobs, "rate": args.rate, "duration_ms": args.duration_ms,
+            "payload_bytes": args.payload_bytes, "result_bytes": args.result_bytes,
+            "poll_interval": args.poll_interval
+        }, output=args.output, compare=args.compare)
@@ -0,0 +1,65 @@
+"""
+Microbenchmark of the submit-to-start latency of the JobQueue.
+Measures the time between add_job and the first line of the job function for
+- jobs submitted to an idle server (after a pause)
+- jobs submitted back to back
+and the CPU time the process uses while the server is idle.
+
+Usage: python -m test.benchmarks.bench_submit_latency [--samples 200] [--idle 2.0]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from fast_task_api.core.JobManager import JobQueue
+
+
+def _percentiles(timings: list) -> str:
+    timings = sorted(timings)
+    p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+    return f"median {statistics.median(timings):8.1f}us  p99 {p99:8.1f}us  max {timings[-1]:8.1f}us"
+
+
+def run(samples: int, idle_seconds: float):
+    job_queue = JobQueue.__wrapped__()
+    started = threading.Event()
+    start_times = {}
+
+    def record_start(sample: int):
+        start_times[sample] = time.perf_counter()
+        started.set()
+
+    job_queue.set_queue_size(record_start, samples + 1)
+
+    def submit(sample: int) -> float:
+        started.clear()
+        submitted_at = time.perf_counter()
+        job_queue.add_job(record_start, {"sample": sample})
+        started.wait(timeout=5)
+        return (start_times[sample] - submitted_at) * 1e6
+
+    # warm up the worker pool and the scheduler thread
+    submit(-1)
+
+    after_idle = []
+    for i in range(min(samples, 20)):
+        time.sleep(0.05)
+        after_idle.append(submit(i))
+    back_to_back = [submit(samples + i) for i in range(samples)]
+
+    print(f"submit-to-start after idle   {_percentiles(after_idle)}")
+    print(f"submit-to-start back to back {_percentiles(back_to_back)}")
+
+    cpu_start = time.process_time()
+    time.sleep(idle_seconds)
+    cpu_used = time.process_time() - cpu_start
+    print(f"cpu time while idle for {idle_seconds}s: {cpu_used * 1000:.2f}ms ({cpu_used / idle_seconds:.2%})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--idle", type=float, default=2.0)
+    args = parser.parse_args()
+    run(args.samples, args.idle)
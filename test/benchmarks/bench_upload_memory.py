@@ -0,0 +1,115 @@
+"""
+Benchmark of the memory used to convert a large upload to the MediaFile a task function receives.
+Compares media_from_any (everything in memory) with media_from_upload (streamed into a temporary file) for a
+multipart upload (starlette UploadFile spooled to disk) and for a base64 string (runpod / json).
+Each conversion runs in its own process. Reported is the peak resident memory during the conversion on top of the
+memory used before it. Linux only (reads /proc/self/statm).
+
+Usage: python -m test.benchmarks.bench_upload_memory [--size-mb 1024] [--scenarios multipart base64]
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+_MODES = ("media_from_any", "media_from_upload")
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class _PeakRss:
+    """
+    Samples the resident memory in a background thread while the with block runs.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def _make_upload(size: int):
+    from starlette.datastructures import UploadFile
+    # starlette spools multipart uploads larger than 1 MB to a temporary file
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    chunk = os.urandom(1024 * 1024)
+    for _ in range(size // len(chunk)):
+        spooled.write(chunk)
+    spooled.seek(0)
+    return UploadFile(file=spooled, size=size, filename="upload.bin", headers={"content-type": "video/mp4"})
+
+
+def _make_base64(size: int) -> str:
+    chunk = os.urandom(3 * 1024 * 1024)
+    parts = [base64.b64encode(chunk).decode() for _ in range(size // len(chunk))]
+    return "".join(parts)
+
+
+def _measure(scenario: str, mode: str, size: int) -> dict:
+    # runs in the child process
+    from media_toolkit import MediaFile, media_from_any
+    from fast_task_api.compatibility.upload import media_from_upload, media_file_size
+
+    data = _make_upload(size) if scenario == "multipart" else _make_base64(size)
+    convert = media_from_any if mode == "media_from_any" else media_from_upload
+    before = _rss_bytes()
+    start = time.perf_counter()
+    with _PeakRss() as peak:
+        media_file = convert(data, MediaFile)
+    elapsed = time.perf_counter() - start
+    return {
+        "peak_mb": (peak.peak - before) / 1024 ** 2,
+        "seconds": elapsed,
+        "content_mb": media_file_size(media_file) / 1024 ** 2
+    }
+
+
+def run(size_mb: int, scenarios: list):
+    size = size_mb * 1024 * 1024
+    print(f"{'scenario':>10} | {'conversion':>18} | {'peak rss MB':>11} | {'seconds':>7}")
+    for scenario in scenarios:
+        for mode in _MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "test.benchmarks.bench_upload_memory", "--child", scenario, mode, str(size)],
+                capture_output=True, text=True
+            )
+            if output.returncode != 0:
+                print(f"{scenario:>10} | {mode:>18} | failed: {output.stderr.strip().splitlines()[-1:]}")
+                continue
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{scenario:>10} | {mode:>18} | {result['peak_mb']:11.0f} | {result['seconds']:7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--scenarios", nargs="+", default=["multipart", "base64"], choices=["multipart", "base64"])
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(_measure(args.child[0], args.child[1], int(args.child[2]))))
+    else:
+        run(args.size_mb, args.scenarios)
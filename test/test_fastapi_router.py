@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+from fast_task_api import FastTaskAPI
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.job_store.InMemoryJobStore import InMemoryJobStore
+from fast_task_api.core.job_store.SQLiteJobStore import SQLiteJobStore
+
+
+_FILE_CONTENT = bytes(range(256)) * 4
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def app():
+    app = FastTaskAPI()
+    # a job queue of its own instead of the singleton shared by all apps of the process
+    app.job_queue = JobQueue.__wrapped__()
+
+    @app.task_endpoint("/double", queue_size=10)
+    def double(x: int):
+        return x * 2
+
+    @app.task_endpoint("/file", queue_size=10)
+    def file():
+        from media_toolkit import MediaFile
+        return MediaFile(file_name="data.bin", content_type="application/octet-stream").from_bytes(_FILE_CONTENT)
+
+    app.app.include_router(app)
+    yield app
+    job_store = app.job_queue.job_store
+    # the claim thread of a shared job store stops when the job store is replaced
+    app.job_queue.set_job_store(InMemoryJobStore())
+    job_store.close()
+
+
+@pytest.fixture
+def client(app):
+    return TestClient(app.app)
+
+
+def _finished_job_ids(app, client, count: int) -> list:
+    job_ids = [client.post("/api/double", params={"x": x}).json()["id"] for x in range(count)]
+    _wait_for(lambda: all(app.job_queue.is_result_available(job_id) for job_id in job_ids))
+    return job_ids
+
+
+def test_jobs_cursor_skips_unchanged_jobs(app, client):
+    job_ids = _finished_job_ids(app, client, 2)
+    response = client.post("/api/jobs", json={"job_ids": job_ids, "keep_in_memory": True}).json()
+    assert len(response["jobs"]) == 2
+
+    query = {"job_ids": job_ids, "keep_in_memory": True, "cursor": response["cursor"]}
+    response = client.post("/api/jobs", json=query).json()
+    assert response["jobs"] == []
+
+
+def test_jobs_cursor_is_ignored_with_shared_job_store(app, client, tmp_path):
+    app.job_queue.set_job_store(SQLiteJobStore(str(tmp_path / "jobs.db"), shared=True))
+    job_ids = [client.post("/api/double", params={"x": x}).json()["id"] for x in range(2)]
+    _wait_for(lambda: all(
+        app.job_queue.job_store.load(job_id).status.value == "Finished" for job_id in job_ids
+    ))
+    response = client.post("/api/jobs", json={"job_ids": job_ids, "keep_in_memory": True}).json()
+
+    query = {"job_ids": job_ids, "keep_in_memory": True, "cursor": response["cursor"]}
+    response = client.post("/api/jobs", json=query).json()
+    assert sorted(job["id"] for job in response["jobs"]) == sorted(job_ids)
+
+
+@pytest.fixture
+def file_job_id(app, client):
+    pytest.importorskip("media_toolkit")
+    job_id = client.post("/api/file").json()["id"]
+    _wait_for(lambda: app.job_queue.is_result_available(job_id))
+    return job_id
+
+
+def test_file_result_is_downloaded_with_etag(app, client, file_job_id):
+    response = client.get(f"/api/job/{file_job_id}/result")
+    assert response.status_code == 200
+    assert response.content == _FILE_CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(_FILE_CONTENT))
+    assert response.headers["etag"] == f'"{file_job_id}-{len(_FILE_CONTENT)}"'
+    # a complete download retrieves the job
+    assert client.get(f"/api/job/{file_job_id}/result").status_code == 404
+
+
+def test_range_requests_return_partial_content(client, file_job_id):
+    size = len(_FILE_CONTENT)
+    response = client.get(f"/api/job/{file_job_id}/result", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == _FILE_CONTENT[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{size}"
+
+    response = client.get(f"/api/job/{file_job_id}/result", headers={"Range": "bytes=-5"})
+    assert response.status_code == 206
+    assert response.content == _FILE_CONTENT[-5:]
+
+    response = client.get(f"/api/job/{file_job_id}/result", headers={"Range": f"bytes={size}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{size}"
+
+    # range requests keep the job, so that interrupted downloads can be resumed
+    assert client.get(f"/api/job/{file_job_id}/result").status_code == 200
+
+
+def test_conditional_requests_use_the_etag(client, file_job_id):
+    etag = client.head(f"/api/job/{file_job_id}/result", params={"keep_in_memory": True}).headers["etag"]
+    response = client.get(
+        f"/api/job/{file_job_id}/result", params={"keep_in_memory": True}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    # a Range with an outdated If-Range validator returns the whole file
+    response = client.get(
+        f"/api/job/{file_job_id}/result", headers={"Range": "bytes=0-9", "If-Range": '"outdated"'}
+    )
+    assert response.status_code == 200
+    assert response.content == _FILE_CONTENT
+
+
+def test_jobs_without_file_result_are_not_downloaded(app, client):
+    job_id = _finished_job_ids(app, client, 1)[0]
+    assert client.get(f"/api/job/{job_id}/result").status_code == 409
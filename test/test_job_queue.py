@@ -0,0 +1,326 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from fast_task_api.CONSTS import FTAPI_EXECUTORS
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.job.InternalJob import InternalJob, JOB_STATUS
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def echo(value):
+    return value
+
+
+def test_failed_submit_keeps_jobs_queued():
+    job_queue = JobQueue.__wrapped__()
+    job_queue.register_function(echo)
+
+    def fail(*args):
+        raise RuntimeError("cannot schedule new futures after interpreter shutdown")
+
+    submit = job_queue._executor.submit
+    job_queue._executor.submit = fail
+    job = job_queue.add_job(echo, {"value": 1})
+    assert job.status == JOB_STATUS.QUEUED
+    assert job_queue._queued_per_function["echo"] == 1
+    assert sum(job_queue._running_per_executor.values()) == 0
+    assert job.id not in job_queue.in_progress
+
+    job_queue._executor.submit = submit
+    with job_queue._lock:
+        job_queue._dispatch_queued_jobs()
+    _wait_for(lambda: job.status == JOB_STATUS.FINISHED)
+    assert job.result == 1
+
+
+def test_workers_are_daemon_threads():
+    job_queue = JobQueue.__wrapped__()
+    job_queue.register_function(echo)
+    job = job_queue.add_job(echo, {"value": 1})
+    _wait_for(lambda: job.status == JOB_STATUS.FINISHED)
+    workers = [thread for thread in threading.enumerate() if thread.name.startswith("fast_task_api_worker")]
+    assert workers and all(thread.daemon for thread in workers)
+
+
+def _running_job(job_queue: JobQueue, executor: FTAPI_EXECUTORS, status: JOB_STATUS) -> InternalJob:
+    job = InternalJob(job_function=echo, job_params={"value": 1}, timeout=1)
+    job.status = status
+    job.time_out_at = datetime.utcnow() - timedelta(seconds=1)
+    job_queue.in_progress[job.id] = {"future": None, "job": job, "executor": executor}
+    return job
+
+
+def test_process_job_times_out_with_message():
+    job_queue = JobQueue.__wrapped__()
+    job = _running_job(job_queue, FTAPI_EXECUTORS.PROCESS, JOB_STATUS.PROCESSING)
+    with job_queue._lock:
+        job_queue._check_timeouts()
+    assert job.status == JOB_STATUS.TIMEOUT
+    assert "timeout" in job.job_progress._message
+    assert job.execution_finished_at is not None
+
+    # the result arrives after the deadline
+    job_queue._finish_job(job, result=2)
+    assert job.status == JOB_STATUS.TIMEOUT
+    assert job.result is None
+
+
+def test_finished_job_does_not_time_out():
+    job_queue = JobQueue.__wrapped__()
+    job = _running_job(job_queue, FTAPI_EXECUTORS.PROCESS, JOB_STATUS.PROCESSING)
+    job_queue._finish_job(job, result=2)
+    with job_queue._lock:
+        job_queue._check_timeouts()
+    assert job.status == JOB_STATUS.FINISHED
+    assert job.result == 2
+
+
+def test_max_concurrency_limits_running_jobs():
+    job_queue = JobQueue.__wrapped__()
+    release = threading.Event()
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def limited(value):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        release.wait(5)
+        with lock:
+            running["now"] -= 1
+        return value
+
+    job_queue.set_max_concurrency(limited, 2)
+    job_queue.set_queue_size(limited, 10)
+    job_queue.register_function(limited)
+    jobs = [job_queue.add_job(limited, {"value": i}) for i in range(6)]
+
+    _wait_for(lambda: running["now"] == 2)
+    time.sleep(0.1)
+    assert running["now"] == 2
+    assert sum(job.status == JOB_STATUS.QUEUED for job in jobs) == 4
+
+    release.set()
+    _wait_for(lambda: all(job.status == JOB_STATUS.FINISHED for job in jobs))
+    assert running["peak"] == 2
+    assert [job.result for job in jobs] == list(range(6))
+
+
+def test_max_concurrency_leaves_workers_to_other_functions():
+    job_queue = JobQueue.__wrapped__()
+    release = threading.Event()
+
+    def blocking(value):
+        release.wait(5)
+        return value
+
+    job_queue.set_max_concurrency(blocking, 1)
+    job_queue.set_queue_size(blocking, 10)
+    job_queue.register_function(blocking)
+    job_queue.register_function(echo)
+    blocked = [job_queue.add_job(blocking, {"value": i}) for i in range(3)]
+    job = job_queue.add_job(echo, {"value": 1})
+
+    _wait_for(lambda: job.status == JOB_STATUS.FINISHED)
+    assert [job.status for job in blocked].count(JOB_STATUS.PROCESSING) == 1
+    release.set()
+    _wait_for(lambda: all(job.status == JOB_STATUS.FINISHED for job in blocked))
+
+
+def _serial_job_queue(order: list, *function_names: str):
+    """
+    A paused job queue with a single worker and functions which record the order of their execution.
+    """
+    job_queue = JobQueue.__wrapped__()
+    job_queue.max_workers = 1
+    job_queue.pause()
+    functions = {}
+    for name in function_names:
+        def record(value, name=name):
+            order.append(name)
+            return value
+        record.__name__ = name
+        job_queue.set_queue_size(record, 100)
+        job_queue.register_function(record)
+        functions[name] = record
+    return job_queue, functions
+
+
+def test_higher_priority_classes_start_first():
+    order = []
+    job_queue, functions = _serial_job_queue(order, "low", "normal", "high")
+    job_queue.set_priority(functions["low"], "low")
+    job_queue.set_priority(functions["high"], "high")
+    jobs = [job_queue.add_job(functions[name], {"value": 1}) for name in ("low", "normal", "high", "low", "high")]
+
+    job_queue.resume()
+    _wait_for(lambda: all(job.status == JOB_STATUS.FINISHED for job in jobs))
+    assert order == ["high", "high", "normal", "low", "low"]
+
+
+def test_weights_share_the_workers_within_a_priority_class():
+    order = []
+    job_queue, functions = _serial_job_queue(order, "heavy", "light")
+    job_queue.set_priority(functions["heavy"], weight=2)
+    jobs = [job_queue.add_job(functions[name], {"value": 1}) for name in ("heavy", "light") for _ in range(6)]
+
+    job_queue.resume()
+    _wait_for(lambda: all(job.status == JOB_STATUS.FINISHED for job in jobs))
+    # while both functions have queued jobs, heavy gets twice as many started
+    assert order[:6].count("heavy") == 4
+    assert order[:6].count("light") == 2
+
+
+def _batched_job_queue(batch_function, batch_size: int = 4) -> JobQueue:
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_batching(batch_function, batch_size, max_batch_wait_ms=10)
+    job_queue.set_queue_size(batch_function, 100)
+    job_queue.register_function(batch_function)
+    return job_queue
+
+
+def _finished(jobs: list) -> bool:
+    return all(job.status not in (JOB_STATUS.QUEUED, JOB_STATUS.PROCESSING) for job in jobs)
+
+
+def test_batches_are_executed_with_one_call():
+    calls = []
+
+    def double(value: list):
+        calls.append(len(value))
+        return [v * 2 for v in value]
+
+    job_queue = _batched_job_queue(double)
+    job_queue.pause()
+    jobs = job_queue.add_jobs(double, [{"value": i} for i in range(8)])
+    job_queue.resume()
+    _wait_for(lambda: _finished(jobs))
+    assert calls == [4, 4]
+    assert [job.result for job in jobs] == [i * 2 for i in range(8)]
+
+
+def test_returned_exception_fails_only_its_job():
+    def invert(value: list):
+        return [ValueError("zero") if v == 0 else 1 / v for v in value]
+
+    job_queue = _batched_job_queue(invert)
+    jobs = job_queue.add_jobs(invert, [{"value": v} for v in (1, 0, 2)])
+    _wait_for(lambda: _finished(jobs))
+    assert [job.status for job in jobs] == [JOB_STATUS.FINISHED, JOB_STATUS.FAILED, JOB_STATUS.FINISHED]
+    assert jobs[1].job_progress._message == "zero"
+    assert jobs[2].result == 0.5
+
+
+def test_raised_exception_fails_the_whole_batch():
+    def broken(value: list):
+        raise RuntimeError("batch failed")
+
+    job_queue = _batched_job_queue(broken)
+    jobs = job_queue.add_jobs(broken, [{"value": v} for v in range(3)])
+    _wait_for(lambda: _finished(jobs))
+    assert all(job.status == JOB_STATUS.FAILED for job in jobs)
+    assert all(job.job_progress._message == "batch failed" for job in jobs)
+
+
+def test_wrong_number_of_results_fails_the_whole_batch():
+    def too_few(value: list):
+        return value[:-1]
+
+    job_queue = _batched_job_queue(too_few)
+    jobs = job_queue.add_jobs(too_few, [{"value": v} for v in range(3)])
+    _wait_for(lambda: _finished(jobs))
+    assert all(job.status == JOB_STATUS.FAILED for job in jobs)
+    assert "one result per job" in jobs[0].job_progress._message
+
+
+def _cached_job_queue(function) -> JobQueue:
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_cache(function, True, ttl=60)
+    job_queue.set_queue_size(function, 10)
+    job_queue.register_function(function)
+    return job_queue
+
+
+def test_equal_running_job_is_deduplicated():
+    calls = []
+    release = threading.Event()
+
+    def square(value):
+        calls.append(value)
+        release.wait(5)
+        return value * value
+
+    job_queue = _cached_job_queue(square)
+    leader = job_queue.add_job(square, {"value": 3})
+    follower = job_queue.add_job(square, {"value": 3})
+    other = job_queue.add_job(square, {"value": 4})
+    release.set()
+    _wait_for(lambda: _finished([leader, follower, other]))
+    assert sorted(calls) == [3, 4]
+    assert follower.status == JOB_STATUS.FINISHED
+    assert follower.result == leader.result == 9
+    assert job_queue.caches["square"].deduplicated == 1
+
+
+def test_cached_result_finishes_the_job_right_away():
+    calls = []
+
+    def square(value):
+        calls.append(value)
+        return value * value
+
+    job_queue = _cached_job_queue(square)
+    job = job_queue.add_job(square, {"value": 3})
+    _wait_for(lambda: job_queue.is_result_available(job.id))
+
+    cached = job_queue.add_job(square, {"value": 3})
+    assert cached.status == JOB_STATUS.FINISHED
+    assert cached.result == 9
+    assert calls == [3]
+    assert job_queue.caches["square"].hits == 1
+
+
+def test_failed_jobs_are_not_cached():
+    calls = []
+
+    def fail(value):
+        calls.append(value)
+        raise ValueError("failed")
+
+    job_queue = _cached_job_queue(fail)
+    job = job_queue.add_job(fail, {"value": 1})
+    _wait_for(lambda: job_queue.is_result_available(job.id))
+    retry = job_queue.add_job(fail, {"value": 1})
+    _wait_for(lambda: job_queue.is_result_available(retry.id))
+    assert calls == [1, 1]
+
+
+def test_jobs_are_looked_up_and_removed_after_retrieval():
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_queue_size(echo, 1000)
+    job_queue.register_function(echo)
+    jobs = []
+
+    def submit():
+        jobs.extend(job_queue.add_job(echo, {"value": i}) for i in range(100))
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _wait_for(lambda: all(job_queue.is_result_available(job.id) for job in jobs))
+
+    for job in jobs:
+        assert job_queue.get_job(job.id, keep_in_memory=True) is job
+        assert job_queue.get_job(job.id) is job
+        assert job_queue.get_job(job.id) is None
+    assert job_queue.jobs == {}
+    assert job_queue.get_job("unknown") is None
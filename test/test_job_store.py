@@ -0,0 +1,231 @@
+import base64
+import threading
+import time
+
+import pytest
+
+from fast_task_api.compatibility.upload import media_from_upload, _temp_file_path
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.job.InternalJob import InternalJob, JOB_STATUS
+from fast_task_api.core.job_store.InMemoryJobStore import InMemoryJobStore
+from fast_task_api.core.job_store.SQLiteJobStore import SQLiteJobStore
+
+
+def echo(value):
+    return value
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def _close_job_store(job_queue: JobQueue):
+    # the claim thread stops when the job store is not shared anymore
+    job_store = job_queue.job_store
+    job_queue.set_job_store(InMemoryJobStore())
+    job_store.close()
+
+
+def test_file_backed_media_file_is_persisted(db_path):
+    media_toolkit = pytest.importorskip("media_toolkit")
+    content = bytes(range(256)) * 64
+    media_file = media_from_upload(base64.b64encode(content).decode(), media_toolkit.MediaFile, spool_threshold=1)
+    if _temp_file_path(media_file) is None:
+        pytest.skip("the installed media-toolkit version has no file-backed media files")
+
+    store = SQLiteJobStore(db_path)
+    job = InternalJob(job_function=echo, job_params={"value": media_file})
+    store.save(job)
+    store.close()
+
+    store = SQLiteJobStore(db_path)
+    [loaded] = store.load_unfinished()
+    store.close()
+    assert loaded.id == job.id
+    assert loaded.job_params["value"].to_bytes() == content
+    assert loaded.job_params["value"].file_name == media_file.file_name
+
+
+def test_enqueue_rejects_unpicklable_jobs(db_path):
+    store = SQLiteJobStore(db_path, shared=True)
+    jobs = [InternalJob(job_function=echo, job_params={"value": 1}),
+            InternalJob(job_function=echo, job_params={"value": threading.Lock()})]
+    with pytest.raises(ValueError):
+        store.enqueue(jobs, max_queued=10)
+    assert store.load(jobs[0].id) is None
+    assert store.enqueue([], max_queued=0)
+    store.close()
+
+
+def test_unpicklable_job_fails_in_shared_store(db_path):
+    job_queue = JobQueue.__wrapped__()
+    job_queue.register_function(echo)
+    job_queue.set_queue_size(echo, 10)
+    job_queue.set_job_store(SQLiteJobStore(db_path, shared=True))
+    try:
+        job = job_queue.add_job(echo, {"value": threading.Lock()})
+        assert job.status == JOB_STATUS.FAILED
+        stored = job_queue.job_store.load(job.id)
+        assert stored.status == JOB_STATUS.FAILED
+        assert "not picklable" in stored.result
+    finally:
+        _close_job_store(job_queue)
+
+
+def test_job_without_persisted_params_fails_on_resume(db_path):
+    store = SQLiteJobStore(db_path)
+    job = InternalJob(job_function=echo, job_params={"value": threading.Lock()})
+    store.save(job)
+    store.close()
+
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_job_store(SQLiteJobStore(db_path))
+    try:
+        job_queue.register_function(echo)
+        resumed = job_queue.jobs[job.id]
+        assert resumed.status == JOB_STATUS.FAILED
+        assert job_queue.job_store.load(job.id).status == JOB_STATUS.FAILED
+    finally:
+        _close_job_store(job_queue)
+
+
+def test_loaded_job_keeps_its_change_seq(db_path):
+    store = SQLiteJobStore(db_path)
+    job = InternalJob(job_function=echo, job_params={"value": 1})
+    store.save(job)
+    store.flush()
+    assert store.load(job.id).change_seq == job.change_seq
+    store.close()
+
+    store = SQLiteJobStore(db_path)
+    assert store.load(job.id).change_seq == job.change_seq
+    store.close()
+
+
+def test_temporary_database_is_deleted_on_close(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = SQLiteJobStore(path, shared=True, delete_on_close=True)
+    store.save(InternalJob(job_function=echo, job_params={"value": 1}))
+    store.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_unfinished_jobs_are_resumed(db_path):
+    store = SQLiteJobStore(db_path)
+    queued = InternalJob(job_function=echo, job_params={"value": 1})
+    processing = InternalJob(job_function=echo, job_params={"value": 2})
+    # the server stopped while the job was processing
+    processing.status = JOB_STATUS.PROCESSING
+    store.save(queued)
+    store.save(processing)
+    store.close()
+
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_job_store(SQLiteJobStore(db_path))
+    try:
+        job_queue.set_queue_size(echo, 10)
+        job_queue.register_function(echo)
+        _wait_for(lambda: job_queue.is_result_available(queued.id) and job_queue.is_result_available(processing.id))
+        assert job_queue.jobs[queued.id].result == 1
+        assert job_queue.jobs[processing.id].result == 2
+        job_queue.job_store.flush()
+        assert job_queue.job_store.load(queued.id).status == JOB_STATUS.FINISHED
+    finally:
+        _close_job_store(job_queue)
+
+
+def test_finished_jobs_are_loaded_after_a_restart(db_path):
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_job_store(SQLiteJobStore(db_path))
+    job_queue.register_function(echo)
+    job = job_queue.add_job(echo, {"value": 3})
+    _wait_for(lambda: job_queue.is_result_available(job.id))
+    _close_job_store(job_queue)
+
+    job_queue = JobQueue.__wrapped__()
+    job_queue.set_job_store(SQLiteJobStore(db_path))
+    try:
+        loaded = job_queue.get_job(job.id)
+        assert loaded.status == JOB_STATUS.FINISHED
+        assert loaded.result == 3
+        # retrieving the result removes the job like for jobs in memory
+        job_queue.job_store.flush()
+        assert job_queue.job_store.load(job.id) is None
+    finally:
+        _close_job_store(job_queue)
+
+
+def test_each_job_is_claimed_once(db_path):
+    stores = [SQLiteJobStore(db_path, shared=True) for _ in range(4)]
+    jobs = [InternalJob(job_function=echo, job_params={"value": i}) for i in range(40)]
+    assert stores[0].enqueue(jobs, max_queued=40)
+
+    claimed = []
+
+    def claim_all(store, worker_id):
+        while True:
+            batch = store.claim(["echo"], 3, worker_id)
+            if not batch:
+                return
+            claimed.extend(job.id for job in batch)
+
+    threads = [threading.Thread(target=claim_all, args=(store, f"worker{i}")) for i, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for store in stores:
+        store.close()
+    assert sorted(claimed) == sorted(job.id for job in jobs)
+
+
+def test_enqueue_counts_the_jobs_of_all_processes(db_path):
+    first, second = SQLiteJobStore(db_path, shared=True), SQLiteJobStore(db_path, shared=True)
+    assert first.enqueue([InternalJob(job_function=echo, job_params={"value": i}) for i in range(3)], max_queued=4)
+    assert not second.enqueue([InternalJob(job_function=echo, job_params={"value": i}) for i in range(2)], max_queued=4)
+    assert second.enqueue([InternalJob(job_function=echo, job_params={"value": 1})], max_queued=4)
+    first.close()
+    second.close()
+
+
+def test_jobs_of_a_dead_worker_are_queued_again(db_path):
+    dead = SQLiteJobStore(db_path, shared=True, worker_timeout=0.2)
+    alive = SQLiteJobStore(db_path, shared=True, worker_timeout=0.2)
+    job = InternalJob(job_function=echo, job_params={"value": 1})
+    dead.enqueue([job], max_queued=1)
+    assert [claimed.id for claimed in dead.claim(["echo"], 1, "dead")] == [job.id]
+    assert alive.claim(["echo"], 1, "alive") == []
+
+    # the dead worker stops sending heartbeats
+    time.sleep(0.3)
+    alive._last_heartbeat = 0
+    # the heartbeat of the alive worker queues the job again. It is claimed with the same or the next call.
+    reclaimed = alive.claim(["echo"], 1, "alive") + alive.claim(["echo"], 1, "alive")
+    assert [claimed.id for claimed in reclaimed] == [job.id]
+    dead.close()
+    alive.close()
+
+
+def test_jobs_are_executed_by_another_process(db_path):
+    submitter = JobQueue.__wrapped__()
+    submitter.set_job_store(SQLiteJobStore(db_path, shared=True))
+    submitter.set_queue_size(echo, 10)
+    executor = JobQueue.__wrapped__()
+    executor.set_job_store(SQLiteJobStore(db_path, shared=True))
+    executor.register_function(echo)
+    try:
+        # the submitter can't execute the jobs. Its function is not registered.
+        job = submitter.add_job(echo, {"value": 5})
+        _wait_for(lambda: submitter.job_store.load(job.id).status == JOB_STATUS.FINISHED)
+        assert submitter.get_job(job.id).result == 5
+    finally:
+        _close_job_store(submitter)
+        _close_job_store(executor)
@@ -0,0 +1,60 @@
+import time
+
+from fast_task_api.core.JobManager import JobQueue
+from fast_task_api.core.ResultRetention import ResultRetention
+
+
+def test_max_results_evicts_least_recently_used():
+    retention = ResultRetention(ttl=None, max_results=2, memory_budget=None)
+    retention.add("a", 1)
+    retention.add("b", 2)
+    retention.touch("a")
+    retention.add("c", 3)
+    assert retention.evict() == ["b"]
+    assert "a" in retention and "c" in retention
+    assert retention.eviction_reason("b") == "max_results"
+
+
+def test_memory_budget_evicts_until_results_fit():
+    retention = ResultRetention(ttl=None, max_results=None, memory_budget=2500)
+    for job_id in ("a", "b", "c"):
+        retention.add(job_id, b"x" * 1000)
+    assert retention.evict() == ["a"]
+    assert retention.stored_bytes <= 2500
+    assert retention.eviction_reason("a") == "memory_budget"
+
+
+def test_ttl_evicts_expired_results():
+    retention = ResultRetention(ttl=0.05, max_results=None, memory_budget=None)
+    retention.add("a", 1)
+    assert retention.evict() == []
+    assert 0 < retention.seconds_until_next_expiry() <= 0.05
+    time.sleep(0.06)
+    assert retention.evict() == ["a"]
+    assert retention.eviction_reason("a") == "ttl"
+    assert retention.seconds_until_next_expiry() is None
+
+
+def test_evicted_jobs_are_reported_by_the_job_queue():
+    job_queue = JobQueue.__wrapped__()
+    job_queue.result_retention = ResultRetention(ttl=None, max_results=1, memory_budget=None)
+
+    def echo(value):
+        return value
+
+    job_queue.set_queue_size(echo, 10)
+    job_queue.register_function(echo)
+    first = job_queue.add_job(echo, {"value": 1})
+    deadline = time.monotonic() + 5
+    while not job_queue.is_result_available(first.id):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    second = job_queue.add_job(echo, {"value": 2})
+    while not job_queue.is_result_available(second.id):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    assert job_queue.get_job(first.id) is None
+    assert job_queue.get_eviction_reason(first.id) == "max_results"
+    assert job_queue.get_job(second.id).result == 2
+    assert job_queue.get_eviction_reason(second.id) == "retrieved"
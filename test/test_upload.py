@@ -0,0 +1,39 @@
+import base64
+
+import pytest
+
+from fast_task_api.compatibility import upload
+from fast_task_api.compatibility.upload import (media_from_upload, media_file_size, iter_media_file_chunks,
+                                                _temp_file_path)
+
+media_toolkit = pytest.importorskip("media_toolkit")
+
+_CONTENT = bytes(range(256)) * 1024
+
+
+@pytest.fixture
+def file_backed_check(monkeypatch):
+    # the check is cached for the process. Each test decides it anew.
+    monkeypatch.setattr(upload, "_file_backed_supported", None)
+    return monkeypatch
+
+
+def test_tested_media_toolkit_versions_spool_uploads(file_backed_check):
+    tested_from, tested_to = upload._FILE_BACKED_MEDIA_TOOLKIT_VERSIONS
+    if not tested_from <= upload._media_toolkit_version() < tested_to:
+        pytest.skip("the installed media-toolkit version is not tested with file-backed media files")
+
+    media_file = media_from_upload(base64.b64encode(_CONTENT).decode(), media_toolkit.MediaFile, spool_threshold=1)
+    assert _temp_file_path(media_file) is not None
+    assert media_file_size(media_file) == len(_CONTENT)
+    assert b"".join(iter_media_file_chunks(media_file, chunk_size=1000)) == _CONTENT
+    assert b"".join(iter_media_file_chunks(media_file, start=10, end=20)) == _CONTENT[10:20]
+    assert media_file.to_bytes() == _CONTENT
+
+
+def test_untested_media_toolkit_versions_read_uploads_into_memory(file_backed_check):
+    file_backed_check.setattr(upload, "_media_toolkit_version", lambda: (0, 3, 0))
+
+    media_file = media_from_upload(base64.b64encode(_CONTENT).decode(), media_toolkit.MediaFile, spool_threshold=1)
+    assert _temp_file_path(media_file) is None
+    assert media_file.to_bytes() == _CONTENT